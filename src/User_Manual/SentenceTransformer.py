@@ -691,7 +691,7 @@ class SentenceTransformer(nn.Sequential, FitMixin):
         return self._similarity_pairwise
 
     def start_multi_process_pool(
-        self, target_devices: List[str] = None
+        self, target_devices: List[str] = None, threads_per_process: Optional[int] = None
     ) -> Dict[Literal["input", "output", "processes"], Any]:
         """
         Starts a multi-process pool to process the encoding with several independent processes
@@ -706,6 +706,8 @@ class SentenceTransformer(nn.Sequential, FitMixin):
                 ["npu:0", "npu:1", ...], or ["cpu", "cpu", "cpu", "cpu"]. If target_devices is None and CUDA/NPU
                 is available, then all available CUDA/NPU devices will be used. If target_devices is None and
                 CUDA/NPU is not available, then 4 CPU devices will be used.
+            threads_per_process (int, optional): Number of torch intra-op threads each worker process uses. Pinning
+                this keeps CPU workers from oversubscribing the cores. Defaults to None (torch default).
 
         Returns:
             Dict[str, Any]: A dictionary with the target processes, an input queue, and an output queue.
@@ -731,7 +733,7 @@ class SentenceTransformer(nn.Sequential, FitMixin):
         for device_id in target_devices:
             p = ctx.Process(
                 target=SentenceTransformer._encode_multi_process_worker,
-                args=(device_id, self, input_queue, output_queue),
+                args=(device_id, self, input_queue, output_queue, threads_per_process),
                 daemon=True,
             )
             p.start()
@@ -852,11 +854,18 @@ class SentenceTransformer(nn.Sequential, FitMixin):
 
     @staticmethod
     def _encode_multi_process_worker(
-        target_device: str, model: "SentenceTransformer", input_queue: Queue, results_queue: Queue
+        target_device: str,
+        model: "SentenceTransformer",
+        input_queue: Queue,
+        results_queue: Queue,
+        threads_per_process: Optional[int] = None,
     ) -> None:
         """
         Internal working process to encode sentences in multi-process setup
         """
+        if threads_per_process:
+            torch.set_num_threads(threads_per_process)
+
         while True:
             try:
                 chunk_id, batch_size, sentences, prompt_name, prompt, precision, normalize_embeddings = (
@@ -7,6 +7,7 @@ from typing import (
     Any,
     Iterable,
     Iterator,
+    List,
     Mapping,
     Optional,
     Sequence,
@@ -215,6 +216,20 @@ class PDFMinerParser(BaseBlobParser):
         return extract_from_images_with_rapidocr(images)
 
 
+def _extract_page_range(
+    source: Union[str, bytes], start: int, stop: int, text_kwargs: Mapping[str, Any]
+) -> List[str]:
+    """Extract the text of pages ``start`` to ``stop`` (exclusive) in a worker process."""
+    import fitz
+
+    if isinstance(source, bytes):
+        doc = fitz.open(stream=source, filetype="pdf")
+    else:
+        doc = fitz.open(source)
+    with doc:
+        return [doc[i].get_text(**text_kwargs) for i in range(start, stop)]
+
+
 class PyMuPDFParser(BaseBlobParser):
     """Parse `PDF` using `PyMuPDF`."""
 
@@ -227,24 +242,57 @@ class PyMuPDFParser(BaseBlobParser):
 
         Args:
             text_kwargs: Keyword arguments to pass to ``fitz.Page.get_text()``.
+                ``page_workers`` and ``pages_per_worker`` are removed from it and
+                control parallel extraction: PDFs with more than
+                ``pages_per_worker`` pages are split into page ranges that are
+                extracted by up to ``page_workers`` processes.
         """
-        self.text_kwargs = text_kwargs or {}
+        self.text_kwargs = dict(text_kwargs or {})
+        self.page_workers = int(self.text_kwargs.pop("page_workers", 1) or 1)
+        self.pages_per_worker = max(1, int(self.text_kwargs.pop("pages_per_worker", 250) or 250))
         self.extract_images = extract_images
 
+    def _extract_pages(self, blob: Blob, doc: fitz.fitz.Document) -> List[str]:
+        """Extract the text of every page, in page ranges across processes for large PDFs."""
+        total_pages = len(doc)
+        if self.page_workers <= 1 or total_pages <= self.pages_per_worker:
+            return [page.get_text(**self.text_kwargs) for page in doc]
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        source = str(blob.path) if blob.path else blob.as_bytes()
+        ranges = [
+            (start, min(start + self.pages_per_worker, total_pages))
+            for start in range(0, total_pages, self.pages_per_worker)
+        ]
+        with ProcessPoolExecutor(min(self.page_workers, len(ranges))) as executor:
+            futures = [
+                executor.submit(_extract_page_range, source, start, stop, self.text_kwargs)
+                for start, stop in ranges
+            ]
+            return [text for future in futures for text in future.result()]
+
     def lazy_parse(self, blob: Blob) -> Iterator[Document]:
         """Lazily parse the blob."""
         import fitz
 
         with blob.as_bytes_io() as file_path:
             doc = fitz.open(file_path)  # open document
-            text = ""
-            for page in doc:
-                text += page.get_text(**self.text_kwargs) + "\n"  # Concatenate text from all pages
+            page_texts = [text + "\n" for text in self._extract_pages(blob, doc)]
+            text = "".join(page_texts)  # Concatenate text from all pages
+
+            # character offset where each page starts, used to give chunks a page number
+            page_starts = []
+            offset = 0
+            for page_text in page_texts:
+                page_starts.append(offset)
+                offset += len(page_text)
 
             metadata = {
                 "source": blob.source,
                 "file_path": blob.source,
                 "total_pages": len(doc),
+                "page_starts": page_starts,
             }
             yield Document(page_content=text, metadata=metadata)
 
@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def make_chat(query_engine, kobold_config):
+    from chat_kobold import KoboldChat
+
+    class BenchmarkKoboldChat(KoboldChat):
+        '''
+        KoboldChat searching the benchmark database with an in-memory kobold config, timing the retrieval on its own.
+        '''
+        def __init__(self):
+            super().__init__()
+            self.retrieval_seconds = 0.0
+
+        def retrieve(self, query, selected_databases):
+            start_time = time.perf_counter()
+            contexts, metadata_list = query_engine.search(query)
+            self.retrieval_seconds = time.perf_counter() - start_time
+            return contexts, metadata_list
+
+        def load_kobold_config(self):
+            return kobold_config
+
+    return BenchmarkKoboldChat()
+
+
+def make_receiver():
+    from PySide6.QtCore import QEventLoop, QObject, Slot
+
+    class ResponseReceiver(QObject):
+        '''
+        records when the chat's signals arrive on the main thread, where the Query tab receives them.
+        '''
+        def __init__(self):
+            super().__init__()
+            self.loop = QEventLoop()
+            self.reset()
+
+        def reset(self):
+            self.start_time = time.perf_counter()
+            self.first_update_time = None
+            self.finished_time = None
+            self.updates = 0
+            self.chars = 0
+            self.stats = None
+            self.error = None
+
+        @Slot(str)
+        def on_response(self, text):
+            if self.first_update_time is None:
+                self.first_update_time = time.perf_counter()
+            self.updates += 1
+            self.chars += len(text)
+
+        @Slot(dict)
+        def on_stats(self, stats):
+            self.stats = stats
+
+        @Slot(str)
+        def on_error(self, error):
+            self.error = error
+
+        @Slot()
+        def on_finished(self):
+            self.finished_time = time.perf_counter()
+            self.loop.quit()
+
+    return ResponseReceiver()
+
+
+def ask_questions(chat, receiver, queries, warmup, conversation=None):
+    chat.signals.response_signal.connect(receiver.on_response)
+    chat.signals.stats_signal.connect(receiver.on_stats)
+    chat.signals.error_signal.connect(receiver.on_error)
+    chat.signals.finished_signal.connect(receiver.on_finished)
+
+    measurements = []
+    for i, query in enumerate(queries):
+        receiver.reset()
+        chat.retrieval_seconds = 0.0
+        chat.ask_kobold(query, False, "benchmark", conversation)
+        prepare_time = time.perf_counter() - receiver.start_time
+        receiver.loop.exec()
+        chat.worker.wait()
+
+        if receiver.error is not None:
+            raise RuntimeError(f"Generation failed: {receiver.error}")
+        if i < warmup:
+            continue
+        stats = receiver.stats or {}
+        measurements.append({
+            'retrieval_ms': chat.retrieval_seconds * 1000,
+            'prompt_ms': (prepare_time - chat.retrieval_seconds) * 1000,
+            'first_update_ms': (receiver.first_update_time - receiver.start_time) * 1000 if receiver.first_update_time else None,
+            'total_ms': (receiver.finished_time - receiver.start_time) * 1000,
+            'time_to_first_token_ms': stats['time_to_first_token'] * 1000 if stats.get('time_to_first_token') is not None else None,
+            'tokens': stats.get('tokens', 0),
+            'tokens_per_second': stats.get('tokens_per_second', 0.0),
+            'prefix_reuse': stats.get('prefix_reuse', 0.0),
+            'gui_updates': receiver.updates,
+            'contexts': len(chat.metadata_list),
+            'prompt_chars': len(chat.worker.payload['prompt']),
+        })
+    return measurements
+
+
+def summarize(measurements):
+    from benchmark_utils import percentile
+
+    summary = {}
+    for key in ['retrieval_ms', 'prompt_ms', 'time_to_first_token_ms', 'first_update_ms', 'total_ms']:
+        values = [measurement[key] for measurement in measurements if measurement[key] is not None]
+        summary[key] = {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+    for key in ['tokens', 'tokens_per_second', 'gui_updates', 'contexts', 'prompt_chars', 'prefix_reuse']:
+        summary[key] = float(np.mean([measurement[key] for measurement in measurements])) if measurements else 0.0
+    return summary
+
+
+def run_benchmark(args):
+    from PySide6.QtCore import QCoreApplication
+
+    from benchmark_query import build_database, make_chunks, make_query_engine, make_queries
+    from benchmark_utils import StubEmbeddings
+    from conversation import ConversationSession
+    from mock_kobold_server import MockKoboldServer
+
+    application = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    embeddings = StubEmbeddings(args.dimensions)
+    chunks = make_chunks(args.chunks, args.chunk_words, args.seed)
+    queries = make_queries(args.queries + args.warmup, args.seed)
+    vectors = embeddings.embed_documents([doc.page_content for doc in chunks])
+
+    server = None
+    if args.url is None:
+        server = MockKoboldServer(port=0, tokens_per_second=args.tokens_per_second, prompt_delay=args.prompt_delay,
+                                  prompt_tokens_per_second=args.prompt_tokens_per_second).start()
+    work_directory = Path(tempfile.mkdtemp(prefix="vectordb_chat_benchmark_"))
+    query_engine = None
+
+    try:
+        database_directory = work_directory / "database"
+        index_parameters, _ = build_database(database_directory, chunks, vectors, embeddings, "FLAT", "none", "tiledb")
+        query_engine = make_query_engine(database_directory, embeddings, index_parameters, 16, "tiledb")
+        query_engine.config['database']['contexts'] = str(args.contexts)
+        # every query returns its contexts, so the prompts are the same size throughout
+        query_engine.config['database']['similarity'] = 4.0
+        query_engine.refresh_settings(query_engine.config)
+        # the query caches are disabled by the benchmark config, so repeated questions are searched again
+        query_engine.configure_caches(query_engine.config)
+
+        kobold_config = {
+            'api_url': args.url or server.url,
+            'max_context_length': args.max_context_length,
+            'max_length': args.max_length,
+            'stream_flush_interval': args.flush_interval,
+            'context_packing': not args.no_context_packing,
+            'stable_prompt_layout': args.stable_prompt_layout,
+        }
+        chat = make_chat(query_engine, kobold_config)
+        receiver = make_receiver()
+        # the questions are asked as follow-ups in one conversation, without writing chat_history.txt
+        conversation = ConversationSession(args.history_tokens, args.reuse_overlap, history_path=None) if args.conversation else None
+        measurements = ask_questions(chat, receiver, queries, args.warmup, conversation)
+    finally:
+        if query_engine is not None:
+            query_engine.release()
+        if server is not None:
+            server.stop()
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    summary = summarize(measurements)
+    print_summary(summary)
+    return {
+        'chunks': args.chunks,
+        'queries': args.queries,
+        'contexts': args.contexts,
+        'tokens_per_second': args.tokens_per_second,
+        'prompt_delay': args.prompt_delay,
+        'flush_interval': args.flush_interval,
+        'conversation': conversation.get_stats() if conversation is not None else None,
+        'summary': summary,
+        'measurements': measurements,
+    }
+
+
+def print_summary(summary):
+    for key in ['retrieval_ms', 'prompt_ms', 'time_to_first_token_ms', 'first_update_ms', 'total_ms']:
+        print(f"{key:<24}p50 {summary[key]['p50']:9.2f}  p95 {summary[key]['p95']:9.2f}")
+    print(f"{'tokens':<24}{summary['tokens']:.1f} at {summary['tokens_per_second']:.1f} tokens/s in {summary['gui_updates']:.1f} GUI updates")
+    print(f"{'contexts':<24}{summary['contexts']:.1f} ({summary['prompt_chars']:.0f} prompt characters, "
+          f"{summary['prefix_reuse']:.0%} of each prompt reused from the previous one)")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="End-to-end KoboldChat benchmark: retrieval, prompt building, streaming "
+                                                 "and signal delivery, against a mock koboldcpp server.")
+    parser.add_argument("--chunks", type=int, default=2000, help="number of chunks in the benchmark database")
+    parser.add_argument("--chunk-words", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2, help="questions asked before measuring starts")
+    parser.add_argument("--contexts", type=int, default=5, help="contexts retrieved per question")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="generation speed of the mock server")
+    parser.add_argument("--prompt-delay", type=float, default=0.2, help="mock prompt processing time in seconds")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=0.0,
+                        help="mock prompt processing speed, added to --prompt-delay; 0 disables")
+    parser.add_argument("--max-length", type=int, default=200, help="tokens generated per answer")
+    parser.add_argument("--max-context-length", type=int, default=4096)
+    parser.add_argument("--flush-interval", type=float, default=0.03, help="seconds streamed tokens are collected for")
+    parser.add_argument("--no-context-packing", action="store_true", help="send every retrieved context")
+    parser.add_argument("--stable-prompt-layout", action="store_true",
+                        help="keep contexts from the previous prompt in place and order new ones deterministically")
+    parser.add_argument("--conversation", action="store_true", help="ask the questions as follow-ups in one conversation")
+    parser.add_argument("--history-tokens", type=int, default=1024, help="conversation history budget")
+    parser.add_argument("--reuse-overlap", type=float, default=0.5,
+                        help="share of a follow-up's words the retrieved contexts must contain to be reused")
+    parser.add_argument("--url", default=None, help="use a running koboldcpp at this address instead of the mock server")
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="also write the results to this json file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    os.chdir(Path(__file__).resolve().parent)
+    arguments = parse_arguments()
+    benchmark_report = run_benchmark(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            json.dump(benchmark_report, output_file, indent=2)
@@ -0,0 +1,319 @@
+import argparse
+import csv
+import email.message
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+WORDS = (
+    "vector database chunk embedding model query retrieval context document page section paragraph token index "
+    "search result score metadata source file author report analysis summary method data value system process "
+    "memory storage network request response latency throughput batch worker thread pipeline stage benchmark"
+).split()
+
+
+def make_paragraphs(rng, count, words_per_paragraph=120):
+    return [" ".join(rng.choice(WORDS) for _ in range(words_per_paragraph)).capitalize() + "." for _ in range(count)]
+
+
+def write_txt(path, paragraphs):
+    path.write_text("\n\n".join(paragraphs), encoding='utf-8')
+
+
+def write_md(path, paragraphs):
+    sections = [f"## Section {i + 1}\n\n{paragraph}" for i, paragraph in enumerate(paragraphs)]
+    path.write_text("# Benchmark document\n\n" + "\n\n".join(sections), encoding='utf-8')
+
+
+def write_html(path, paragraphs):
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+    path.write_text(f"<html><head><title>Benchmark</title></head><body>{body}</body></html>", encoding='utf-8')
+
+
+def write_csv(path, paragraphs):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "text"])
+        for i, paragraph in enumerate(paragraphs):
+            writer.writerow([i, paragraph])
+
+
+def write_pdf(path, paragraphs):
+    import fitz
+
+    doc = fitz.open()
+    for paragraph in paragraphs:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), paragraph, fontsize=10)
+    doc.save(str(path))
+    doc.close()
+
+
+def write_docx(path, paragraphs):
+    from docx import Document as DocxDocument
+
+    doc = DocxDocument()
+    for paragraph in paragraphs:
+        doc.add_paragraph(paragraph)
+    doc.save(str(path))
+
+
+def write_enex(path, paragraphs):
+    content = "".join(f"<div>{paragraph}</div>" for paragraph in paragraphs)
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<!DOCTYPE en-export SYSTEM "http://xml.evernote.com/pub/evernote-export3.dtd">\n'
+        '<en-export><note><title>Benchmark</title>'
+        f'<content><![CDATA[<?xml version="1.0" encoding="UTF-8"?><en-note>{content}</en-note>]]></content>'
+        '<created>20240101T000000Z</created></note></en-export>',
+        encoding='utf-8'
+    )
+
+
+def write_eml(path, paragraphs):
+    message = email.message.EmailMessage()
+    message['From'] = "sender@example.com"
+    message['To'] = "recipient@example.com"
+    message['Subject'] = "Benchmark"
+    message.set_content("\n\n".join(paragraphs))
+    path.write_bytes(bytes(message))
+
+
+def write_xlsx(path, paragraphs):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    for i, paragraph in enumerate(paragraphs):
+        sheet.append([i, paragraph])
+    workbook.save(str(path))
+
+
+def write_rtf(path, paragraphs):
+    body = "".join(f"{paragraph}\\par\n" for paragraph in paragraphs)
+    path.write_text("{\\rtf1\\ansi\\deff0 {\\fonttbl {\\f0 Times New Roman;}}\n" + body + "}", encoding='ascii')
+
+
+def write_zip_package(path, mimetype, files):
+    with zipfile.ZipFile(path, 'w') as archive:
+        # the mimetype entry must come first and be stored uncompressed
+        archive.writestr("mimetype", mimetype, compress_type=zipfile.ZIP_STORED)
+        for name, content in files.items():
+            archive.writestr(name, content, compress_type=zipfile.ZIP_DEFLATED)
+
+
+def write_epub(path, paragraphs):
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+    write_zip_package(path, "application/epub+zip", {
+        "META-INF/container.xml": (
+            '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="content.opf" media-type="application/oebps-package+xml"/></rootfiles>'
+            '</container>'
+        ),
+        "content.opf": (
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="id">benchmark</dc:identifier>'
+            '<dc:title>Benchmark</dc:title><dc:language>en</dc:language></metadata>'
+            '<manifest><item id="chapter" href="chapter.xhtml" media-type="application/xhtml+xml"/></manifest>'
+            '<spine><itemref idref="chapter"/></spine></package>'
+        ),
+        "chapter.xhtml": (
+            '<?xml version="1.0" encoding="UTF-8"?><html xmlns="http://www.w3.org/1999/xhtml">'
+            f'<head><title>Benchmark</title></head><body>{body}</body></html>'
+        ),
+    })
+
+
+def write_odt(path, paragraphs):
+    body = "".join(f"<text:p>{paragraph}</text:p>" for paragraph in paragraphs)
+    write_zip_package(path, "application/vnd.oasis.opendocument.text", {
+        "META-INF/manifest.xml": (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">'
+            '<manifest:file-entry manifest:full-path="/" manifest:media-type="application/vnd.oasis.opendocument.text"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+            '</manifest:manifest>'
+        ),
+        "content.xml": (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+            'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2">'
+            f'<office:body><office:text>{body}</office:text></office:body></office:document-content>'
+        ),
+    })
+
+
+# .msg (Outlook compound file) and .xls (BIFF) have no writer among the installed packages, so they are reported
+# as skipped instead of being generated
+CORPUS_WRITERS = {
+    ".pdf": write_pdf,
+    ".docx": write_docx,
+    ".txt": write_txt,
+    ".enex": write_enex,
+    ".epub": write_epub,
+    ".eml": write_eml,
+    ".csv": write_csv,
+    ".xlsx": write_xlsx,
+    ".xlsm": write_xlsx,
+    ".rtf": write_rtf,
+    ".odt": write_odt,
+    ".md": write_md,
+    ".html": write_html,
+}
+
+
+def generate_corpus(directory, extensions, docs_per_type, paragraphs_per_doc, seed=0):
+    '''
+    writes docs_per_type synthetic files for every extension. the same seed always produces the same corpus.
+    '''
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    generated = {}
+    skipped = {}
+
+    for extension in extensions:
+        writer = CORPUS_WRITERS.get(extension)
+        if writer is None:
+            skipped[extension] = "no writer available for this format"
+            continue
+        try:
+            for i in range(docs_per_type):
+                writer(directory / f"benchmark_{extension[1:]}_{i:04d}{extension}", make_paragraphs(rng, paragraphs_per_doc))
+            generated[extension] = docs_per_type
+        except ImportError as e:
+            skipped[extension] = f"missing package: {e.name}"
+
+    return generated, skipped
+
+
+def build_embeddings(args):
+    from benchmark_utils import StubEmbeddings
+
+    if args.model is None:
+        return StubEmbeddings(args.dimensions)
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=args.model,
+        model_kwargs={"device": args.device, "trust_remote_code": True},
+        encode_kwargs={'normalize_embeddings': True, 'batch_size': 8}
+    )
+
+
+def run_benchmark(args):
+    from benchmark_utils import PeakMemoryMonitor, PrecomputedEmbeddings, StageTimer
+    from constants import DOCUMENT_LOADERS
+    from database_interactions import CreateVectorDB
+    from document_processor import load_documents, split_documents
+
+    extensions = args.types or list(DOCUMENT_LOADERS.keys())
+    work_directory = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="vectordb_benchmark_"))
+    corpus_directory = work_directory / "corpus"
+    database_directory = work_directory / "database"
+    timer = StageTimer()
+
+    try:
+        with timer.stage('generate'):
+            generated, skipped = generate_corpus(corpus_directory, extensions, args.docs, args.paragraphs, args.seed)
+
+        embeddings = build_embeddings(args)
+
+        with PeakMemoryMonitor() as memory:
+            with timer.stage('load'):
+                documents = load_documents(corpus_directory)
+            num_documents = len(documents)
+
+            with timer.stage('split'):
+                texts = split_documents(documents, args.chunk_size, args.chunk_overlap)
+            del documents
+
+            with timer.stage('embed'):
+                vectors = embeddings.embed_documents([doc.page_content for doc in texts])
+
+            create_vector_db = CreateVectorDB("benchmark")
+            create_vector_db.PERSIST_DIRECTORY = database_directory
+            create_vector_db.CHUNK_IDS_PATH = work_directory / "chunk_ids.json"
+            create_vector_db.SEARCH_INDEX_DIRECTORY = database_directory / "search_index"
+            create_vector_db.VECTOR_STORE_DIRECTORY = database_directory / "numpy_store"
+            create_vector_db.vector_store = args.vector_store
+            index_parameters = create_vector_db.choose_index_parameters({'database': {'index_type': args.index_type}}, len(texts))
+            precomputed = PrecomputedEmbeddings(embeddings, [doc.page_content for doc in texts], vectors)
+
+            with timer.stage('create_database'):
+                create_vector_db.create_database(texts, precomputed, index_parameters)
+
+        num_chunks = len(texts)
+        pipeline_time = sum(timer.times[stage] for stage in ('load', 'split', 'embed', 'create_database'))
+        return {
+            'documents': num_documents,
+            'chunks': num_chunks,
+            'generated': generated,
+            'skipped': skipped,
+            'embedder': args.model or f"stub ({args.dimensions} dimensions)",
+            'index_type': args.index_type,
+            'vector_store': args.vector_store,
+            'stage_seconds': timer.times,
+            'docs_per_second': num_documents / timer.times['load'] if timer.times['load'] else 0.0,
+            'chunks_per_second': num_chunks / (pipeline_time - timer.times['load']) if pipeline_time > timer.times['load'] else 0.0,
+            'end_to_end_docs_per_second': num_documents / pipeline_time if pipeline_time else 0.0,
+            'peak_rss_bytes': memory.peak_rss,
+        }
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+
+def print_report(report):
+    from benchmark_utils import format_bytes
+
+    print("\nIngestion benchmark")
+    print(f"  embedder:        {report['embedder']}")
+    print(f"  index type:      {report['index_type']}")
+    print(f"  documents:       {report['documents']}")
+    print(f"  chunks:          {report['chunks']}")
+    for extension, reason in report['skipped'].items():
+        print(f"  skipped {extension}:    {reason}")
+    print("\n  stage             seconds")
+    for stage, seconds in report['stage_seconds'].items():
+        print(f"  {stage:<16}{seconds:>9.2f}")
+    print(f"\n  docs/s (load):   {report['docs_per_second']:.1f}")
+    print(f"  chunks/s:        {report['chunks_per_second']:.1f}")
+    print(f"  docs/s (total):  {report['end_to_end_docs_per_second']:.1f}")
+    print(f"  peak RSS:        {format_bytes(report['peak_rss_bytes'])}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Headless benchmark of document loading, splitting, embedding and database creation.")
+    parser.add_argument("--docs", type=int, default=10, help="documents generated per file type")
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per document")
+    parser.add_argument("--types", nargs="+", help="file extensions to include, e.g. .pdf .docx (default: every supported type)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="defaults to the value in config.yaml")
+    parser.add_argument("--chunk-overlap", type=int, default=None, help="defaults to the value in config.yaml")
+    parser.add_argument("--index-type", default="FLAT", choices=["FLAT", "IVF_FLAT"])
+    parser.add_argument("--vector-store", default="tiledb", choices=["tiledb", "numpy"])
+    parser.add_argument("--model", default=None, help="path to a sentence-transformers model; a deterministic stub is used if omitted")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--dimensions", type=int, default=384, help="vector size of the stub embedder")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="directory for the corpus and database (kept afterwards)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary corpus and database")
+    parser.add_argument("--output", default=None, help="also write the report to this json file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    # config.yaml is read relative to the working directory
+    os.chdir(Path(__file__).resolve().parent)
+    arguments = parse_arguments()
+    start_time = time.perf_counter()
+    benchmark_report = run_benchmark(arguments)
+    benchmark_report['total_seconds'] = time.perf_counter() - start_time
+    print_report(benchmark_report)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            json.dump(benchmark_report, output_file, indent=2)
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmark_ingestion import WORDS
+
+
+def make_chunks(num_chunks, chunk_words, seed):
+    from langchain_community.docstore.document import Document
+
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(num_chunks):
+        # a new "file" every 50 chunks so chunk ids and file metadata look like a real database
+        file_number = i // 50
+        text = f"chunk {i} " + " ".join(rng.choice(WORDS) for _ in range(chunk_words))
+        chunks.append(Document(page_content=text, metadata={
+            'file_name': f"benchmark_{file_number:05d}.txt",
+            'file_path': f"benchmark_{file_number:05d}.txt",
+            'file_type': ".txt",
+            'document_type': "document",
+            'hash': f"benchmark{file_number:05d}",
+        }))
+    return chunks
+
+
+def make_queries(num_queries, seed):
+    rng = random.Random(seed + 1)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))) + f" {i}" for i in range(num_queries)]
+
+
+def exact_top_k(chunk_vectors, query_vectors, k):
+    '''
+    brute-force squared euclidean search, the metric the databases are created with.
+    '''
+    chunk_norms = np.einsum('ij,ij->i', chunk_vectors, chunk_vectors)
+    results = []
+    for query_vector in query_vectors:
+        distances = chunk_norms - 2.0 * (chunk_vectors @ query_vector) + float(query_vector @ query_vector)
+        k_nearest = min(k, len(distances))
+        nearest = np.argpartition(distances, k_nearest - 1)[:k_nearest]
+        results.append(nearest[np.argsort(distances[nearest])])
+    return results
+
+
+def build_database(database_directory, chunks, vectors, embeddings, index_type, quantization, vector_store):
+    from benchmark_utils import PrecomputedEmbeddings
+    from database_interactions import CreateVectorDB
+
+    create_vector_db = CreateVectorDB("benchmark")
+    create_vector_db.PERSIST_DIRECTORY = database_directory
+    create_vector_db.CHUNK_IDS_PATH = database_directory.parent / f"{database_directory.name}_chunk_ids.json"
+    create_vector_db.SEARCH_INDEX_DIRECTORY = database_directory / "search_index"
+    create_vector_db.VECTOR_STORE_DIRECTORY = database_directory / "numpy_store"
+    create_vector_db.quantization = quantization
+    create_vector_db.vector_store = vector_store
+    index_parameters = create_vector_db.choose_index_parameters({'database': {'index_type': index_type}}, len(chunks))
+
+    start_time = time.perf_counter()
+    create_vector_db.create_database(chunks, PrecomputedEmbeddings(embeddings, [doc.page_content for doc in chunks], vectors), index_parameters)
+    return index_parameters, time.perf_counter() - start_time
+
+
+def make_query_engine(database_directory, embeddings, index_parameters, nprobe, vector_store):
+    from database_interactions import QueryVectorDB
+
+    class BenchmarkQueryVectorDB(QueryVectorDB):
+        '''
+        QueryVectorDB over a database outside Vector_DB, using the benchmark embedder and an in-memory config.
+        '''
+        def __init__(self):
+            self.benchmark_config = {
+                'created_databases': {'benchmark': {'model': "benchmark", 'vector_store': vector_store, **index_parameters}},
+                'Compute_Device': {'database_query': "cpu"},
+                # the query caches are disabled, so every timed query does the full search
+                'database': {'contexts': '5', 'similarity': 0.9, 'search_term': '', 'document_types': '', 'nprobe': nprobe,
+                             'query_embedding_cache_size': 0, 'query_result_cache_size': 0},
+            }
+            super().__init__("benchmark")
+
+        def load_configuration(self):
+            return self.benchmark_config
+
+        def initialize_vector_model(self):
+            return embeddings
+
+        def get_persist_directory(self):
+            return database_directory
+
+    return BenchmarkQueryVectorDB()
+
+
+def replay_queries(query_engine, queries, exact_texts, k, score_threshold, warmup):
+    from benchmark_utils import percentile
+
+    query_engine.config['database']['contexts'] = str(k)
+    query_engine.config['database']['similarity'] = score_threshold
+    query_engine.refresh_settings(query_engine.config)
+    query_engine.configure_caches(query_engine.config)
+
+    # the warmup queries are not timed
+    for query in queries[:warmup]:
+        query_engine.search(query)
+    queries, exact_texts = queries[warmup:], exact_texts[warmup:]
+
+    latencies = []
+    recalls = []
+    returned = []
+    start_time = time.perf_counter()
+    for query, expected in zip(queries, exact_texts):
+        query_start = time.perf_counter()
+        contexts, _ = query_engine.search(query)
+        latencies.append(time.perf_counter() - query_start)
+        returned.append(len(contexts))
+        # recall against the unthresholded exact top-k, so it reflects both index approximation and the threshold
+        recalls.append(len(expected.intersection(contexts)) / len(expected) if expected else 1.0)
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        'k': k,
+        'score_threshold': score_threshold,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'qps': len(queries) / elapsed if elapsed else 0.0,
+        'recall_at_k': float(np.mean(recalls)) if recalls else 0.0,
+        'mean_returned': float(np.mean(returned)) if returned else 0.0,
+    }
+
+
+def run_benchmark(args):
+    from benchmark_utils import StubEmbeddings
+
+    embeddings = StubEmbeddings(args.dimensions)
+    chunks = make_chunks(args.chunks, args.chunk_words, args.seed)
+    queries = make_queries(args.queries + args.warmup, args.seed)
+
+    chunk_texts = [doc.page_content for doc in chunks]
+    vectors = embeddings.embed_documents(chunk_texts)
+    chunk_vectors = np.asarray(vectors, dtype=np.float32)
+    query_vectors = np.asarray([embeddings.embed_query(query) for query in queries], dtype=np.float32)
+
+    work_directory = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="vectordb_query_benchmark_"))
+    work_directory.mkdir(parents=True, exist_ok=True)
+    results = []
+
+    try:
+        exact_by_k = {}
+        for k in args.k:
+            exact_by_k[k] = [{chunk_texts[i] for i in nearest} for nearest in exact_top_k(chunk_vectors, query_vectors, k)]
+
+        for index_type in args.index_types:
+            for quantization in args.quantization:
+                database_directory = work_directory / f"database_{index_type.lower()}_{quantization}"
+                index_parameters, build_time = build_database(database_directory, chunks, vectors, embeddings, index_type, quantization, args.vector_store)
+                open_start = time.perf_counter()
+                query_engine = make_query_engine(database_directory, embeddings, index_parameters, args.nprobe, args.vector_store)
+                open_time = time.perf_counter() - open_start
+
+                for k in args.k:
+                    for score_threshold in args.thresholds:
+                        result = replay_queries(query_engine, queries, exact_by_k[k], k, score_threshold, args.warmup)
+                        result.update({'index_type': index_type, 'quantization': quantization, 'vector_store': args.vector_store,
+                                       'build_seconds': build_time, 'open_seconds': open_time, **index_parameters})
+                        results.append(result)
+                        print_result(result)
+
+                query_engine.release()
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    return {
+        'chunks': args.chunks,
+        'queries': args.queries,
+        'dimensions': args.dimensions,
+        'results': results,
+    }
+
+
+def print_result(result):
+    print(f"{result['index_type']:<9}{result['quantization']:<7}k={result['k']:<4}threshold={result['score_threshold']:<7}"
+          f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+          f"{result['qps']:8.1f} qps  open {result['open_seconds'] * 1000:.0f} ms  recall@k {result['recall_at_k']:.3f}  returned {result['mean_returned']:.1f}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Headless query latency and recall benchmark for QueryVectorDB.")
+    parser.add_argument("--chunks", type=int, default=10000, help="number of chunks in the benchmark database")
+    parser.add_argument("--chunk-words", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10, help="queries run before timing starts")
+    parser.add_argument("--index-types", nargs="+", default=["FLAT", "IVF_FLAT"], choices=["FLAT", "IVF_FLAT"])
+    parser.add_argument("--vector-store", default="tiledb", choices=["tiledb", "numpy"],
+                        help="numpy ignores --index-types and always searches exactly")
+    parser.add_argument("--quantization", nargs="+", default=["none"], choices=["none", "int8", "binary"],
+                        help="vector codes searched in memory; int8 and binary rescore the top candidates")
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 5, 10], help="values of 'contexts' to test")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.9, 1.5, 4.0], help="values of 'similarity' to test")
+    parser.add_argument("--nprobe", type=int, default=16, help="partitions searched by IVF_FLAT")
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="directory for the benchmark databases (kept afterwards)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary databases")
+    parser.add_argument("--output", default=None, help="also write the results to this json file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    os.chdir(Path(__file__).resolve().parent)
+    arguments = parse_arguments()
+    benchmark_report = run_benchmark(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            json.dump(benchmark_report, output_file, indent=2)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import psutil
+from langchain_core.embeddings import Embeddings
+
+
+class StubEmbeddings(Embeddings):
+    '''
+    deterministic stand-in for an embedding model. every text maps to a fixed unit vector seeded from its hash, so
+    benchmarks measure the pipeline around the model and give the same results on every run.
+    '''
+    def __init__(self, dimensions=384):
+        self.dimensions = int(dimensions)
+
+    def embed_text(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def embed_documents(self, texts):
+        return [self.embed_text(text).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_text(text).tolist()
+
+
+class PrecomputedEmbeddings(Embeddings):
+    '''
+    returns vectors computed earlier in the benchmark, so create_database can be timed without embedding again.
+    '''
+    def __init__(self, embeddings, texts, vectors):
+        self.embeddings = embeddings
+        self.vectors = dict(zip(texts, vectors))
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] if text in self.vectors else self.embeddings.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+class PeakMemoryMonitor:
+    '''
+    samples the resident memory of this process and its child processes (document loaders run in a process pool)
+    in a background thread and keeps the highest total seen.
+    '''
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.process = psutil.Process(os.getpid())
+        self.peak_rss = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        rss = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        self.sample()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        self.sample()
+
+
+class StageTimer:
+    def __init__(self):
+        self.times = {}
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start_time
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return float(np.percentile(np.asarray(values, dtype=np.float64), q))
+
+
+def format_bytes(num_bytes):
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
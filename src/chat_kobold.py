@@ -1,67 +1,153 @@
-import json
+import queue
+import threading
+import time
 from pathlib import Path
-import requests
 import logging
-import sseclient
+import yaml
 from PySide6.QtCore import QThread, Signal, QObject
+from context_packer import ContextPacker
+from conversation import TURN_SEPARATOR
 from database_interactions import QueryVectorDB
+from kobold_client import get_kobold_client
+from prompt_layout import PromptLayout
 
 ROOT_DIRECTORY = Path(__file__).resolve().parent
 contexts_output_file_path = ROOT_DIRECTORY / "contexts.txt"
 metadata_output_file_path = ROOT_DIRECTORY / "metadata.txt"
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+_DONE = object()
 
 class KoboldSignals(QObject):
     response_signal = Signal(str)
     error_signal = Signal(str)
     finished_signal = Signal()
     citation_signal = Signal(str)
+    stats_signal = Signal(dict)
+
+class TokenCoalescer:
+    '''
+    collects streamed tokens and hands them on as one string once flush_interval seconds have passed since the last
+    hand-off (or max_chars have built up), so the GUI thread receives a few updates per frame instead of one per token.
+    tokens left in the buffer when the stream pauses are handed on once time_to_flush has run out. also measures the
+    time to the first token and the generation speed.
+    '''
+    def __init__(self, flush_interval=0.03, max_chars=4096):
+        self.flush_interval = flush_interval
+        self.max_chars = max_chars
+        self.buffer = []
+        self.buffered_chars = 0
+        self.tokens = 0
+        self.start_time = time.perf_counter()
+        self.last_flush_time = self.start_time
+        self.first_token_time = None
+        self.last_token_time = None
+
+    def add(self, token):
+        # returns the text to pass on now, or None while it is still being collected
+        now = time.perf_counter()
+        if self.first_token_time is None:
+            self.first_token_time = now
+        self.last_token_time = now
+        self.tokens += 1
+        self.buffer.append(token)
+        self.buffered_chars += len(token)
+        if now - self.last_flush_time >= self.flush_interval or self.buffered_chars >= self.max_chars:
+            return self.flush()
+        return None
+
+    def time_to_flush(self):
+        # seconds until the buffered text is due, or None while there is nothing buffered
+        if not self.buffer:
+            return None
+        return max(0.0, self.last_flush_time + self.flush_interval - time.perf_counter())
+
+    def flush(self):
+        if not self.buffer:
+            return None
+        text = "".join(self.buffer)
+        self.buffer = []
+        self.buffered_chars = 0
+        self.last_flush_time = time.perf_counter()
+        return text
+
+    def get_stats(self):
+        stats = {
+            'tokens': self.tokens,
+            'time_to_first_token': None,
+            'tokens_per_second': 0.0,
+            'total_time': time.perf_counter() - self.start_time,
+        }
+        if self.first_token_time is not None:
+            stats['time_to_first_token'] = self.first_token_time - self.start_time
+            # speed over the tokens after the first, whose arrival includes the prompt processing
+            generation_time = self.last_token_time - self.first_token_time
+            if self.tokens > 1 and generation_time > 0:
+                stats['tokens_per_second'] = (self.tokens - 1) / generation_time
+        return stats
 
 class KoboldAPIWorker(QThread):
-    def __init__(self, url, payload):
+    def __init__(self, client, payload, flush_interval=0.03):
         super().__init__()
-        self.url = url
+        self.client = client
         self.payload = payload
+        self.flush_interval = flush_interval
         self.signals = KoboldSignals()
 
+    def read_tokens(self, tokens):
+        # runs in its own thread, so waiting for the next token never holds back text that is already due
+        try:
+            for token in self.client.stream_tokens(self.payload):
+                tokens.put(token)
+        except Exception as e:
+            tokens.put(e)
+        tokens.put(_DONE)
+
     def run(self):
+        coalescer = TokenCoalescer(self.flush_interval)
+        tokens = queue.Queue()
+        threading.Thread(target=self.read_tokens, args=(tokens,), daemon=True).start()
         try:
-            response = requests.post(self.url, json=self.payload, stream=True)
-            response.raise_for_status()
-            client = sseclient.SSEClient(response)
-            for event in client.events():
-                if event.event == "message":
-                    try:
-                        data = json.loads(event.data)
-                        if 'token' in data:
-                            logging.debug(f"Received token: {data['token']}")
-                            self.signals.response_signal.emit(data['token'])  # Corrected this line
-                        else:
-                            logging.warning(f"Unexpected data format: {data}")
-                    except json.JSONDecodeError:
-                        logging.error(f"Failed to parse JSON: {event.data}")
-                        self.signals.error_signal.emit(f"Failed to parse: {event.data}")  # Corrected this line
-                else:
-                    logging.info(f"Received non-message event: {event.event}")
+            while True:
+                try:
+                    token = tokens.get(timeout=coalescer.time_to_flush())
+                except queue.Empty:
+                    self.signals.response_signal.emit(coalescer.flush())
+                    continue
+                if token is _DONE:
+                    break
+                if isinstance(token, Exception):
+                    raise token
+                text = coalescer.add(token)
+                if text is not None:
+                    self.signals.response_signal.emit(text)
         except Exception as e:
             logging.error(f"Error in API request: {str(e)}")
             self.signals.error_signal.emit(str(e))  # Corrected this line
         finally:
+            text = coalescer.flush()
+            if text is not None:
+                self.signals.response_signal.emit(text)
+            self.signals.stats_signal.emit(coalescer.get_stats())
             self.signals.finished_signal.emit()
 
 class KoboldChat:
     def __init__(self):
         self.signals = KoboldSignals()
-        self.api_url = "http://localhost:5001/api/extra/generate/stream"
         self.query_vector_db = None
+        self.prefix_reuse = {}
+        self.conversation = None
+        self.response_parts = []
+        self.failed = False
 
-    def ask_kobold(self, query, chunks_only, selected_database):
+    def ask_kobold(self, query, chunks_only, selected_database, conversation=None):
+        # selected_database is one database name or a list of names to search together; conversation is a
+        # ConversationSession for follow-up questions
         logging.debug(f"ask_kobold called with query: {query}, chunks_only: {chunks_only}, selected_database: {selected_database}")
-        
-        if self.query_vector_db is None or self.query_vector_db.selected_database != selected_database:
-            logging.debug(f"Initializing QueryVectorDB with database: {selected_database}")
-            self.query_vector_db = QueryVectorDB(selected_database)
-
-        contexts, metadata_list = self.query_vector_db.search(query)
+        selected_databases = [selected_database] if isinstance(selected_database, str) else list(selected_database)
+        if conversation is not None:
+            contexts, metadata_list = conversation.retrieve(query, selected_databases, self.retrieve)
+        else:
+            contexts, metadata_list = self.retrieve(query, selected_databases)
         logging.debug(f"Retrieved {len(contexts)} contexts from vector database")
         
         if chunks_only:
@@ -70,23 +156,56 @@ class KoboldChat:
             self.signals.finished_signal.emit()
             return
 
+        kobold_config = self.load_kobold_config()
+        flush_interval = float(kobold_config.get('stream_flush_interval', 0.03))
+        max_context_length = int(kobold_config.get('max_context_length', 4096))
+        max_length = int(kobold_config.get('max_length', 512))
+        prompt_budget = max_context_length - max_length
+
         prepend_string = "Only base your answer on the provided context/contexts. If you cannot, please state so."
-        augmented_query = f"{prepend_string}\n\n---\n\n" + "\n\n---\n\n".join(contexts) + f"\n\n-----\n\n{query}"
+        history = ""
+        if conversation is not None:
+            # the history is trimmed to its share of the prompt budget first, and the contexts packed into what is left
+            history_share = min(1.0, max(0.0, float(kobold_config.get('conversation_history_share', 0.5))))
+            history = conversation.history_text(int(prompt_budget * history_share))
+
+        def build_prompt(prompt_contexts):
+            return f"{prepend_string}{CONTEXT_SEPARATOR}" + CONTEXT_SEPARATOR.join(prompt_contexts) + f"{history}{TURN_SEPARATOR}{query}"
+
+        if kobold_config.get('context_packing', True):
+            contexts, metadata_list = self.pack_contexts(contexts, metadata_list, build_prompt, prompt_budget)
+
+        client = get_kobold_client(kobold_config)
+        prompt_layout = PromptLayout.get_layout(client.api_url)
+        if kobold_config.get('stable_prompt_layout', False):
+            order = prompt_layout.arrange(contexts, metadata_list)
+            contexts, metadata_list = [contexts[i] for i in order], [metadata_list[i] for i in order]
+
+        augmented_query = build_prompt(contexts)
+        self.prefix_reuse = prompt_layout.record(augmented_query, contexts)
+        logging.info(f"Prompt starts with {self.prefix_reuse['prefix_reuse']:.0%} of the previous prompt.")
         logging.debug(f"Augmented query: {augmented_query[:100]}...") # Log first 100 characters of augmented query
 
         payload = {
             "prompt": augmented_query,
-            "max_context_length": 4096,
-            "max_length": 512,
+            "max_context_length": max_context_length,
+            "max_length": max_length,
             "temperature": 0.1,
             "top_p": 0.9,
             "rep_pen": 1.1
         }
 
+        # the finished turn is added to the conversation once the whole answer has arrived
+        self.conversation = conversation
+        self.query = query
+        self.response_parts = []
+        self.failed = False
+
         logging.debug("Creating KoboldAPIWorker")
-        self.worker = KoboldAPIWorker(self.api_url, payload)
+        self.worker = KoboldAPIWorker(client, payload, flush_interval)
         self.worker.signals.response_signal.connect(self.on_response_received)
-        self.worker.signals.error_signal.connect(self.signals.error_signal.emit)
+        self.worker.signals.stats_signal.connect(self.on_stats_received)
+        self.worker.signals.error_signal.connect(self.on_error_received)
         self.worker.signals.finished_signal.connect(self.on_response_finished)
         logging.debug("Starting Kobold API worker")
         self.worker.start()
@@ -94,9 +213,47 @@ class KoboldChat:
         self.metadata_list = metadata_list  # Store for citation use later
         logging.debug("ask_kobold method completed")
 
-    def on_response_received(self, token):
-        logging.debug(f"Response received in KoboldChat: {token}")
-        self.signals.response_signal.emit(token)
+    def retrieve(self, query, selected_databases):
+        if len(selected_databases) == 1:
+            self.query_vector_db = QueryVectorDB.get_instance(selected_databases[0])
+            contexts, metadata_list = self.query_vector_db.search(query)
+        else:
+            contexts, metadata_list = QueryVectorDB.search_databases(selected_databases, query)
+        logging.debug(f"QueryVectorDB stats: {QueryVectorDB.get_stats()}")
+        return contexts, metadata_list
+
+    @staticmethod
+    def load_kobold_config():
+        with open(ROOT_DIRECTORY / "config.yaml", 'r', encoding='utf-8') as config_file:
+            return (yaml.safe_load(config_file) or {}).get('kobold', {})
+
+    def pack_contexts(self, contexts, metadata_list, build_prompt, budget):
+        # keeps the best contexts that fit in the prompt budget; without the tokenizer every context is sent
+        try:
+            kept, token_counts = ContextPacker().pack(contexts, build_prompt, budget, CONTEXT_SEPARATOR)
+        except Exception as e:
+            logging.warning(f"Could not count prompt tokens, sending all contexts: {e}")
+            return contexts, metadata_list
+
+        if len(kept) < len(contexts):
+            logging.info(f"{len(kept)} of {len(contexts)} contexts fit in the {budget} token prompt budget.")
+        for i in kept:
+            metadata_list[i]['token_count'] = token_counts[i]
+        return [contexts[i] for i in kept], [metadata_list[i] for i in kept]
+
+    def on_response_received(self, text):
+        self.response_parts.append(text)
+        self.signals.response_signal.emit(text)
+
+    def on_error_received(self, error):
+        self.failed = True
+        self.signals.error_signal.emit(error)
+
+    def on_stats_received(self, stats):
+        if stats['time_to_first_token'] is not None:
+            logging.info(f"Generated {stats['tokens']} tokens at {stats['tokens_per_second']:.1f} tokens/s; "
+                         f"first token after {stats['time_to_first_token']:.2f}s.")
+        self.signals.stats_signal.emit({**stats, **self.prefix_reuse})
 
     def display_chunks(self, contexts, metadata_list):
         formatted_chunks = self.format_chunks(contexts, metadata_list)
@@ -105,10 +262,15 @@ class KoboldChat:
     def format_chunks(self, contexts, metadata_list):
         formatted_chunks = ""
         for i, (context, metadata) in enumerate(zip(contexts, metadata_list), 1):
-            formatted_chunks += f"---------- Context {i} | From File: {metadata.get('file_name', 'Unknown')} ----------\n\n{context}\n\n"
+            source = metadata.get('file_name', 'Unknown')
+            if 'database' in metadata:
+                source += f" | Database: {metadata['database']}"
+            formatted_chunks += f"---------- Context {i} | From File: {source} ----------\n\n{context}\n\n"
         return formatted_chunks
 
     def on_response_finished(self):
+        if self.conversation is not None and not self.failed:
+            self.conversation.add_turn(self.query, "".join(self.response_parts))
         self.signals.citation_signal.emit(self.format_citations(self.metadata_list))
         self.signals.finished_signal.emit()
 
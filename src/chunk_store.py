@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from langchain_community.docstore.document import Document
+
+OFFSET_DTYPE = np.dtype([
+    ('text_offset', '<u8'),
+    ('text_length', '<u4'),
+    ('metadata_offset', '<u8'),
+    ('metadata_length', '<u4'),
+])
+# the column files are rewritten without removed chunks once they make up this share of the rows
+COMPACT_REMOVED_RATIO = 0.25
+
+
+class ChunkStore:
+    '''
+    append-only columnar store for the chunks of one database.
+
+    texts.bin and metadata.bin hold the utf-8 text and json metadata of every chunk back to back, offsets.bin holds a
+    fixed-size record per chunk pointing into both, and files.json maps each source file's hash to its name, path and
+    chunk ranges so the name can be shown without reading any chunk.
+
+    the column files are memory-mapped on first read and stay mapped until the store is changed or closed, so reading a
+    chunk is a slice of the map rather than a file open. removing a file only drops it from files.json; once removed
+    chunks make up COMPACT_REMOVED_RATIO of the rows, close rewrites the columns without them.
+    '''
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.texts_path = self.directory / "texts.bin"
+        self.metadata_path = self.directory / "metadata.bin"
+        self.offsets_path = self.directory / "offsets.bin"
+        self.files_path = self.directory / "files.json"
+        self.files = None
+        self.offsets = None
+        self.columns = {}
+
+    def release(self):
+        # drops the memory maps, which have to be gone before the files are changed
+        self.offsets = None
+        self.columns = {}
+
+    def clear(self):
+        self.release()
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.files = {}
+
+    def load_file_index(self):
+        if self.files is None:
+            if self.files_path.exists():
+                with open(self.files_path, 'r', encoding='utf-8') as file:
+                    self.files = json.load(file)
+                # entries written before a file could have more than one range
+                for entry in self.files.values():
+                    if 'ranges' not in entry:
+                        entry['ranges'] = [[entry.pop('first_chunk'), entry.pop('chunk_count')]]
+            else:
+                self.files = {}
+        return self.files
+
+    def file_names(self):
+        return {file_hash: entry['file_name'] for file_hash, entry in self.load_file_index().items()}
+
+    def append(self, documents):
+        if not documents:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.release()
+        files = self.load_file_index()
+        first_index = len(self)
+
+        text_blobs = [doc.page_content.encode('utf-8') for doc in documents]
+        metadata_blobs = [json.dumps(doc.metadata, ensure_ascii=False, default=str).encode('utf-8') for doc in documents]
+
+        records = np.zeros(len(documents), dtype=OFFSET_DTYPE)
+        for column, blobs, path in (('text', text_blobs, self.texts_path), ('metadata', metadata_blobs, self.metadata_path)):
+            lengths = np.array([len(blob) for blob in blobs], dtype=np.uint64)
+            start = path.stat().st_size if path.exists() else 0
+            records[f'{column}_length'] = lengths
+            records[f'{column}_offset'] = start + np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.uint64)
+            with open(path, 'ab') as file:
+                file.write(b''.join(blobs))
+
+        with open(self.offsets_path, 'ab') as file:
+            file.write(records.tobytes())
+
+        # the chunks of one file need not be contiguous, so each file keeps [first chunk, chunk count] ranges in the
+        # order its chunks were appended
+        for i, doc in enumerate(documents, start=first_index):
+            file_hash = doc.metadata.get('hash', '')
+            entry = files.get(file_hash)
+            if entry is None:
+                files[file_hash] = entry = {
+                    'file_name': doc.metadata.get('file_name', 'Unknown'),
+                    'file_path': doc.metadata.get('file_path', ''),
+                    'ranges': [],
+                }
+            ranges = entry['ranges']
+            if ranges and ranges[-1][0] + ranges[-1][1] == i:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([i, 1])
+
+    def remove_files(self, file_hashes):
+        # chunk data stays in the column files until the store is compacted; removed files are no longer indexed
+        files = self.load_file_index()
+        for file_hash in file_hashes:
+            files.pop(file_hash, None)
+
+    def removed_rows(self):
+        return len(self) - sum(chunk_count for entry in self.load_file_index().values() for _, chunk_count in entry['ranges'])
+
+    def close(self):
+        if self.files is not None:
+            if self.removed_rows() > COMPACT_REMOVED_RATIO * len(self):
+                self.compact()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.files_path, 'w', encoding='utf-8') as file:
+                json.dump(self.files, file, ensure_ascii=False)
+        self.release()
+
+    def compact(self):
+        '''
+        rewrites the column files with only the chunks of files still indexed, keeping their order, and renumbers the
+        ranges to match. the chunks of one range are stored back to back, so each range is copied as one span of bytes.
+        '''
+        offsets = self.get_offsets()
+        ranges = sorted((chunk_range for entry in self.load_file_index().values() for chunk_range in entry['ranges']),
+                        key=lambda chunk_range: chunk_range[0])
+
+        temp_paths = {path: path.with_name(path.name + ".tmp") for path in (self.texts_path, self.metadata_path, self.offsets_path)}
+        row = 0
+        written = {'text': 0, 'metadata': 0}
+        with open(temp_paths[self.texts_path], 'wb') as texts_file, open(temp_paths[self.metadata_path], 'wb') as metadata_file, \
+                open(temp_paths[self.offsets_path], 'wb') as offsets_file:
+            for chunk_range in ranges:
+                first_chunk, chunk_count = chunk_range
+                records = np.array(offsets[first_chunk:first_chunk + chunk_count])
+                for column, path, file in (('text', self.texts_path, texts_file), ('metadata', self.metadata_path, metadata_file)):
+                    start = int(records[0][f'{column}_offset'])
+                    stop = int(records[-1][f'{column}_offset']) + int(records[-1][f'{column}_length'])
+                    file.write(self.get_column(path)[start:stop].tobytes())
+                    records[f'{column}_offset'] -= np.uint64(start)
+                    records[f'{column}_offset'] += np.uint64(written[column])
+                    written[column] += stop - start
+                offsets_file.write(records.tobytes())
+                chunk_range[0] = row
+                row += chunk_count
+
+        # ranges of a file that were only split by removed chunks are now adjacent
+        for entry in self.files.values():
+            merged = []
+            for first_chunk, chunk_count in entry['ranges']:
+                if merged and merged[-1][0] + merged[-1][1] == first_chunk:
+                    merged[-1][1] += chunk_count
+                else:
+                    merged.append([first_chunk, chunk_count])
+            entry['ranges'] = merged
+
+        removed = len(offsets) - row
+        offsets = None
+        self.release()
+        for path, temp_path in temp_paths.items():
+            os.replace(temp_path, path)
+        logging.info(f"Compacted the chunk store, dropping {removed} removed chunks.")
+
+    def get_offsets(self):
+        if self.offsets is None:
+            if not self.offsets_path.exists() or self.offsets_path.stat().st_size == 0:
+                return np.zeros(0, dtype=OFFSET_DTYPE)
+            self.offsets = np.memmap(self.offsets_path, dtype=OFFSET_DTYPE, mode='r')
+        return self.offsets
+
+    def __len__(self):
+        if not self.offsets_path.exists():
+            return 0
+        return self.offsets_path.stat().st_size // OFFSET_DTYPE.itemsize
+
+    def get_column(self, path):
+        column = self.columns.get(path)
+        if column is None:
+            if not path.exists() or path.stat().st_size == 0:
+                return np.zeros(0, dtype=np.uint8)
+            column = self.columns[path] = np.memmap(path, dtype=np.uint8, mode='r')
+        return column
+
+    def read_column(self, path, offset, length):
+        offset = int(offset)
+        return self.get_column(path)[offset:offset + int(length)].tobytes().decode('utf-8')
+
+    def get_text(self, index):
+        record = self.get_offsets()[index]
+        return self.read_column(self.texts_path, record['text_offset'], record['text_length'])
+
+    def get_metadata(self, index):
+        record = self.get_offsets()[index]
+        return json.loads(self.read_column(self.metadata_path, record['metadata_offset'], record['metadata_length']))
+
+    def get_document(self, index):
+        return Document(page_content=self.get_text(index), metadata=self.get_metadata(index))
+
+    def get_file_documents(self, file_hash):
+        entry = self.load_file_index().get(file_hash)
+        if entry is None:
+            return []
+        return [self.get_document(i) for first_chunk, chunk_count in entry['ranges'] for i in range(first_chunk, first_chunk + chunk_count)]
@@ -355,4 +355,26 @@ DOCUMENT_LOADERS = {
 
 CHUNKS_ONLY_TOOLTIP = "Only return relevant chunks without connecting to the LLM. Extremely useful to test the chunk size/overlap settings."
 
-DOWNLOAD_EMBEDDING_MODEL_TOOLTIP = "Remember, wait until downloading is complete!"
\ No newline at end of file
+DOWNLOAD_EMBEDDING_MODEL_TOOLTIP = "Remember, wait until downloading is complete!"
+
+UPDATE_DATABASE_TOOLTIP = "Add the chosen files to an existing database of the same name. Only new or changed files are embedded, and a changed file replaces its earlier version. Files already in the database that are not chosen are kept."
+
+REMOVE_UNCHOSEN_FILES_TOOLTIP = "When updating, also delete every file from the database that is not among the chosen files, so the database holds exactly the chosen files."
+
+INDEX_TYPES = ["FLAT", "IVF_FLAT"]
+
+INDEX_TYPE_TOOLTIP = "FLAT compares the question against every chunk. IVF_FLAT groups chunks into partitions and only searches the closest ones (set by nprobe in the query settings), which is much faster for very large databases at a small cost in accuracy."
+
+QUANTIZATION_TYPES = ["none", "int8", "binary"]
+
+QUANTIZATION_TOOLTIP = "Stores a compact copy of every vector that is searched in memory instead of the full vectors. int8 uses a quarter of the memory with almost no loss in accuracy; binary uses a thirty-second and relies more on rescoring. The closest few hundred chunks are always rescored with the full vectors kept on disk. Applies to new databases."
+
+VECTOR_STORES = ["tiledb", "numpy"]
+
+VECTOR_STORE_TOOLTIP = "tiledb keeps vectors in a TileDB index that supports IVF_FLAT. numpy keeps them in a plain memory-mapped file that is searched exactly; it opens almost instantly and its vectors are shared between processes by the operating system. Set vector_dtype to float16 in config.yaml to halve its size. Applies to new databases."
+
+SEARCH_TYPES = ["similarity", "hybrid"]
+
+SEARCH_TYPE_TOOLTIP = "similarity returns the chunks whose vectors are closest to the question. hybrid also ranks chunks by the exact words of the question (BM25) and merges both rankings, which finds case numbers, names and other exact terms that similarity alone can miss."
+
+RERANK_TOOLTIP = "Retrieves more chunks than Contexts (rerank_candidates in config.yaml) and reorders them with a cross-encoder that reads the question and each chunk together, keeping the best ones. More accurate, at the cost of a short delay (capped by rerank_time_budget). The model is downloaded the first time."
\ No newline at end of file
@@ -0,0 +1,66 @@
+import hashlib
+import threading
+from pathlib import Path
+
+from query_cache import LRUCache
+
+TOKENIZER_PATH = Path(__file__).resolve().parent / "Tokenizer" / "tokenizer.json"
+
+
+class ContextPacker:
+    '''
+    fits retrieved chunks into the part of the model's context left for the prompt, counting tokens with the bundled
+    tokenizer. chunks are taken greedily in the order given, which is best first; a chunk that does not fit is skipped
+    so a smaller one further down can still be used. token counts are cached by chunk text, so each chunk is only
+    tokenized once however often it is retrieved.
+    '''
+    _tokenizer = None
+    _token_counts = LRUCache(8192)
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_tokenizer(cls):
+        with cls._lock:
+            if cls._tokenizer is None:
+                from tokenizers import Tokenizer
+                cls._tokenizer = Tokenizer.from_file(str(TOKENIZER_PATH))
+            return cls._tokenizer
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def count_tokens(self, texts):
+        keys = [self.text_key(text) for text in texts]
+        counts = [self._token_counts.get(key) for key in keys]
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            encodings = self.get_tokenizer().encode_batch([texts[i] for i in missing], add_special_tokens=False)
+            for i, encoding in zip(missing, encodings):
+                counts[i] = len(encoding.ids)
+                self._token_counts.put(keys[i], counts[i])
+        return counts
+
+    def count_prompt(self, prompt):
+        # includes the special tokens the backend adds, such as <s>
+        return len(self.get_tokenizer().encode(prompt, add_special_tokens=True).ids)
+
+    def pack(self, contexts, build_prompt, budget, separator=""):
+        '''
+        returns the positions of the contexts that fit in budget tokens once build_prompt places them in the prompt,
+        in their original order, and every context's token count. separator is the text placed between contexts.
+        '''
+        counts = self.count_tokens(contexts)
+        separator_tokens = self.count_tokens([separator])[0] if separator else 0
+        remaining = budget - self.count_prompt(build_prompt([]))
+
+        kept = []
+        for i, count in enumerate(counts):
+            if count + separator_tokens <= remaining:
+                kept.append(i)
+                remaining -= count + separator_tokens
+
+        # tokens can merge across the joins, so the assembled prompt is checked once and trimmed if needed
+        while kept and self.count_prompt(build_prompt([contexts[i] for i in kept])) > budget:
+            kept.pop()
+        return kept, counts
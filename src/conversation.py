@@ -0,0 +1,156 @@
+import logging
+import re
+import threading
+from pathlib import Path
+
+from context_packer import ContextPacker
+
+CHAT_HISTORY_PATH = Path(__file__).resolve().parent / "chat_history.txt"
+TURN_SEPARATOR = "\n\n-----\n\n"
+STOP_WORDS = frozenset(
+    "the and for are but not you all any can had her was one our out has him his how its may new now see two way who "
+    "did get let say she too use what when where which while with why that this these those there their them then "
+    "than from have been were will would could should does about into more some such only also just like tell explain "
+    "please".split()
+)
+
+
+def content_words(text):
+    return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 2 and word not in STOP_WORDS}
+
+
+class ConversationSession:
+    '''
+    a multi-turn conversation on the Query tab. follow-up questions are answered from the chunks already retrieved as
+    long as at least reuse_overlap of their content words occur in those chunks, so the index is only searched again
+    when the conversation moves to something new or other databases are selected.
+
+    earlier turns are placed after the contexts and before the new question, so each prompt continues the previous
+    one and koboldcpp can reuse what it has already processed. once the turns take more than history_tokens, the
+    oldest are evicted down to half of that in one go, which keeps the prefix stable between evictions; the evicted
+    questions stay in the prompt as a one-line summary. a prompt can also be given fewer tokens than that, in which
+    case only its most recent turns are included.
+    '''
+    def __init__(self, history_tokens=1024, reuse_overlap=0.5, history_path=CHAT_HISTORY_PATH):
+        self.history_tokens = history_tokens
+        self.reuse_overlap = reuse_overlap
+        self.history_path = history_path
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.turns = []
+            self.earlier_questions = []
+            self.selected_databases = None
+            self.contexts = []
+            self.metadata_list = []
+            self.vocabulary = set()
+            self.retrievals = 0
+            self.reuses = 0
+
+    @staticmethod
+    def count_tokens(text):
+        try:
+            return ContextPacker().count_tokens([text])[0]
+        except Exception:
+            # rough estimate when the tokenizer is not available
+            return len(text) // 4
+
+    def needs_retrieval(self, query, selected_databases):
+        if not self.contexts or tuple(selected_databases) != self.selected_databases:
+            return True
+        words = content_words(query)
+        # a question without content words, like "why?", refers to the previous turns
+        if not words:
+            return False
+        return len(words & self.vocabulary) / len(words) < self.reuse_overlap
+
+    def retrieve(self, query, selected_databases, retrieve):
+        '''
+        returns the contexts and metadata for query, calling retrieve(query, selected_databases) only if the chunks
+        already retrieved do not cover it.
+        '''
+        with self.lock:
+            if self.needs_retrieval(query, selected_databases):
+                contexts, metadata_list = retrieve(query, selected_databases)
+                self.selected_databases = tuple(selected_databases)
+                self.contexts = list(contexts)
+                self.metadata_list = list(metadata_list)
+                self.vocabulary = set().union(*(content_words(context) for context in self.contexts))
+                self.retrievals += 1
+            else:
+                self.reuses += 1
+                logging.info(f"Answering the follow-up from the {len(self.contexts)} contexts already retrieved.")
+            return list(self.contexts), [dict(metadata) for metadata in self.metadata_list]
+
+    @staticmethod
+    def summarize_question(question):
+        return " ".join(question.split())[:100]
+
+    def history_text(self, max_tokens=None):
+        '''
+        the earlier turns as they appear in the prompt, each starting with TURN_SEPARATOR. with max_tokens only the most
+        recent turns that fit are included; the questions of the others join the summary of earlier questions, which is
+        left out if it does not fit as well.
+        '''
+        with self.lock:
+            turns = list(self.turns)
+            earlier_questions = list(self.earlier_questions)
+
+        kept_tokens = 0
+        if max_tokens is not None:
+            first_kept = len(turns)
+            while first_kept and kept_tokens + turns[first_kept - 1][2] <= max_tokens:
+                first_kept -= 1
+                kept_tokens += turns[first_kept][2]
+            earlier_questions = (earlier_questions + [self.summarize_question(question) for question, _, _ in turns[:first_kept]])[-10:]
+            turns = turns[first_kept:]
+
+        history = ""
+        if earlier_questions:
+            summary = f"{TURN_SEPARATOR}Earlier questions: " + "; ".join(earlier_questions)
+            if max_tokens is None or kept_tokens + self.count_tokens(summary) <= max_tokens:
+                history += summary
+        for question, answer, _ in turns:
+            history += f"{TURN_SEPARATOR}{question}{answer}"
+        return history
+
+    def add_turn(self, question, answer):
+        # the answer is stored exactly as generated, so the next prompt starts with what the server already has
+        tokens = self.count_tokens(f"{TURN_SEPARATOR}{question}{answer}")
+        with self.lock:
+            self.turns.append((question, answer, tokens))
+            self.evict()
+        self.save_turn(question, answer)
+
+    def evict(self):
+        total = sum(tokens for _, _, tokens in self.turns)
+        if total <= self.history_tokens:
+            return
+        evicted = 0
+        while self.turns and total > self.history_tokens // 2:
+            question, _, tokens = self.turns.pop(0)
+            total -= tokens
+            evicted += 1
+            self.earlier_questions.append(self.summarize_question(question))
+        self.earlier_questions = self.earlier_questions[-10:]
+        logging.info(f"Evicted {evicted} turns from the conversation history; {len(self.turns)} remain.")
+
+    def save_turn(self, question, answer):
+        if self.history_path is None:
+            return
+        try:
+            with open(self.history_path, 'a', encoding='utf-8') as history_file:
+                history_file.write(f"Question:\n{question}\n\nAnswer:\n{answer.strip()}\n\n")
+        except OSError as e:
+            logging.warning(f"Could not write the chat history: {e}")
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'turns': len(self.turns),
+                'history_tokens': sum(tokens for _, _, tokens in self.turns),
+                'retrievals': self.retrievals,
+                'reuses': self.reuses,
+            }
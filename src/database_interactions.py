@@ -1,27 +1,51 @@
 import gc
+import hashlib
+import json
 import logging
+import math
 import warnings
 import os
 import pickle
 import shutil
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from pathlib import Path
 from typing import Dict, Optional, Union
 
+import numpy as np
+import tiledb
 import torch
 import yaml
 from InstructorEmbedding import INSTRUCTOR
 from PySide6.QtCore import QDir
+from tqdm import tqdm
 from huggingface_hub import snapshot_download
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.docstore.document import Document
 from langchain_community.embeddings import HuggingFaceBgeEmbeddings, HuggingFaceInstructEmbeddings
 from langchain_community.vectorstores import TileDB
+from langchain_community.vectorstores.tiledb import get_documents_array_uri
 
-from document_processor import load_documents, split_documents
-from module_process_images import choose_image_loader
+from chunk_store import ChunkStore
+from constants import DOCUMENT_LOADERS
+from document_processor import load_documents, split_documents, iter_documents, get_text_splitter
+from embedding_batching import TokenBudgetEmbeddings, MultiProcessEmbeddings
+from embedding_cache import EmbeddingCache, CachedEmbeddings, get_cache_directory
+from extract_metadata import compute_file_hash
+from ingestion_pipeline import IngestionPipeline
+from module_process_images import choose_image_loader, ALLOWED_EXTENSIONS
+from numpy_store import NumpyVectorStore, NumpyVectorStoreWriter
+from query_cache import LRUCache
+from reranker import get_reranker, release_rerankers
+from search_index import SearchIndex, SearchIndexWriter, reciprocal_rank_fusion
+from tiledb_vectors import TileDBVectorReader
 from utilities import my_cprint
 
+# empty result slots returned by the vector index
+MAX_UINT64 = np.iinfo(np.uint64).max
+
 datasets_logger = logging.getLogger('datasets')
 datasets_logger.setLevel(logging.WARNING)
 
@@ -42,6 +66,16 @@ class CreateVectorDB:
         self.SOURCE_DIRECTORY = self.ROOT_DIRECTORY / "Docs_for_DB"
         self.PERSIST_DIRECTORY = self.ROOT_DIRECTORY / "Vector_DB" / database_name
         self.SAVE_JSON_DIRECTORY = self.ROOT_DIRECTORY / "Vector_DB" / database_name / "json"
+        self.CHUNK_IDS_PATH = self.ROOT_DIRECTORY / "Vector_DB" / database_name / "chunk_ids.json"
+        self.CHUNK_STORE_DIRECTORY = self.ROOT_DIRECTORY / "Vector_DB" / database_name / "chunks"
+        self.SEARCH_INDEX_DIRECTORY = self.ROOT_DIRECTORY / "Vector_DB" / database_name / "search_index"
+        self.VECTOR_STORE_DIRECTORY = self.ROOT_DIRECTORY / "Vector_DB" / database_name / "numpy_store"
+        self.database_name = database_name
+        self.index_parameters = {'index_type': "FLAT"}
+        self.search_index_enabled = True
+        self.quantization = "none"
+        self.vector_store = "tiledb"
+        self.vector_dtype = "float32"
 
     def load_config(self, root_directory):
         with open(root_directory / "config.yaml", 'r', encoding='utf-8') as stream:
@@ -85,9 +119,11 @@ class CreateVectorDB:
         if "instructor" in model_name:
             encode_kwargs['show_progress_bar'] = True
 
+            # normalized like the query vectors, so distances correspond to cosine similarities
             model = HuggingFaceInstructEmbeddings(
                 model_name=model_name,
                 model_kwargs=model_kwargs,
+                encode_kwargs=encode_kwargs,
                 cache_folder=str(cache_folder)
             )
             
@@ -116,8 +152,119 @@ class CreateVectorDB:
         
         return model, encode_kwargs
 
+    def initialize_token_batching(self, config_data, embeddings, encode_kwargs):
+        # the budget defaults to the old per-model batch size filled with maximum-length chunks
+        token_budget = int(config_data['database'].get('embedding_token_budget', 0) or 0)
+        if token_budget <= 0:
+            token_budget = encode_kwargs['batch_size'] * embeddings.client.max_seq_length
+
+        # optional cpu-only worker pool; instructor models use their own encode signature and stay in-process
+        num_processes = int(config_data['database'].get('embedding_processes', 0) or 0)
+        compute_device = config_data['Compute_Device']['database_creation']
+        if num_processes > 1 and compute_device.lower() == 'cpu':
+            if "instructor" in config_data['EMBEDDING_MODEL_NAME']:
+                my_cprint("Multi-process embedding does not support instructor models; using a single process.", "yellow")
+            else:
+                threads_per_process = int(config_data['database'].get('threads_per_process', 0) or 0)
+                if threads_per_process <= 0:
+                    threads_per_process = max(1, (os.cpu_count() or 1) // num_processes)
+                my_cprint(f"Computing vectors with {num_processes} processes x {threads_per_process} threads.", "green")
+                return MultiProcessEmbeddings(embeddings, token_budget, num_processes, threads_per_process)
+
+        return TokenBudgetEmbeddings(embeddings, token_budget)
+
+    def close_token_batching(self, batched_embeddings):
+        if isinstance(batched_embeddings, MultiProcessEmbeddings):
+            batched_embeddings.close()
+
+    def initialize_embedding_cache(self, config_data, embeddings):
+        # returns the embeddings wrapped in a persistent cache, or unchanged if the cache is disabled. it is off unless
+        # embedding_cache_size is set; every entry takes 4 bytes per dimension on disk, about 1.5 GB for 250000
+        # entries of a 1536-dimension model, and only pays off when the same chunks are embedded again
+        cache_size = int(config_data['database'].get('embedding_cache_size', 0) or 0)
+        if cache_size <= 0:
+            return embeddings, None
+
+        cache = EmbeddingCache(get_cache_directory(config_data['EMBEDDING_MODEL_NAME']), cache_size)
+        return CachedEmbeddings(embeddings, cache), cache
+
+    def close_embedding_cache(self, cache):
+        if cache is not None:
+            cache.print_stats()
+            cache.close()
+
+    @staticmethod
+    def make_chunk_id(file_hash, chunk_index):
+        # deterministic uint64-compatible id so chunks of a source file can be found and deleted later
+        digest = hashlib.sha256(f"{file_hash}:{chunk_index}".encode('utf-8')).hexdigest()
+        return str(int(digest[:15], 16))
+
+    def assign_chunk_ids(self, texts, ids_by_hash=None):
+        # numbering continues from ids_by_hash so a document split across several batches keeps unique ids
+        chunk_ids = []
+        ids_by_hash = {} if ids_by_hash is None else ids_by_hash
+        for doc in texts:
+            file_hash = doc.metadata.get('hash', '')
+            hash_ids = ids_by_hash.setdefault(file_hash, [])
+            chunk_id = self.make_chunk_id(file_hash, len(hash_ids))
+            hash_ids.append(chunk_id)
+            chunk_ids.append(chunk_id)
+        return chunk_ids, ids_by_hash
+
+    def number_chunks(self, texts, chunk_counts):
+        # like assign_chunk_ids, but only keeps how many chunks each file has; the ids follow from the counts
+        chunk_ids = []
+        for doc in texts:
+            file_hash = doc.metadata.get('hash', '')
+            chunk_count = chunk_counts.get(file_hash, 0)
+            chunk_ids.append(self.make_chunk_id(file_hash, chunk_count))
+            chunk_counts[file_hash] = chunk_count + 1
+        return chunk_ids
+
+    def load_chunk_ids(self):
+        if not self.CHUNK_IDS_PATH.exists():
+            return None
+        with open(self.CHUNK_IDS_PATH, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def save_chunk_ids(self, ids_by_hash):
+        with open(self.CHUNK_IDS_PATH, 'w', encoding='utf-8') as file:
+            json.dump(ids_by_hash, file)
+
+    def save_chunk_counts(self, chunk_counts):
+        # writes the same file as save_chunk_ids one source file at a time, so every chunk id is never held at once
+        with open(self.CHUNK_IDS_PATH, 'w', encoding='utf-8') as file:
+            file.write('{')
+            for i, (file_hash, chunk_count) in enumerate(chunk_counts.items()):
+                chunk_ids = [self.make_chunk_id(file_hash, chunk_index) for chunk_index in range(chunk_count)]
+                file.write(f"{', ' if i else ''}{json.dumps(file_hash)}: {json.dumps(chunk_ids)}")
+            file.write('}')
+
+    def load_stored_hashes(self):
+        if not self.SAVE_JSON_DIRECTORY.exists():
+            return set()
+        return {json_file.stem for json_file in self.SAVE_JSON_DIRECTORY.glob("*.json")}
+
+    def hash_source_files(self):
+        # returns {file name: sha256} for every file in Docs_for_DB that the loaders can ingest
+        source_hashes = {}
+        document_extensions = {ext.lower() for ext in DOCUMENT_LOADERS}
+        for item in self.SOURCE_DIRECTORY.iterdir():
+            suffix = item.suffix.lower()
+            if suffix in document_extensions or suffix in ALLOWED_EXTENSIONS:
+                source_hashes[item.name] = compute_file_hash(item)
+        return source_hashes
+
+    def choose_index_parameters(self, config_data, num_chunks):
+        index_type = config_data['database'].get('index_type', "FLAT")
+        if index_type == "IVF_FLAT" and self.vector_store != "numpy":
+            # roughly sqrt(n) partitions keeps both the centroid scan and the per-partition scan small
+            partitions = max(1, min(num_chunks, int(math.sqrt(num_chunks))))
+            return {'index_type': index_type, 'partitions': partitions}
+        return {'index_type': "FLAT"}
+
     @torch.inference_mode()
-    def create_database(self, texts, embeddings):
+    def create_database(self, texts, embeddings, index_parameters=None):
         my_cprint("The progress bar relates to computing vectors. Afterwards, it takes a little time to insert them into the database and save to disk.\n", "yellow")
 
         start_time = time.time()
@@ -132,21 +279,38 @@ class CreateVectorDB:
             # Extract text and metadata from Document objects
             text_content = [doc.page_content for doc in texts]
             metadatas = [doc.metadata for doc in texts]
+            chunk_ids, ids_by_hash = self.assign_chunk_ids(texts)
 
-            logging.info("Calling TileDB.from_texts()")
-            db = TileDB.from_texts(
-                texts=text_content,
-                embedding=embeddings,
-                metadatas=metadatas,
-                index_uri=str(self.PERSIST_DIRECTORY),
-                allow_dangerous_deserialization=True,
-                metric="euclidean",
-                index_type="FLAT",
-            )
+            # vectors are computed here rather than inside TileDB so the search index can be built from them too
+            vectors = embeddings.embed_documents(text_content)
+
+            if self.vector_store == "numpy":
+                vector_store_writer = NumpyVectorStoreWriter(self.VECTOR_STORE_DIRECTORY, self.vector_dtype)
+                vector_store_writer.add(chunk_ids, texts, vectors)
+                vector_store_writer.close()
+            else:
+                logging.info("Calling TileDB.from_embeddings()")
+                db = TileDB.from_embeddings(
+                    text_embeddings=list(zip(text_content, vectors)),
+                    embedding=embeddings,
+                    metadatas=metadatas,
+                    ids=chunk_ids,
+                    index_uri=str(self.PERSIST_DIRECTORY),
+                    allow_dangerous_deserialization=True,
+                    metric="euclidean",
+                    **(index_parameters or self.index_parameters),
+                )
         except Exception as e:
             logging.error(f"Error creating database: {str(e)}")
             raise
 
+        self.save_chunk_ids(ids_by_hash)
+
+        if self.search_index_enabled:
+            search_index_writer = SearchIndexWriter(self.SEARCH_INDEX_DIRECTORY, self.quantization)
+            search_index_writer.add(chunk_ids, texts, vectors)
+            search_index_writer.close()
+
         print("Database created.")
 
         end_time = time.time()
@@ -154,7 +318,199 @@ class CreateVectorDB:
 
         print("Database saved to disk.")
         logging.info(f"Creation of vectors and inserting into the database took {elapsed_time:.2f} seconds.")
+
+    def write_embedded_chunks(self, db, texts, vectors, chunk_ids):
+        # writes the same layout as TileDB.add_texts, but for vectors that were already computed
+        external_ids = np.array(chunk_ids).astype(np.uint64)
+        vector_array = np.empty(len(vectors), dtype="O")
+        for i, vector in enumerate(vectors):
+            vector_array[i] = np.asarray(vector, dtype=np.float32)
+        db.vector_index.update_batch(vectors=vector_array, external_ids=external_ids)
+
+        metadata_array = np.empty(len(texts), dtype=object)
+        for i, doc in enumerate(texts):
+            metadata_array[i] = np.frombuffer(pickle.dumps(doc.metadata), dtype=np.uint8)
+        with tiledb.open(db.docs_array_uri, "w") as docs_array:
+            docs_array[external_ids] = {"text": np.array([doc.page_content for doc in texts]), "metadata": metadata_array}
+
+    @torch.inference_mode()
+    def create_database_streaming(self, config_data, documents, embeddings):
+        start_time = time.time()
+        self.PERSIST_DIRECTORY.mkdir(parents=True, exist_ok=True)
+
+        index_type = config_data['database'].get('index_type', "FLAT")
+        # everything below writes to disk batch by batch; what stays in memory grows with the number of source files
+        # (chunk counts, the chunk store's file index) and with the search index's vocabulary, not with the chunks
+        chunk_counts = {}
+        state = {'db': None}
+        structures_file = open(self.ROOT_DIRECTORY / "document_structures.txt", 'w', encoding='utf-8')
+        chunk_store = ChunkStore(self.CHUNK_STORE_DIRECTORY)
+        chunk_store.clear()
+        search_index_writer = SearchIndexWriter(self.SEARCH_INDEX_DIRECTORY, self.quantization) if self.search_index_enabled else None
+        vector_store_writer = NumpyVectorStoreWriter(self.VECTOR_STORE_DIRECTORY, self.vector_dtype) if self.vector_store == "numpy" else None
+
+        def write_batch(texts, vectors):
+            if vector_store_writer is not None:
+                state['db'] = vector_store_writer
+            elif state['db'] is None:
+                TileDB.create(
+                    index_uri=str(self.PERSIST_DIRECTORY),
+                    index_type=index_type,
+                    dimensions=len(vectors[0]),
+                    vector_type=np.dtype(np.float32),
+                    metadatas=True,
+                )
+                state['db'] = TileDB.load(index_uri=str(self.PERSIST_DIRECTORY), embedding=embeddings, allow_dangerous_deserialization=True)
+
+            chunk_ids = self.number_chunks(texts, chunk_counts)
+            if vector_store_writer is not None:
+                vector_store_writer.add(chunk_ids, texts, vectors)
+            else:
+                self.write_embedded_chunks(state['db'], texts, vectors, chunk_ids)
+            chunk_store.append(texts)
+            if search_index_writer is not None:
+                search_index_writer.add(chunk_ids, texts, vectors)
+
+            for doc in texts:
+                structures_file.write(str(doc))
+                structures_file.write('\n\n')
+
+        pipeline = IngestionPipeline(
+            documents=documents,
+            text_splitter=get_text_splitter(),
+            embeddings=embeddings,
+            write_batch=write_batch,
+            on_document=lambda document: self.save_documents_to_json([document]),
+            batch_size=int(config_data['database'].get('streaming_batch_size', 1024)),
+        )
+
+        try:
+            with tqdm(unit="chunk", desc="Embedding and inserting chunks") as progress_bar:
+                stats = pipeline.run(progress_callback=progress_bar.update)
+        except Exception:
+            if search_index_writer is not None:
+                search_index_writer.abort()
+            if vector_store_writer is not None:
+                vector_store_writer.abort()
+            raise
+        finally:
+            structures_file.close()
+            chunk_store.close()
+
+        if state['db'] is None:
+            if vector_store_writer is not None:
+                vector_store_writer.abort()
+            my_cprint("No chunks were created from the selected files.", "red")
+            return False
+
+        self.index_parameters = self.choose_index_parameters(config_data, stats['chunks'])
+        if vector_store_writer is not None:
+            vector_store_writer.close()
+        else:
+            consolidate_kwargs = {'partitions': self.index_parameters['partitions']} if 'partitions' in self.index_parameters else {}
+            state['db'].consolidate_updates(**consolidate_kwargs)
+        self.save_chunk_counts(chunk_counts)
+        if search_index_writer is not None:
+            search_index_writer.close()
+
+        elapsed_time = time.time() - start_time
+        print("Database created.")
+        logging.info(f"Streamed {stats['documents']} documents and {stats['chunks']} chunks into the database in {elapsed_time:.2f} seconds "
+                     f"(load {stats['load_time']:.2f}s, split {stats['split_time']:.2f}s, embed {stats['embed_time']:.2f}s, write {stats['write_time']:.2f}s).")
+        return True
+
+    @torch.inference_mode()
+    def update_database(self, texts, embeddings, removed_hashes, ids_by_hash):
+        start_time = time.time()
+
+        db = None
+        if self.vector_store != "numpy":
+            db = TileDB.load(index_uri=str(self.PERSIST_DIRECTORY), embedding=embeddings, allow_dangerous_deserialization=True)
+
+        removed_ids = [chunk_id for file_hash in removed_hashes for chunk_id in ids_by_hash.pop(file_hash, [])]
+        if removed_ids:
+            logging.info(f"Deleting {len(removed_ids)} chunks from {len(removed_hashes)} removed or changed file(s).")
+            if db is not None:
+                db.delete(ids=removed_ids)
+
+        chunk_ids, vectors = [], []
+        if texts:
+            chunk_ids, new_ids_by_hash = self.assign_chunk_ids(texts)
+            vectors = embeddings.embed_documents([doc.page_content for doc in texts])
+            if db is not None:
+                self.write_embedded_chunks(db, texts, vectors, chunk_ids)
+            ids_by_hash.update(new_ids_by_hash)
+
+        if removed_ids or texts:
+            if db is not None:
+                db.consolidate_updates()
+            else:
+                self.rebuild_vector_store(ids_by_hash, texts, vectors)
+
+        self.save_chunk_ids(ids_by_hash)
+
+        chunk_store = ChunkStore(self.CHUNK_STORE_DIRECTORY)
+        chunk_store.remove_files(removed_hashes)
+        chunk_store.append(texts)
+        chunk_store.close()
+
+        if self.search_index_enabled:
+            self.update_search_index(removed_ids, chunk_ids, texts, vectors)
+
+        for file_hash in removed_hashes:
+            (self.SAVE_JSON_DIRECTORY / f"{file_hash}.json").unlink(missing_ok=True)
+
+        elapsed_time = time.time() - start_time
+        print("Database updated.")
+        logging.info(f"Updating the database with {len(texts)} chunks took {elapsed_time:.2f} seconds.")
         
+    def rebuild_vector_store(self, ids_by_hash, new_texts, new_vectors):
+        # the numpy store is rewritten in one pass; unchanged chunks are copied from the previous store
+        previous_store = NumpyVectorStore.open(self.VECTOR_STORE_DIRECTORY)
+        new_chunks_by_hash = {}
+        for doc, vector in zip(new_texts, new_vectors):
+            documents, vectors = new_chunks_by_hash.setdefault(doc.metadata.get('hash', ''), ([], []))
+            documents.append(doc)
+            vectors.append(vector)
+
+        dtype = previous_store.dtype if previous_store is not None else self.vector_dtype
+        vector_store_writer = NumpyVectorStoreWriter(self.VECTOR_STORE_DIRECTORY, dtype)
+        try:
+            for file_hash, chunk_ids in ids_by_hash.items():
+                if file_hash in new_chunks_by_hash:
+                    documents, vectors = new_chunks_by_hash[file_hash]
+                else:
+                    # rows come back sorted, which is the order the file's chunks were written in
+                    rows = previous_store.rows_for_ids([int(chunk_id) for chunk_id in chunk_ids])
+                    documents = [previous_store.documents.get_document(int(row)) for row in rows]
+                    vectors = np.asarray(previous_store.vectors[rows], dtype=np.float32)
+                    chunk_ids = previous_store.ids[rows]
+                vector_store_writer.add(chunk_ids, documents, vectors)
+        except Exception:
+            vector_store_writer.abort()
+            raise
+        previous_store = None
+        vector_store_writer.close()
+
+    def update_search_index(self, removed_ids, chunk_ids, new_texts, new_vectors):
+        # only the new chunks are tokenized; the rows of removed ones are marked deleted until the index is compacted
+        try:
+            search_index_writer = SearchIndexWriter(self.SEARCH_INDEX_DIRECTORY, update=True)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Database has no search index to update, removing it; filtered searches will over-fetch instead: {e}")
+            shutil.rmtree(self.SEARCH_INDEX_DIRECTORY, ignore_errors=True)
+            return
+
+        try:
+            search_index_writer.delete(removed_ids)
+            search_index_writer.add(chunk_ids, new_texts, new_vectors)
+            search_index_writer.close()
+        except Exception as e:
+            # an index that no longer matches the database would hide chunks from filtered searches
+            logging.warning(f"Could not update the search index, removing it; filtered searches will over-fetch instead: {e}")
+            search_index_writer.abort()
+            shutil.rmtree(self.SEARCH_INDEX_DIRECTORY, ignore_errors=True)
+
     def save_documents_to_json(self, json_docs_to_save):
         if not self.SAVE_JSON_DIRECTORY.exists():
             self.SAVE_JSON_DIRECTORY.mkdir(parents=True, exist_ok=True)
@@ -177,7 +533,7 @@ class CreateVectorDB:
             else:
                 print("Warning: Document missing 'hash' in metadata. Skipping JSON creation.")
     
-    def load_audio_documents(self, source_dir: Path = None) -> list:
+    def load_audio_documents(self, source_dir: Path = None, skip_hashes=None) -> list:
         if source_dir is None:
             source_dir = self.SOURCE_DIRECTORY
         json_paths = [f for f in source_dir.iterdir() if f.suffix.lower() == '.json']
@@ -188,6 +544,8 @@ class CreateVectorDB:
                 with open(json_path, 'r', encoding='utf-8') as json_file:
                     json_str = json_file.read()
                     doc = Document.parse_raw(json_str)
+                    if skip_hashes and doc.metadata.get('hash') in skip_hashes:
+                        continue
                     docs.append(doc)
             except Exception as e:
                 my_cprint(f"Error loading {json_path}: {e}", "red")
@@ -209,40 +567,113 @@ class CreateVectorDB:
                 file.write('\n\n')
 
 
-    def save_documents_to_pickle(self, documents):
-        pickle_directory = self.ROOT_DIRECTORY / "pickle"
-        
-        if not pickle_directory.exists():
-            pickle_directory.mkdir(parents=True, exist_ok=True)
-        
-        for file in pickle_directory.glob("*.pickle"):
-            file.unlink()
+    def save_documents_to_chunk_store(self, documents):
+        chunk_store = ChunkStore(self.CHUNK_STORE_DIRECTORY)
+        chunk_store.clear()
+        chunk_store.append(documents)
+        chunk_store.close()
 
-        time.sleep(3)
+    
+    @torch.inference_mode()
+    def run_streaming(self, config_data):
+        # images and audio are few and loaded up front, before the vector model takes up memory
+        print("Processing any images...")
+        image_documents = choose_image_loader()
+        if not isinstance(image_documents, list):
+            image_documents = []
+
+        print("Processing any audio transcripts...")
+        audio_documents = self.load_audio_documents()
 
-        for i, doc in enumerate(documents):
-            pickle_file_path = pickle_directory / f"document_{i}.pickle"
-            with open(pickle_file_path, 'wb') as pickle_file:
-                pickle.dump(doc, pickle_file)
+        embeddings, encode_kwargs = self.initialize_vector_model(config_data)
+        batched_embeddings = self.initialize_token_batching(config_data, embeddings, encode_kwargs)
+        batched_embeddings.show_progress = False
+        cached_embeddings, embedding_cache = self.initialize_embedding_cache(config_data, batched_embeddings)
+
+        print("Processing documents and creating vector database...")
+        documents = chain(iter_documents(self.SOURCE_DIRECTORY), image_documents, audio_documents)
+        try:
+            succeeded = self.create_database_streaming(config_data, documents, cached_embeddings)
+        finally:
+            self.close_embedding_cache(embedding_cache)
+            self.close_token_batching(batched_embeddings)
+
+            del embeddings.client
+            del embeddings
+            torch.cuda.empty_cache()
+            gc.collect()
+            my_cprint("Vector model removed from memory.", "red")
+
+        if succeeded:
+            self.clear_docs_for_db_folder()
+        return succeeded
 
-    
     @torch.inference_mode()
-    def run(self):
+    def run(self, update=False, remove_unchosen=False):
         config_data = self.load_config(self.ROOT_DIRECTORY)
+        self.quantization = config_data['database'].get('quantization', "none")
+        self.vector_store = config_data['database'].get('vector_store', "tiledb")
+        self.vector_dtype = config_data['database'].get('vector_dtype', "float32")
+        # quantized codes are part of the search index, so quantization needs it
+        self.search_index_enabled = bool(config_data['database'].get('build_search_index', True)) or self.quantization != "none"
+
+        if not update and config_data['database'].get('streaming_ingestion', False):
+            return self.run_streaming(config_data)
         
+        # when updating, only files whose hashes are not already stored get loaded and embedded
+        new_file_names = None
+        unchanged_hashes = set()
+        removed_hashes = set()
+        ids_by_hash = None
+        chunk_size = None
+        chunk_overlap = None
+
+        if update:
+            ids_by_hash = self.load_chunk_ids()
+            if ids_by_hash is None:
+                my_cprint(f"Database '{self.database_name}' was created without chunk ids and cannot be updated. Please recreate it.", "red")
+                return False
+
+            database_config = config_data['created_databases'][self.database_name]
+            config_data['EMBEDDING_MODEL_NAME'] = database_config['model']
+            self.vector_store = database_config.get('vector_store', "tiledb")
+            # an existing search index is always kept in step with the database, whatever the current settings,
+            # so filtered and quantized searches never read rows that were removed or miss new ones
+            self.quantization = database_config.get('quantization', "none")
+            self.search_index_enabled = self.SEARCH_INDEX_DIRECTORY.exists()
+            chunk_size = database_config.get('chunk_size')
+            chunk_overlap = database_config.get('chunk_overlap')
+
+            stored_hashes = self.load_stored_hashes()
+            source_hashes = self.hash_source_files()
+            audio_hashes = {doc.metadata.get('hash') for doc in self.load_audio_documents()}
+            incoming_hashes = set(source_hashes.values()) | audio_hashes
+
+            new_file_names = {name for name, file_hash in source_hashes.items() if file_hash not in stored_hashes}
+            unchanged_hashes = stored_hashes & incoming_hashes
+            if remove_unchosen:
+                removed_hashes = stored_hashes - incoming_hashes
+            else:
+                # only earlier versions of the chosen files are replaced; every other stored file is kept
+                stored_file_names = ChunkStore(self.CHUNK_STORE_DIRECTORY).file_names()
+                removed_hashes = {file_hash for file_hash in stored_hashes - incoming_hashes
+                                  if stored_file_names.get(file_hash) in new_file_names}
+            print(f"Update: {len(incoming_hashes - stored_hashes)} new or changed, {len(unchanged_hashes)} unchanged, {len(removed_hashes)} removed file(s).")
+
         # create  a list to hold langchain "document objects"        
         # langchain_core.documents.base.Document
         documents = []
         
         # add text documents
         print("Processing any text documents...")
-        text_documents = load_documents(self.SOURCE_DIRECTORY)
+        text_file_paths = None if new_file_names is None else [self.SOURCE_DIRECTORY / name for name in new_file_names]
+        text_documents = load_documents(self.SOURCE_DIRECTORY, text_file_paths)
         if isinstance(text_documents, list) and text_documents:
             documents.extend(text_documents)
         
         # add image documents
         print("Processing any images...")
-        image_documents = choose_image_loader()
+        image_documents = choose_image_loader(new_file_names)
         if isinstance(image_documents, list) and image_documents:
             if len(image_documents) > 0:
                 documents.extend(image_documents)
@@ -251,7 +682,7 @@ class CreateVectorDB:
         
         # add audio documents
         print("Processing any audio transcripts...")
-        audio_documents = self.load_audio_documents()
+        audio_documents = self.load_audio_documents(skip_hashes=unchanged_hashes)
         if isinstance(audio_documents, list) and audio_documents:
             documents.extend(audio_documents)
             if len(audio_documents) > 0:
@@ -261,20 +692,47 @@ class CreateVectorDB:
         
         # split documents
         if isinstance(documents, list) and documents:
-            texts = split_documents(documents)
+            texts = split_documents(documents, chunk_size, chunk_overlap)
+
+        if update:
+            if texts or removed_hashes:
+                embeddings, encode_kwargs = self.initialize_vector_model(config_data)
+                batched_embeddings = self.initialize_token_batching(config_data, embeddings, encode_kwargs)
+                cached_embeddings, embedding_cache = self.initialize_embedding_cache(config_data, batched_embeddings)
+                print("Updating vector database...")
+                self.update_database(texts, cached_embeddings, removed_hashes, ids_by_hash)
+                self.close_embedding_cache(embedding_cache)
+                self.close_token_batching(batched_embeddings)
+                self.save_documents_to_json(json_docs_to_save)
+
+                del embeddings.client
+                del embeddings
+                torch.cuda.empty_cache()
+                gc.collect()
+                my_cprint("Vector model removed from memory.", "red")
+            else:
+                print("Database is already up to date.")
+
+            self.clear_docs_for_db_folder()
+            return True
 
         # create database and cleanup
         if isinstance(texts, list) and texts:
-            self.save_documents_to_pickle(texts) # serialize the split documents temporarily
+            self.save_documents_to_chunk_store(texts) # serialize the split documents in one columnar store
             self.save_document_structures(texts) # optional for troubleshooting
 
             # initialize vector model
             embeddings, encode_kwargs = self.initialize_vector_model(config_data)
+            batched_embeddings = self.initialize_token_batching(config_data, embeddings, encode_kwargs)
+            cached_embeddings, embedding_cache = self.initialize_embedding_cache(config_data, batched_embeddings)
 
             # create database
             if isinstance(texts, list) and texts:
                 print("Creating vector database...")
-                self.create_database(texts, embeddings)
+                self.index_parameters = self.choose_index_parameters(config_data, len(texts))
+                self.create_database(texts, cached_embeddings, self.index_parameters)
+            self.close_embedding_cache(embedding_cache)
+            self.close_token_batching(batched_embeddings)
             
             self.save_documents_to_json(json_docs_to_save)
             
@@ -287,24 +745,223 @@ class CreateVectorDB:
             
             self.clear_docs_for_db_folder()
 
+        return True
+
 
 class QueryVectorDB:
+    # resident query engines keyed by database name; the embedding model and TileDB index stay loaded between questions
+    _instances = {}
+    _lock = threading.RLock()
+    _stats = {
+        'hits': 0,
+        'misses': 0,
+        'loads': 0,
+        'unloads': 0,
+        'last_load_time': 0.0,
+        'total_load_time': 0.0,
+    }
+    # shared by all databases: query embeddings are keyed by model, results by database and its on-disk version
+    _query_embedding_cache = LRUCache(1024)
+    _result_cache = LRUCache(256)
+    # embedding models keyed by (model, device), shared by every resident database created with the same model
+    _embedding_models = {}
+
     def __init__(self, selected_database):
         self.config = self.load_configuration()
         self.selected_database = selected_database
-        self.embeddings = self.initialize_vector_model()
+        self.model_path = self.config['created_databases'][self.selected_database]['model']
+        # instructor databases created before their vectors were normalized have no 'normalized' entry
+        self.normalized = self.config['created_databases'][self.selected_database].get('normalized', "instructor" not in self.model_path)
+        self.compute_device = self.config['Compute_Device']['database_query']
+        self.embeddings = self.get_shared_vector_model()
+        self.search_index = self.initialize_search_index()
         self.db = self.initialize_database()
-        self.retriever = self.initialize_retriever()
+        self.vector_reader = None
+        self.database_version = self.get_database_version()
+        self.search_settings = self.initialize_search_settings()
+        self.last_used = time.monotonic()
+        # an unloaded instance is only released once the searches still running on it have finished
+        self.search_condition = threading.Condition()
+        self.active_searches = 0
+        self.unloaded = False
+
+    @classmethod
+    def get_instance(cls, selected_database, keep=()):
+        with cls._lock:
+            instance = cls._instances.get(selected_database)
+            config = cls.load_configuration()
+            cls.configure_caches(config)
+
+            if instance is not None and instance.is_current(config):
+                cls._stats['hits'] += 1
+                instance.refresh_settings(config)
+            else:
+                if instance is not None:
+                    cls.unload(selected_database)
+                cls._stats['misses'] += 1
+
+                start_time = time.time()
+                instance = cls(selected_database)
+                load_time = time.time() - start_time
+
+                cls._stats['loads'] += 1
+                cls._stats['last_load_time'] = load_time
+                cls._stats['total_load_time'] += load_time
+                cls._instances[selected_database] = instance
+                my_cprint(f"Database '{selected_database}' loaded in {load_time:.2f} seconds.", "green")
+
+            instance.last_used = time.monotonic()
+            cls.enforce_residency_policy(config, keep={selected_database, *keep})
+            return instance
+
+    @classmethod
+    def get_instances(cls, selected_databases):
+        # every selected database stays resident while they are searched together
+        with cls._lock:
+            return [cls.get_instance(name, keep=selected_databases) for name in selected_databases]
+
+    @classmethod
+    def unload(cls, selected_database=None, wait=False):
+        '''
+        unloads one database, or every resident database if none is specified. an instance that is being searched is
+        released when its last search finishes; with wait=True this returns only after that, so the database's files
+        can be changed or deleted.
+        '''
+        unloaded = []
+        with cls._lock:
+            names = list(cls._instances) if selected_database is None else [selected_database]
+            for name in names:
+                instance = cls._instances.pop(name, None)
+                if instance is None:
+                    continue
+                model_key = (instance.model_path, instance.compute_device)
+                instance.release_when_idle()
+                unloaded.append(instance)
+                if not any((other.model_path, other.compute_device) == model_key for other in cls._instances.values()):
+                    cls._embedding_models.pop(model_key, None)
+                cls._stats['unloads'] += 1
+                my_cprint(f"Database '{name}' removed from memory.", "red")
+
+            if names:
+                if not cls._instances:
+                    release_rerankers()
+                torch.cuda.empty_cache()
+                gc.collect()
+
+        if wait:
+            for instance in unloaded:
+                instance.wait_for_searches()
+
+    @classmethod
+    def unload_idle(cls):
+        with cls._lock:
+            if not cls._instances:
+                return
+            idle_timeout = float(cls.load_configuration()['database'].get('idle_timeout', 0) or 0)
+            if idle_timeout <= 0:
+                return
+            now = time.monotonic()
+            for name, instance in list(cls._instances.items()):
+                if now - instance.last_used > idle_timeout:
+                    cls.unload(name)
+
+    @classmethod
+    def enforce_residency_policy(cls, config, keep=()):
+        max_resident = max(int(config['database'].get('max_resident_databases', 1) or 1), len(keep))
+        by_last_used = sorted(cls._instances.items(), key=lambda item: item[1].last_used)
+        excess = len(by_last_used) - max_resident
+        for name, _ in by_last_used:
+            if excess <= 0:
+                break
+            if name not in keep:
+                cls.unload(name)
+                excess -= 1
+
+    @classmethod
+    def configure_caches(cls, config):
+        cls._query_embedding_cache.resize(config['database'].get('query_embedding_cache_size', 1024) or 0)
+        cls._result_cache.resize(config['database'].get('query_result_cache_size', 256) or 0)
+
+    @classmethod
+    def invalidate_cache(cls, selected_database=None):
+        # drops cached results for one database, or for every database if none is specified
+        if selected_database is None:
+            cls._result_cache.clear()
+        else:
+            cls._result_cache.remove_if(lambda key: key[0] == selected_database)
+
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats['resident'] = list(cls._instances)
+            stats['query_embedding_cache'] = cls._query_embedding_cache.get_stats()
+            stats['result_cache'] = cls._result_cache.get_stats()
+            return stats
+
+    def is_current(self, config):
+        database_config = config.get('created_databases', {}).get(self.selected_database)
+        if not database_config:
+            return False
+        return (database_config.get('model') == self.model_path
+                and config['Compute_Device']['database_query'] == self.compute_device
+                and self.get_database_version() == self.database_version)
 
-    def load_configuration(self):
+    def refresh_settings(self, config):
+        # search settings can change between questions without reloading the model or index
+        self.config = config
+        self.search_settings = self.initialize_search_settings()
+
+    def begin_search(self):
+        # returns False if the instance has been unloaded; otherwise it stays loaded until end_search
+        with self.search_condition:
+            if self.unloaded:
+                return False
+            self.active_searches += 1
+            return True
+
+    def end_search(self):
+        with self.search_condition:
+            self.active_searches -= 1
+            if not self.active_searches:
+                if self.unloaded:
+                    self.release()
+                self.search_condition.notify_all()
+
+    def release_when_idle(self):
+        with self.search_condition:
+            self.unloaded = True
+            if not self.active_searches:
+                self.release()
+
+    def wait_for_searches(self):
+        with self.search_condition:
+            self.search_condition.wait_for(lambda: not self.active_searches)
+
+    def release(self):
+        self.search_settings = None
+        self.search_index = None
+        self.db = None
+        self.vector_reader = None
+        self.embeddings = None
+
+    @staticmethod
+    def load_configuration():
         config_file_path = Path(__file__).resolve().parent / "config.yaml"
-        with open(config_file_path, 'r') as config_file:
+        with open(config_file_path, 'r', encoding='utf-8') as config_file:
             return yaml.safe_load(config_file)
 
+    def get_shared_vector_model(self):
+        model_key = (self.model_path, self.compute_device)
+        with self._lock:
+            embeddings = self._embedding_models.get(model_key)
+            if embeddings is None:
+                embeddings = self._embedding_models[model_key] = self.initialize_vector_model()
+            return embeddings
+
     def initialize_vector_model(self):    
-        model_path = self.config['created_databases'][self.selected_database]['model']
-        
-        compute_device = self.config['Compute_Device']['database_query']
+        model_path = self.model_path
+        compute_device = self.compute_device
         encode_kwargs = {'normalize_embeddings': True, 'batch_size': 1}
         
         cache_folder = str(Path.cwd() / "Models" / "vector")
@@ -333,34 +990,380 @@ class QueryVectorDB:
                 cache_folder=cache_folder
             )
 
+    def get_persist_directory(self):
+        return Path(__file__).resolve().parent / "Vector_DB" / self.selected_database
+
+    def get_database_version(self):
+        # chunk_ids.json is rewritten whenever the database is created or updated, so its mtime identifies the build
+        persist_directory = self.get_persist_directory()
+        paths = [persist_directory / "chunk_ids.json", persist_directory]
+        return max((path.stat().st_mtime_ns for path in paths if path.exists()), default=0)
+
     def initialize_database(self):
-        persist_directory = Path(__file__).resolve().parent / "Vector_DB" / self.selected_database
-        
-        return TileDB.load(index_uri=str(persist_directory), embedding=self.embeddings, allow_dangerous_deserialization=True)
+        persist_directory = self.get_persist_directory()
+
+        if self.config['created_databases'][self.selected_database].get('vector_store', "tiledb") == "numpy":
+            return NumpyVectorStore(persist_directory / "numpy_store")
 
-    def initialize_retriever(self):
+        if self.search_index is not None and self.search_index.quantization != "none":
+            # quantized databases are searched through the codes in the search index, so the TileDB vector index is
+            # never loaded into memory; only its documents array is read
+            self.docs_array_uri = get_documents_array_uri(str(persist_directory))
+            return None
+
+        db = TileDB.load(index_uri=str(persist_directory), embedding=self.embeddings, allow_dangerous_deserialization=True)
+        self.docs_array_uri = db.docs_array_uri
+        return db
+
+    def read_vectors(self, chunk_ids):
+        # vectors of the given chunks in the same order, read from the vector store to rank candidates exactly
+        if isinstance(self.db, NumpyVectorStore):
+            return self.db.vectors_for_ids(chunk_ids)
+        if self.vector_reader is None:
+            self.vector_reader = TileDBVectorReader(self.get_persist_directory())
+        return self.vector_reader.read(chunk_ids)
+
+    def initialize_search_index(self):
+        # databases created before the search index existed fall back to over-fetching when filtering
+        try:
+            return SearchIndex.open(self.get_persist_directory() / "search_index")
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable search index for '{self.selected_database}': {e}")
+            return None
+
+    def initialize_search_settings(self):
         document_types = self.config['database'].get('document_types', '')
-        search_filter = {'document_type': document_types} if document_types else {}
-        score_threshold = float(self.config['database']['similarity'])
-        k = int(self.config['database']['contexts'])
-        search_type = "similarity"
-        
-        return self.db.as_retriever(
-            search_type=search_type,
-            search_kwargs={
-                'score_threshold': score_threshold,
-                'k': k,
-                'filter': search_filter
+        contexts = int(self.config['database']['contexts'])
+        rerank = None
+        if self.config['database'].get('rerank', False):
+            rerank = {
+                'model': self.config['database'].get('rerank_model', "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                'batch_size': int(self.config['database'].get('rerank_batch_size', 32) or 32),
+                'time_budget': float(self.config['database'].get('rerank_time_budget', 0.5) or 0),
             }
+        search_settings = {
+            # k chunks are retrieved and the best 'contexts' of them returned; more are retrieved when reranking
+            'k': max(contexts, int(self.config['database'].get('rerank_candidates', 20) or 20)) if rerank else contexts,
+            'contexts': contexts,
+            'rerank': rerank,
+            'score_threshold': float(self.config['database']['similarity']),
+            'filter': {'document_type': [document_types]} if document_types else None,
+            'search_term': self.config['database'].get('search_term', '').lower(),
+            'search_type': self.config['database'].get('search_type', "similarity"),
+            'query_kwargs': {},
+        }
+
+        database_config = self.config['created_databases'][self.selected_database]
+        if database_config.get('index_type') == "IVF_FLAT":
+            nprobe = int(self.config['database'].get('nprobe', 16))
+            search_settings['query_kwargs']['nprobe'] = max(1, min(nprobe, int(database_config.get('partitions', nprobe))))
+
+        return search_settings
+
+    def embed_queries(self, queries):
+        # cached vectors are reused and only the remaining queries are encoded
+        vectors = [self._query_embedding_cache.get((self.model_path, query)) for query in queries]
+        missing = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, self.encode_queries(missing)))
+            for query, vector in computed.items():
+                self._query_embedding_cache.put((self.model_path, query), vector)
+            vectors = [computed[query] if vector is None else vector for query, vector in zip(queries, vectors)]
+        return np.asarray(vectors, dtype=np.float32)
+
+    def encode_queries(self, queries):
+        # one encode call for all queries, with the same per-model query handling as embed_query
+        embeddings = self.embeddings
+        batch_size = max(1, min(len(queries), int(self.config['database'].get('query_batch_size', 32) or 32)))
+
+        if isinstance(embeddings, HuggingFaceInstructEmbeddings):
+            inputs = [[embeddings.query_instruction, query] for query in queries]
+        elif isinstance(embeddings, HuggingFaceBgeEmbeddings):
+            inputs = [embeddings.query_instruction + query.replace("\n", " ") for query in queries]
+        elif isinstance(embeddings, HuggingFaceEmbeddings):
+            inputs = [query.replace("\n", " ") for query in queries]
+        else:
+            return np.asarray([embeddings.embed_query(query) for query in queries], dtype=np.float32)
+
+        vectors = embeddings.client.encode(inputs, show_progress_bar=False, **{**embeddings.encode_kwargs, 'batch_size': batch_size})
+        return np.asarray(vectors, dtype=np.float32)
+
+    def fetch_documents(self, ids):
+        # reads every requested chunk from the documents array in one query
+        ids = sorted(set(int(idx) for idx in ids))
+        if not ids:
+            return {}
+        if isinstance(self.db, NumpyVectorStore):
+            return self.db.get_documents(ids)
+        with tiledb.open(self.docs_array_uri, "r") as docs_array:
+            results = docs_array.multi_index[ids]
+
+        documents = {}
+        for idx, text, pickled_metadata in zip(results['id'], results['text'], results['metadata']):
+            metadata = pickle.loads(np.asarray(pickled_metadata, dtype=np.uint8).tobytes())
+            documents[int(idx)] = Document(page_content=str(text), metadata=metadata)
+        return documents
+
+    def result_cache_key(self, query_vector, query):
+        settings = self.search_settings
+        search_filter = tuple(sorted((key, tuple(values)) for key, values in (settings['filter'] or {}).items()))
+        return (
+            self.selected_database,
+            self.database_version,
+            hashlib.blake2b(query_vector.tobytes(), digest_size=16).digest(),
+            # hybrid and reranked results also depend on the words of the query, not only its embedding
+            query if settings['search_type'] == "hybrid" or settings['rerank'] else None,
+            settings['search_type'],
+            settings['k'],
+            settings['contexts'],
+            tuple(sorted((settings['rerank'] or {}).items())),
+            settings['score_threshold'],
+            search_filter,
+            settings['search_term'],
+            tuple(sorted(settings['query_kwargs'].items())),
         )
 
+    def collect_results(self, ranked):
+        '''
+        walks each query's candidate chunk ids in order and keeps the first k that pass the metadata filter and the
+        search term, with their scores. chunk texts are read in blocks, the first block of every query in a single read.
+        '''
+        settings = self.search_settings
+        k = settings['k']
+        search_filter = settings['filter']
+        block_size = max(4 * k, 64)
+
+        documents = self.fetch_documents(np.concatenate([ids[:block_size] for ids, _ in ranked]) if ranked else [])
+
+        results = []
+        for ids, scores in ranked:
+            contexts = []
+            metadata_list = []
+            context_scores = []
+            for start in range(0, len(ids), block_size):
+                block_ids = ids[start:start + block_size]
+                missing = [idx for idx in block_ids if int(idx) not in documents]
+                if missing:
+                    documents.update(self.fetch_documents(missing))
+
+                for idx, score in zip(block_ids, scores[start:start + block_size]):
+                    document = documents.get(int(idx))
+                    if document is None:
+                        continue
+                    if search_filter and not all(document.metadata.get(key) in values for key, values in search_filter.items()):
+                        continue
+                    if settings['search_term'] not in document.page_content.lower():
+                        continue
+                    contexts.append(document.page_content)
+                    metadata_list.append(document.metadata)
+                    context_scores.append(float(score))
+                    if len(contexts) == k:
+                        break
+                if len(contexts) == k:
+                    break
+            results.append((contexts, metadata_list, context_scores))
+
+        return results
+
+    def within_threshold(self, ranked):
+        '''
+        keeps the chunks whose squared distance is within the similarity setting, the same limit on the raw distance
+        the langchain retriever applied. for normalized vectors a distance d is a cosine similarity of 1 - d / 2, which
+        is returned as the score; databases with unnormalized vectors score 1 / (1 + d) instead, which still orders by
+        distance but does not pretend to be a cosine similarity.
+        '''
+        score_threshold = self.search_settings['score_threshold']
+        results = []
+        for ids, distances in ranked:
+            within = distances <= score_threshold
+            scores = 1.0 - distances[within] / 2.0 if self.normalized else 1.0 / (1.0 + np.maximum(distances[within], 0.0))
+            results.append((ids[within], scores.astype(np.float32)))
+        return results
+
+    def find_candidate_rows(self):
+        # the search index narrows a filtered search to the chunks that can match before any distances are computed
+        settings = self.search_settings
+        if self.search_index is None or not (settings['filter'] or settings['search_term']):
+            return None
+        document_types = (settings['filter'] or {}).get('document_type')
+        return self.search_index.candidate_rows(settings['search_term'], document_types)
+
+    def rank_by_vector(self, query_vectors, candidate_rows, depth):
+        '''
+        returns (chunk ids, distances) per query, nearest first, restricted to candidate_rows when given, and the
+        number of chunks fetched from the vector index (0 when the candidates were ranked exactly).
+        '''
+        settings = self.search_settings
+        restricted = bool(settings['filter'] or settings['search_term'])
+
+        scan_limit = int(self.config['database'].get('filter_scan_limit', 50000) or 0)
+        if candidate_rows is not None and len(candidate_rows) <= scan_limit:
+            return self.search_index.rank_rows(query_vectors, candidate_rows, self.read_vectors), 0
+
+        if self.search_index is not None and self.search_index.quantization != "none":
+            rescore = int(self.config['database'].get('rescore_candidates', 256) or 256)
+            return self.search_index.search(query_vectors, depth, self.read_vectors, candidate_rows, rescore), 0
+
+        if isinstance(self.db, NumpyVectorStore):
+            # the memory-mapped store is scanned exactly, so the candidates themselves can be searched
+            if candidate_rows is not None:
+                return self.db.search(query_vectors, depth, self.db.rows_for_ids(self.search_index.ids[candidate_rows])), 0
+            return self.db.search(query_vectors, max(depth, 20) if restricted else depth), 0
+
+        # otherwise over-fetch from the vector index, in proportion to how selective the filters are
+        if candidate_rows is not None:
+            total_rows = len(self.search_index)
+            fetch_k = min(total_rows, max(depth, 20, math.ceil(2 * depth * total_rows / max(1, len(candidate_rows)))))
+        elif restricted:
+            fetch_k = max(depth, 20)
+        else:
+            fetch_k = depth
+
+        distances, ids = self.db.vector_index.query(query_vectors, k=fetch_k, **settings['query_kwargs'])
+        distances = np.asarray(distances)
+        ids = np.asarray(ids)
+
+        valid = ~((ids == MAX_UINT64) | ((ids == 0) & (distances == 0)))
+        if candidate_rows is not None:
+            valid &= np.isin(ids, np.asarray(self.search_index.ids[candidate_rows]))
+        ranked = [(query_ids[query_valid], query_distances[query_valid])
+                  for query_ids, query_distances, query_valid in zip(ids, distances, valid)]
+        return ranked, fetch_k
+
+    def lookup(self, query_vectors):
+        settings = self.search_settings
+        k = settings['k']
+
+        candidate_rows = self.find_candidate_rows()
+        ranked, fetch_k = self.rank_by_vector(query_vectors, candidate_rows, k)
+        results = self.collect_results(self.within_threshold(ranked))
+
+        if candidate_rows is not None and 0 < fetch_k < len(self.search_index):
+            # queries still short of k after over-fetching get an exact scan, unless the farthest candidate fetched is
+            # already past the threshold, in which case no unfetched candidate could pass it either
+            short = [i for i, (contexts, _, _) in enumerate(results)
+                     if len(contexts) < k and (len(ranked[i][1]) == 0 or ranked[i][1][-1] <= settings['score_threshold'])]
+            if short:
+                exact = self.search_index.rank_rows(query_vectors[short], candidate_rows, self.read_vectors)
+                for i, result in zip(short, self.collect_results(self.within_threshold(exact))):
+                    results[i] = result
+
+        return results
+
+    def hybrid_lookup(self, queries, query_vectors):
+        '''
+        fuses the vector ranking (limited by the similarity threshold) with a BM25 ranking of the query's words using
+        reciprocal rank fusion, so chunks containing exact terms such as case numbers are found even when their
+        vectors are not among the nearest.
+        '''
+        settings = self.search_settings
+        depth = max(4 * settings['k'], 20)
+        rrf_k = int(self.config['database'].get('rrf_k', 60) or 60)
+
+        candidate_rows = self.find_candidate_rows()
+        ranked, _ = self.rank_by_vector(query_vectors, candidate_rows, depth)
+        vector_rankings = [ids[:depth] for ids, _ in self.within_threshold(ranked)]
+
+        fused = []
+        for query, vector_ranking in zip(queries, vector_rankings):
+            lexical_ranking, _ = self.search_index.bm25(query, candidate_rows, limit=depth)
+            fused.append(reciprocal_rank_fusion([vector_ranking, lexical_ranking], rrf_k))
+
+        return self.collect_results(fused)
+
+    def search_many(self, queries, with_scores=False):
+        '''
+        embeds all queries in one batch, looks them up in the index with a single query and returns a
+        (contexts, metadata_list) tuple per query, in the same order as the queries, or (contexts, metadata_list,
+        scores) with_scores. queries whose embedding and search settings were seen before are answered from the
+        result cache.
+        '''
+        queries = list(queries)
+        if not queries:
+            return []
+        if not self.begin_search():
+            # unloaded after it was handed out, e.g. because its database is being rebuilt
+            return self.get_instance(self.selected_database).search_many(queries, with_scores)
+        try:
+            return self.search_loaded(queries, with_scores)
+        finally:
+            self.end_search()
+
+    def search_loaded(self, queries, with_scores):
+        query_vectors = self.embed_queries(queries)
+        cache_keys = [self.result_cache_key(query_vector, query) for query_vector, query in zip(query_vectors, queries)]
+        results = [self._result_cache.get(cache_key) for cache_key in cache_keys]
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            if self.search_settings['search_type'] == "hybrid" and self.search_index is not None:
+                pending_results = self.hybrid_lookup([queries[i] for i in pending], query_vectors[pending])
+            else:
+                pending_results = self.lookup(query_vectors[pending])
+            if self.search_settings['rerank']:
+                pending_results = [self.rerank(queries[i], result) for i, result in zip(pending, pending_results)]
+            for i, result in zip(pending, pending_results):
+                self._result_cache.put(cache_keys[i], result)
+                results[i] = result
+
+        # copies, so callers can modify what they get back without changing the cached entry
+        if with_scores:
+            return [(list(contexts), [dict(metadata) for metadata in metadata_list], list(scores))
+                    for contexts, metadata_list, scores in results]
+        return [(list(contexts), [dict(metadata) for metadata in metadata_list]) for contexts, metadata_list, _ in results]
+
+    def rerank(self, query, result):
+        '''
+        reorders one query's retrieved chunks with the cross-encoder and keeps the best 'contexts'; their scores become
+        the cross-encoder's. if the reranker cannot run, the retrieval order is kept.
+        '''
+        contexts, metadata_list, scores = result
+        settings = self.search_settings
+        if not contexts:
+            return result
+
+        try:
+            reranker = get_reranker(settings['rerank']['model'], self.compute_device)
+            order, rerank_scores = reranker.rerank(query, contexts, settings['contexts'],
+                                                   settings['rerank']['batch_size'], settings['rerank']['time_budget'])
+        except Exception as e:
+            logging.warning(f"Reranking failed, keeping the retrieval order: {e}")
+            return contexts[:settings['contexts']], metadata_list[:settings['contexts']], scores[:settings['contexts']]
+
+        return [contexts[i] for i in order], [metadata_list[i] for i in order], [float(score) for score in rerank_scores]
+
     def search(self, query):
-        relevant_contexts = self.retriever.invoke(input=query)
-        
-        search_term = self.config['database'].get('search_term', '').lower()
-        filtered_contexts = [doc for doc in relevant_contexts if search_term in doc.page_content.lower()]
-        
-        contexts = [document.page_content for document in filtered_contexts]
-        metadata_list = [document.metadata for document in filtered_contexts]
-        
-        return contexts, metadata_list
\ No newline at end of file
+        return self.search_many([query])[0]
+
+    @classmethod
+    def search_databases(cls, selected_databases, query):
+        '''
+        searches several databases for one query in parallel and merges their results by score into a single top k.
+        scores are cosine similarities (see within_threshold for databases with unnormalized vectors), normalized fusion
+        scores for hybrid searches or cross-encoder scores when reranking, so they compare across databases. each chunk's metadata gets the name of the database it came from.
+        '''
+        selected_databases = list(dict.fromkeys(selected_databases))
+        instances = cls.get_instances(selected_databases)
+
+        # the query is embedded once per model up front; the parallel searches then find it in the embedding cache
+        embedded_models = set()
+        for instance in instances:
+            if instance.model_path not in embedded_models and instance.begin_search():
+                try:
+                    instance.embed_queries([query])
+                finally:
+                    instance.end_search()
+                embedded_models.add(instance.model_path)
+
+        with ThreadPoolExecutor(max_workers=len(instances), thread_name_prefix="database_search") as executor:
+            results = list(executor.map(lambda instance: instance.search_many([query], with_scores=True)[0], instances))
+
+        merged = []
+        for name, (contexts, metadata_list, scores) in zip(selected_databases, results):
+            for context, metadata, score in zip(contexts, metadata_list, scores):
+                metadata['database'] = name
+                merged.append((score, context, metadata))
+        merged.sort(key=lambda result: result[0], reverse=True)
+        merged = merged[:instances[0].search_settings['contexts']] if instances else []
+
+        return [context for _, context, _ in merged], [metadata for _, _, metadata in merged]
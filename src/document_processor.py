@@ -4,9 +4,11 @@ import warnings
 import yaml
 import math
 import tqdm
+from bisect import bisect_right
+from itertools import islice
 from collections import defaultdict
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed, ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from langchain_community.docstore.document import Document
 from langchain_text_splitters.character import RecursiveCharacterTextSplitter
@@ -50,7 +52,22 @@ INGEST_THREADS = max(4, os.cpu_count() - 4)
 for ext, loader_name in DOCUMENT_LOADERS.items():
     DOCUMENT_LOADERS[ext] = globals()[loader_name]
 
-def load_single_document(file_path: Path) -> Document:
+def get_pdf_options():
+    '''
+    reads the page-parallel extraction settings that are handed to the patched PyMuPDFParser.
+    '''
+    with open("config.yaml", "r", encoding='utf-8') as config_file:
+        config = yaml.safe_load(config_file)
+    database_config = config.get("database", {})
+    page_workers = int(database_config.get("pdf_page_workers", 0) or 0)
+    if page_workers <= 1:
+        return {}
+    return {
+        "page_workers": page_workers,
+        "pages_per_worker": int(database_config.get("pdf_pages_per_worker", 250) or 250)
+    }
+
+def load_single_document(file_path: Path, pdf_options=None) -> Document:
     '''
     loads a single document file using the appropriate loader based on its file
     extension, extracts metadata, and returns a Document object.
@@ -72,6 +89,8 @@ def load_single_document(file_path: Path) -> Document:
             "encoding": "utf-8",
             "autodetect_encoding": True
         })
+    elif file_extension == ".pdf" and pdf_options:
+        loader_options.update(pdf_options)
 
     loader = loader_class(str(file_path), **loader_options)
 
@@ -85,23 +104,27 @@ def load_single_document(file_path: Path) -> Document:
     
     return document
 
-def load_document_batch(filepaths, threads_per_process):
+def load_document_batch(filepaths, threads_per_process, pdf_options=None):
     '''
     takes a batch of file paths and uses multi-threading to load multiple documents concurrently,
     returning a list of loaded Document objects and their corresponding file paths.
     '''
     with ThreadPoolExecutor(threads_per_process) as exe:
-        futures = [exe.submit(load_single_document, name) for name in filepaths]
+        futures = [exe.submit(load_single_document, name, pdf_options) for name in filepaths]
         data_list = [future.result() for future in futures]
     return (data_list, filepaths)
 
-def load_documents(source_dir: Path) -> list:
+def get_document_paths(source_dir: Path, file_paths=None) -> list:
+    all_files = list(source_dir.iterdir()) if file_paths is None else list(file_paths)
+    return [f for f in all_files if f.suffix.lower() in (key.lower() for key in DOCUMENT_LOADERS.keys())]
+
+def load_documents(source_dir: Path, file_paths=None) -> list:
     '''
     scans a source directory for supported document types, divides the workload among multiple processes, and
     uses the loadDocumentBatch function to efficiently load all documents in parallel.
+    if file_paths is provided, only those files are considered (used when updating an existing database).
     '''
-    all_files = list(source_dir.iterdir())
-    doc_paths = [f for f in all_files if f.suffix.lower() in (key.lower() for key in DOCUMENT_LOADERS.keys())]
+    doc_paths = get_document_paths(source_dir, file_paths)
     
     docs = []
 
@@ -111,13 +134,14 @@ def load_documents(source_dir: Path) -> list:
         total_cores = os.cpu_count()
         max_threads = max(4, total_cores - 8)
         threads_per_process = 1
+        pdf_options = get_pdf_options()
         
         with ProcessPoolExecutor(n_workers) as executor:
             chunksize = math.ceil(len(doc_paths) / n_workers)
             futures = []
             for i in range(0, len(doc_paths), chunksize):
                 chunk_paths = doc_paths[i:i + chunksize]
-                futures.append(executor.submit(load_document_batch, chunk_paths, threads_per_process))
+                futures.append(executor.submit(load_document_batch, chunk_paths, threads_per_process, pdf_options))
             
             for future in as_completed(futures):
                 contents, _ = future.result()
@@ -125,22 +149,66 @@ def load_documents(source_dir: Path) -> list:
     
     return docs
 
-def split_documents(documents):
+def iter_documents(source_dir: Path, file_paths=None):
     '''
-    Uses a RecursiveCharacterTextSplitter from Langchain to split the input documents into smaller chunks
+    same as load_documents, but yields each document as soon as its file is loaded and keeps only a few files in
+    flight per worker process, so memory use does not grow with the number of files.
     '''
+    doc_paths = get_document_paths(source_dir, file_paths)
+    if not doc_paths:
+        return
+
+    n_workers = min(INGEST_THREADS, len(doc_paths))
+    remaining_paths = iter(doc_paths)
+    pdf_options = get_pdf_options()
+
+    with ProcessPoolExecutor(n_workers) as executor:
+        pending = {executor.submit(load_single_document, path, pdf_options) for path in islice(remaining_paths, n_workers * 2)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                next_path = next(remaining_paths, None)
+                if next_path is not None:
+                    pending.add(executor.submit(load_single_document, next_path, pdf_options))
+                yield future.result()
+
+def get_text_splitter(chunk_size=None, chunk_overlap=None):
     with open("config.yaml", "r", encoding='utf-8') as config_file:
         config = yaml.safe_load(config_file)
-        chunk_size = config["database"]["chunk_size"]
-        chunk_overlap = config["database"]["chunk_overlap"]
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    for i, doc in enumerate(documents):
-        if not isinstance(doc.page_content, str):
-            documents[i].page_content = str(doc.page_content)
+        chunk_size = chunk_size or config["database"]["chunk_size"]
+        chunk_overlap = config["database"]["chunk_overlap"] if chunk_overlap is None else chunk_overlap
+
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+
+def split_document(text_splitter, document):
+    '''
+    splits one document; when the loader recorded where each page starts (pdfs), every chunk gets the page number
+    its text starts on and the page offsets themselves are dropped rather than copied into every chunk.
+    '''
+    if not isinstance(document.page_content, str):
+        document.page_content = str(document.page_content)
+
+    page_starts = document.metadata.pop("page_starts", None)
+    chunks = text_splitter.split_documents([document])
+
+    if page_starts:
+        for chunk in chunks:
+            start_index = chunk.metadata.get("start_index", -1)
+            if start_index >= 0:
+                chunk.metadata["page_number"] = bisect_right(page_starts, start_index)
+
+    return chunks
+
+def split_documents(documents, chunk_size=None, chunk_overlap=None):
+    '''
+    Uses a RecursiveCharacterTextSplitter from Langchain to split the input documents into smaller chunks
+    '''
+    text_splitter = get_text_splitter(chunk_size, chunk_overlap)
     
     print(f"\nSplitting {len(documents)} documents.")
-    texts = text_splitter.split_documents(documents)
+    texts = []
+    for doc in documents:
+        texts.extend(split_document(text_splitter, doc))
     print(f"Created {len(texts)} chunks.")
     
     return texts
\ No newline at end of file
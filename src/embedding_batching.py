@@ -0,0 +1,163 @@
+import logging
+import queue
+
+from langchain_core.embeddings import Embeddings
+from tqdm import tqdm
+
+
+class TokenBudgetEmbeddings(Embeddings):
+    '''
+    wraps a langchain embeddings object and embeds chunks in batches built from a token budget instead of a fixed
+    count. chunks are sorted by tokenized length so each batch pads to a similar length, and the vectors are
+    returned in the original order.
+    '''
+    def __init__(self, embeddings, token_budget):
+        self.embeddings = embeddings
+        self.token_budget = max(1, int(token_budget))
+        self.show_progress = True
+
+    def count_tokens(self, texts):
+        client = self.embeddings.client
+        encoded = client.tokenizer(
+            texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=client.max_seq_length,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        return [len(input_ids) for input_ids in encoded['input_ids']]
+
+    def make_batches(self, lengths):
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        batch = []
+        batch_max_length = 0
+
+        for i in order:
+            longest = max(batch_max_length, lengths[i])
+            # padded size of the batch is its longest chunk times the number of chunks
+            if batch and longest * (len(batch) + 1) > self.token_budget:
+                batches.append(batch)
+                batch = []
+                longest = lengths[i]
+            batch.append(i)
+            batch_max_length = longest
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+
+        batches = self.make_batches(self.count_tokens(texts))
+        vectors = [None] * len(texts)
+
+        encode_kwargs = self.embeddings.encode_kwargs
+        original_encode_kwargs = dict(encode_kwargs)
+        has_show_progress = hasattr(self.embeddings, 'show_progress')
+        original_show_progress = getattr(self.embeddings, 'show_progress', None)
+
+        try:
+            # progress is reported per chunk below rather than per batch by sentence-transformers
+            if has_show_progress:
+                self.embeddings.show_progress = False
+            else:
+                encode_kwargs['show_progress_bar'] = False
+
+            with tqdm(total=len(texts), unit="chunk", desc="Computing vectors", disable=not self.show_progress) as progress_bar:
+                for batch in batches:
+                    encode_kwargs['batch_size'] = len(batch)
+                    batch_vectors = self.embeddings.embed_documents([texts[i] for i in batch])
+                    for i, vector in zip(batch, batch_vectors):
+                        vectors[i] = vector
+                    progress_bar.update(len(batch))
+        finally:
+            encode_kwargs.clear()
+            encode_kwargs.update(original_encode_kwargs)
+            if has_show_progress:
+                self.embeddings.show_progress = original_show_progress
+
+        return vectors
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+class MultiProcessEmbeddings(TokenBudgetEmbeddings):
+    '''
+    cpu-only variant that sends each token-budget batch to a pool of worker processes, each pinned to a fixed
+    number of torch threads. at most a few batches per worker are in flight so the queues stay small, and the
+    vectors are put back in the original order as they arrive. the workers are checked whenever no result has
+    arrived for poll_interval seconds, so a crashed worker raises an error instead of leaving the ingest waiting.
+    '''
+    poll_interval = 5.0
+
+    def __init__(self, embeddings, token_budget, num_processes, threads_per_process):
+        super().__init__(embeddings, token_budget)
+        self.num_processes = max(1, int(num_processes))
+        self.threads_per_process = max(1, int(threads_per_process))
+        self.max_in_flight = self.num_processes * 4
+        self.pool = None
+
+    def start(self):
+        if self.pool is None:
+            self.pool = self.embeddings.client.start_multi_process_pool(
+                target_devices=["cpu"] * self.num_processes,
+                threads_per_process=self.threads_per_process
+            )
+
+    def close(self):
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            try:
+                self.embeddings.client.stop_multi_process_pool(pool)
+            except Exception as e:
+                logging.warning(f"Could not stop the embedding processes cleanly: {e}")
+
+    def wait_for_batch(self, output_queue):
+        while True:
+            try:
+                return output_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                dead = [process for process in self.pool["processes"] if not process.is_alive()]
+                if dead:
+                    names = ", ".join(f"{process.name} (pid {process.pid}, exit code {process.exitcode})" for process in dead)
+                    # a broken pool is discarded so the next run starts new workers
+                    self.close()
+                    raise RuntimeError(f"Embedding worker process died: {names}")
+
+    def embed_documents(self, texts):
+        # same preprocessing the langchain wrappers apply before calling encode
+        embed_instruction = getattr(self.embeddings, 'embed_instruction', '')
+        texts = [embed_instruction + text.replace("\n", " ") for text in texts]
+        if not texts:
+            return []
+
+        self.start()
+        batches = self.make_batches(self.count_tokens(texts))
+        vectors = [None] * len(texts)
+        normalize_embeddings = self.embeddings.encode_kwargs.get('normalize_embeddings', False)
+        input_queue = self.pool["input"]
+        output_queue = self.pool["output"]
+
+        next_batch = 0
+        in_flight = 0
+        with tqdm(total=len(texts), unit="chunk", desc=f"Computing vectors ({self.num_processes} processes)", disable=not self.show_progress) as progress_bar:
+            while next_batch < len(batches) or in_flight:
+                while next_batch < len(batches) and in_flight < self.max_in_flight:
+                    batch = batches[next_batch]
+                    input_queue.put([next_batch, len(batch), [texts[i] for i in batch], None, None, "float32", normalize_embeddings])
+                    next_batch += 1
+                    in_flight += 1
+
+                batch_id, batch_vectors = self.wait_for_batch(output_queue)
+                in_flight -= 1
+                for i, vector in zip(batches[batch_id], batch_vectors):
+                    vectors[i] = vector.tolist()
+                progress_bar.update(len(batches[batch_id]))
+
+        return vectors
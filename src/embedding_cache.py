@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utilities import my_cprint
+
+KEY_DTYPE = 'S32'
+GROWTH_ROWS = 4096
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32].encode('ascii')
+
+
+def get_cache_directory(model_name):
+    return Path.cwd() / "Models" / "vector" / "embedding_cache" / str(model_name).replace('/', '_').replace('\\', '_')
+
+
+class EmbeddingCache:
+    '''
+    vectors live in a memory-mapped float32 file (vectors.f32) and each row is keyed by a hash of the chunk text
+    stored in keys.npy. one cache directory is used per embedding model, so keys only need to cover the text. once
+    max_entries is reached the least recently used rows are overwritten.
+    '''
+    def __init__(self, cache_dir, max_entries):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.cache_dir / "vectors.f32"
+        self.keys_path = self.cache_dir / "keys.npy"
+        self.last_used_path = self.cache_dir / "last_used.npy"
+        self.meta_path = self.cache_dir / "index.json"
+        self.max_entries = int(max_entries)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.reset()
+        try:
+            self.load()
+        except Exception as e:
+            logging.warning(f"Discarding unreadable embedding cache in {self.cache_dir}: {e}")
+            self.reset()
+
+    def reset(self):
+        self.dimensions = None
+        self.rows = 0
+        self.tick = 0
+        self.vectors = None
+        self.keys = np.zeros(0, dtype=KEY_DTYPE)
+        self.last_used = np.zeros(0, dtype=np.int64)
+        self.slots = {}
+
+    def load(self):
+        if not self.meta_path.exists():
+            return
+        with open(self.meta_path, 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+
+        rows = int(meta['rows'])
+        dimensions = int(meta['dimensions'])
+        keys = np.load(self.keys_path)
+        last_used = np.load(self.last_used_path)
+        if len(keys) != rows or len(last_used) != rows or self.vectors_path.stat().st_size != rows * dimensions * 4:
+            raise ValueError("cache files are out of sync")
+
+        self.dimensions = dimensions
+        self.rows = rows
+        self.tick = int(meta['tick'])
+        self.keys = keys.astype(KEY_DTYPE)
+        self.last_used = last_used.astype(np.int64)
+        self.slots = {key: slot for slot, key in enumerate(self.keys.tolist()) if key}
+        if rows:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(rows, dimensions))
+
+    def save(self):
+        if self.dimensions is None:
+            return
+        if self.vectors is not None:
+            self.vectors.flush()
+        np.save(self.keys_path, self.keys)
+        np.save(self.last_used_path, self.last_used)
+        with open(self.meta_path, 'w', encoding='utf-8') as file:
+            json.dump({'rows': self.rows, 'dimensions': self.dimensions, 'tick': self.tick}, file)
+
+    def close(self):
+        self.save()
+        self.vectors = None
+
+    def grow(self, needed_rows):
+        new_rows = min(self.max_entries, max(needed_rows, self.rows * 2, GROWTH_ROWS))
+        if new_rows <= self.rows:
+            return
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.vectors_path, 'r+b' if self.vectors_path.exists() else 'wb') as file:
+            file.truncate(new_rows * self.dimensions * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(new_rows, self.dimensions))
+        self.keys = np.concatenate([self.keys, np.zeros(new_rows - self.rows, dtype=KEY_DTYPE)])
+        self.last_used = np.concatenate([self.last_used, np.zeros(new_rows - self.rows, dtype=np.int64)])
+        self.rows = new_rows
+
+    def allocate_slots(self, count):
+        used = len(self.slots)
+        if used + count > self.rows:
+            self.grow(used + count)
+
+        free = list(range(used, min(used + count, self.rows)))
+        shortfall = count - len(free)
+        if shortfall > 0:
+            # overwrite the least recently used rows
+            victims = np.argpartition(self.last_used[:used], shortfall - 1)[:shortfall]
+            for slot in victims.tolist():
+                del self.slots[self.keys[slot]]
+                self.keys[slot] = b''
+            self.evictions += shortfall
+            free.extend(victims.tolist())
+        return free
+
+    def get_many(self, texts):
+        self.tick += 1
+        results = []
+        for text in texts:
+            slot = self.slots.get(hash_text(text))
+            if slot is None:
+                self.misses += 1
+                results.append(None)
+            else:
+                self.hits += 1
+                self.last_used[slot] = self.tick
+                results.append(np.array(self.vectors[slot]))
+        return results
+
+    def put_many(self, texts, vectors):
+        if self.max_entries <= 0 or not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        elif vectors.shape[1] != self.dimensions:
+            logging.warning("Embedding dimensions changed; clearing embedding cache.")
+            self.vectors = None
+            for path in (self.vectors_path, self.keys_path, self.last_used_path, self.meta_path):
+                path.unlink(missing_ok=True)
+            self.reset()
+            self.dimensions = vectors.shape[1]
+
+        new_items = {}
+        for text, vector in zip(texts, vectors):
+            key = hash_text(text)
+            if key not in self.slots:
+                new_items[key] = vector
+        new_items = list(new_items.items())[:self.max_entries]
+        if not new_items:
+            return
+
+        self.tick += 1
+        slots = self.allocate_slots(len(new_items))
+        for slot, (key, vector) in zip(slots, new_items):
+            self.vectors[slot] = vector
+            self.keys[slot] = key
+            self.last_used[slot] = self.tick
+            self.slots[key] = slot
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.slots),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def print_stats(self):
+        stats = self.get_stats()
+        my_cprint(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), "
+                  f"{stats['evictions']} evictions, {stats['entries']} entries stored.", "yellow")
+
+
+class CachedEmbeddings(Embeddings):
+    '''
+    wraps a langchain embeddings object so that embed_documents only computes vectors for chunks missing from the cache.
+    '''
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = self.cache.get_many(texts)
+
+        missing_texts = list(dict.fromkeys(texts[i] for i, vector in enumerate(vectors) if vector is None))
+        if missing_texts:
+            computed = dict(zip(missing_texts, self.embeddings.embed_documents(missing_texts)))
+            self.cache.put_many(list(computed), list(computed.values()))
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
@@ -2,12 +2,15 @@ import logging
 from pathlib import Path
 
 import yaml
-from PySide6.QtCore import Signal, QObject
+from PySide6.QtCore import Signal, QObject, QTimer
+from PySide6.QtGui import QTextCursor
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QTextEdit, QPushButton, QCheckBox, QHBoxLayout, QMessageBox,
-                               QApplication, QComboBox)
+                               QApplication, QComboBox, QToolButton, QMenu, QLabel)
 
 from utilities import check_preconditions_for_submit_question
 from chat_kobold import KoboldChat
+from conversation import ConversationSession
+from database_interactions import QueryVectorDB
 
 logging.basicConfig(level=logging.DEBUG, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -38,6 +41,12 @@ class DatabaseQueryTab(QWidget):
         self.initWidgets()
         self.setup_signals()
         self.kobold_chat = None
+        self.conversation = None
+        self.response_started = False
+
+        self.idle_timer = QTimer(self)
+        self.idle_timer.timeout.connect(QueryVectorDB.unload_idle)
+        self.idle_timer.start(60 * 1000)
 
     def initWidgets(self):
         layout = QVBoxLayout(self)
@@ -52,6 +61,19 @@ class DatabaseQueryTab(QWidget):
         self.database_pulldown.addItems(self.load_created_databases())
         hbox1_layout.addWidget(self.database_pulldown)
 
+        # further databases searched together with the one in the pulldown
+        self.also_search_menu = QMenu(self)
+        self.also_search_menu.aboutToShow.connect(self.refresh_also_search_menu)
+        self.also_search_button = QToolButton()
+        self.also_search_button.setText("Also Search")
+        self.also_search_button.setToolTip("Search these databases too; their results are merged by score.")
+        self.also_search_button.setPopupMode(QToolButton.InstantPopup)
+        self.also_search_button.setMenu(self.also_search_menu)
+        hbox1_layout.addWidget(self.also_search_button)
+
+        self.generation_stats_label = QLabel()
+        hbox1_layout.addWidget(self.generation_stats_label)
+
         layout.addLayout(hbox1_layout)
 
         self.text_input = QTextEdit()
@@ -66,6 +88,17 @@ class DatabaseQueryTab(QWidget):
         self.chunks_only_checkbox = QCheckBox("Chunks Only")
         hbox2_layout.addWidget(self.chunks_only_checkbox)
 
+        self.conversation_checkbox = QCheckBox("Conversation")
+        self.conversation_checkbox.setToolTip("Answer follow-up questions with the earlier questions and answers, "
+                                              "reusing the contexts already retrieved where they cover the question.")
+        self.conversation_checkbox.toggled.connect(self.on_conversation_toggled)
+        hbox2_layout.addWidget(self.conversation_checkbox)
+
+        self.new_conversation_button = QPushButton("New Conversation")
+        self.new_conversation_button.setEnabled(False)
+        self.new_conversation_button.clicked.connect(self.on_new_conversation_clicked)
+        hbox2_layout.addWidget(self.new_conversation_button)
+
         self.submit_button = QPushButton("Submit Question")
         self.submit_button.clicked.connect(self.on_submit_button_clicked)
         hbox2_layout.addWidget(self.submit_button)
@@ -85,6 +118,17 @@ class DatabaseQueryTab(QWidget):
                 return list(config.get('created_databases', {}).keys())
         return []
 
+    def refresh_also_search_menu(self):
+        checked = set(self.also_searched_databases())
+        self.also_search_menu.clear()
+        for name in self.load_created_databases():
+            action = self.also_search_menu.addAction(name)
+            action.setCheckable(True)
+            action.setChecked(name in checked)
+
+    def also_searched_databases(self):
+        return [action.text() for action in self.also_search_menu.actions() if action.isChecked()]
+
     def on_submit_button_clicked(self):
         if self.kobold_chat is not None:
             return
@@ -98,21 +142,38 @@ class DatabaseQueryTab(QWidget):
         self.submit_button.setDisabled(True)
         user_question = self.text_input.toPlainText()
         chunks_only = self.chunks_only_checkbox.isChecked()
-        selected_database = self.database_pulldown.currentText()
+        selected_databases = list(dict.fromkeys([self.database_pulldown.currentText(), *self.also_searched_databases()]))
 
         self.kobold_chat = KoboldChat()
         
         self.connect_kobold_chat_signals()
+        self.read_only_text.clear()
+        self.generation_stats_label.clear()
+        self.response_started = False
+
+        self.kobold_chat.ask_kobold(user_question, chunks_only, selected_databases, self.conversation)
 
-        self.kobold_chat.ask_kobold(user_question, chunks_only, selected_database)
+    def on_conversation_toggled(self, checked):
+        self.new_conversation_button.setEnabled(checked)
+        if checked:
+            kobold_config = KoboldChat.load_kobold_config()
+            self.conversation = ConversationSession(int(kobold_config.get('conversation_history_tokens', 1024)),
+                                                    float(kobold_config.get('conversation_reuse_overlap', 0.5)))
+        else:
+            self.conversation = None
 
+    def on_new_conversation_clicked(self):
+        if self.conversation is not None:
+            self.conversation.clear()
         self.read_only_text.clear()
+        self.generation_stats_label.clear()
 
     def connect_kobold_chat_signals(self):
         self.kobold_chat.signals.response_signal.connect(self.update_response)
         self.kobold_chat.signals.error_signal.connect(self.show_error_message)
         self.kobold_chat.signals.finished_signal.connect(self.on_submission_finished)
         self.kobold_chat.signals.citation_signal.connect(self.display_citations)
+        self.kobold_chat.signals.stats_signal.connect(self.display_generation_stats)
 
     def disconnect_kobold_chat_signals(self):
         if self.kobold_chat:
@@ -120,12 +181,25 @@ class DatabaseQueryTab(QWidget):
             self.kobold_chat.signals.error_signal.disconnect(self.show_error_message)
             self.kobold_chat.signals.finished_signal.disconnect(self.on_submission_finished)
             self.kobold_chat.signals.citation_signal.disconnect(self.display_citations)
+            self.kobold_chat.signals.stats_signal.disconnect(self.display_generation_stats)
 
     def update_response(self, response_chunk):
-        response_chunk = response_chunk.lstrip('\n')
+        # text arrives in batches of tokens, so the event loop is never forced to run per token
+        if not self.response_started:
+            response_chunk = response_chunk.lstrip('\n')
+            self.response_started = bool(response_chunk)
+        self.read_only_text.moveCursor(QTextCursor.End)
         self.read_only_text.insertPlainText(response_chunk)
         self.read_only_text.ensureCursorVisible()
-        QApplication.processEvents()
+
+    def display_generation_stats(self, stats):
+        if stats['time_to_first_token'] is None:
+            return
+        text = (f"{stats['tokens']} tokens | {stats['tokens_per_second']:.1f} tokens/s | "
+                f"first token {stats['time_to_first_token']:.2f} s")
+        if 'prefix_reuse' in stats:
+            text += f" | {stats['prefix_reuse']:.0%} of prompt reused"
+        self.generation_stats_label.setText(text)
 
     def display_citations(self, citations):
         self.read_only_text.append("\n\nCitations:\n" + citations)
@@ -2,7 +2,6 @@ import os
 import logging
 import warnings
 import platform
-import pickle
 import shutil
 from pathlib import Path
 
@@ -10,12 +9,13 @@ import yaml
 from PySide6.QtCore import QDir, Qt, QTimer, QThread, Signal, QRegularExpression
 from PySide6.QtGui import QAction, QRegularExpressionValidator
 from PySide6.QtWidgets import (QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QMessageBox, QTreeView, QFileSystemModel,
-                               QMenu, QGroupBox, QLineEdit, QGridLayout, QSizePolicy, QComboBox)
+                               QMenu, QGroupBox, QLineEdit, QGridLayout, QSizePolicy, QComboBox, QCheckBox)
 
 import database_interactions
 from choose_documents_and_vector_model import select_embedding_model_directory, choose_documents_directory
-from utilities import check_preconditions_for_db_creation, open_file, delete_file, backup_database
-from constants import VECTOR_MODELS
+from utilities import (check_preconditions_for_db_creation, check_preconditions_for_db_update, open_file, delete_file,
+                       backup_database)
+from constants import VECTOR_MODELS, UPDATE_DATABASE_TOOLTIP, REMOVE_UNCHOSEN_FILES_TOOLTIP
 
 datasets_logger = logging.getLogger('datasets')
 datasets_logger.setLevel(logging.WARNING)
@@ -28,19 +28,32 @@ logging.getLogger().setLevel(logging.WARNING)
 class CreateDatabaseThread(QThread):
     creationComplete = Signal()
     
-    def __init__(self, database_name, parent=None):
+    def __init__(self, database_name, update=False, remove_unchosen=False, parent=None):
         super().__init__(parent)
         self.database_name = database_name
+        self.update = update
+        self.remove_unchosen = remove_unchosen
 
     def run(self):
+        # searches already running on the database finish before its files are rewritten
+        database_interactions.QueryVectorDB.unload(self.database_name, wait=True)
+        database_interactions.QueryVectorDB.invalidate_cache(self.database_name)
         create_vector_db = database_interactions.CreateVectorDB(database_name=self.database_name)
-        create_vector_db.run() # initiates database creation
-        self.update_config_with_database_name()
-        backup_database()
+        try:
+            succeeded = create_vector_db.run(update=self.update, remove_unchosen=self.remove_unchosen) # initiates database creation or update
+        finally:
+            # a question asked during the rebuild may have loaded the old or half-written files again
+            database_interactions.QueryVectorDB.unload(self.database_name, wait=True)
+            database_interactions.QueryVectorDB.invalidate_cache(self.database_name)
+        if succeeded and not self.update:
+            self.update_config_with_database_name({**create_vector_db.index_parameters, 'vector_store': create_vector_db.vector_store,
+                                                   'quantization': create_vector_db.quantization, 'normalized': True})
+        if succeeded:
+            backup_database()
         
         self.creationComplete.emit()
 
-    def update_config_with_database_name(self):
+    def update_config_with_database_name(self, index_parameters):
         config_path = Path(__file__).resolve().parent / "config.yaml"
         if config_path.exists():
             with open(config_path, 'r', encoding='utf-8') as file:
@@ -56,7 +69,8 @@ class CreateDatabaseThread(QThread):
             config['created_databases'][self.database_name] = {
                 'model': model,
                 'chunk_size': chunk_size,
-                'chunk_overlap': chunk_overlap
+                'chunk_overlap': chunk_overlap,
+                **index_parameters
             }
 
             with open(config_path, 'w', encoding='utf-8') as file:
@@ -67,19 +81,6 @@ class CustomFileSystemModel(QFileSystemModel):
         super().__init__(parent)
         self.setFilter(QDir.Files)
 
-    def data(self, index, role=Qt.DisplayRole):
-        if role == Qt.DisplayRole and index.column() == 0:
-            file_path = super().filePath(index)
-            if file_path.endswith('.pkl'):
-                try:
-                    with open(file_path, 'rb') as file:
-                        document = pickle.load(file)
-                    return document.metadata.get('file_name', 'Unknown')
-                except Exception as e:
-                    print(f"Error unpickling file {file_path}: {e}")
-                    return "Error"
-        return super().data(index, role)
-
 class DatabasesTab(QWidget):
     def __init__(self):
         super().__init__()
@@ -118,11 +119,26 @@ class DatabasesTab(QWidget):
         self.database_name_input.setValidator(validator)
         hbox2.addWidget(self.database_name_input)
 
+        self.update_db_checkbox = QCheckBox("Update Existing Database")
+        self.update_db_checkbox.setToolTip(UPDATE_DATABASE_TOOLTIP)
+        hbox2.addWidget(self.update_db_checkbox)
+
+        self.remove_unchosen_checkbox = QCheckBox("Remove Unchosen Files")
+        self.remove_unchosen_checkbox.setToolTip(REMOVE_UNCHOSEN_FILES_TOOLTIP)
+        self.remove_unchosen_checkbox.setEnabled(False)
+        self.update_db_checkbox.toggled.connect(self.on_update_db_toggled)
+        hbox2.addWidget(self.remove_unchosen_checkbox)
+
         self.layout.addLayout(grid_layout_top_buttons)
         self.layout.addLayout(hbox2)
 
         self.sync_combobox_with_config()
 
+    def on_update_db_toggled(self, checked):
+        self.remove_unchosen_checkbox.setEnabled(checked)
+        if not checked:
+            self.remove_unchosen_checkbox.setChecked(False)
+
     def populate_model_combobox(self):
         self.model_combobox.clear()
         self.model_combobox.addItem("Select a model", None)
@@ -212,20 +228,7 @@ class DatabasesTab(QWidget):
         tree_view = self.sender()
         model = tree_view.model()
         file_path = model.filePath(index)
-        
-        if file_path.endswith('.pkl'):
-            try:
-                with open(file_path, 'rb') as file:
-                    document = pickle.load(file)
-                internal_file_path = document.metadata.get('file_path')
-                if internal_file_path and Path(internal_file_path).exists():
-                    open_file(internal_file_path)
-                else:
-                    QMessageBox.warning(self, "File Not Found", f"The file {internal_file_path} does not exist.")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not open the pickle file: {e}")
-        else:
-            open_file(file_path)
+        open_file(file_path)
 
     def on_context_menu(self, point):
         tree_view = self.sender()
@@ -245,7 +248,9 @@ class DatabasesTab(QWidget):
                 delete_file(file_path)
 
     def on_create_db_clicked(self):
-        if self.model_combobox.currentIndex() == 0:
+        update = self.update_db_checkbox.isChecked()
+        remove_unchosen = update and self.remove_unchosen_checkbox.isChecked()
+        if self.model_combobox.currentIndex() == 0 and not update:
             QMessageBox.warning(self, "No Model Selected", "Please select a model before creating a database.")
             return
 
@@ -254,26 +259,31 @@ class DatabasesTab(QWidget):
         self.choose_docs_button.setDisabled(True)
         self.model_combobox.setDisabled(True)
         self.database_name_input.setDisabled(True)
+        self.update_db_checkbox.setDisabled(True)
+        self.remove_unchosen_checkbox.setDisabled(True)
         
         database_name = self.database_name_input.text().strip()
         script_dir = Path(__file__).resolve().parent
         
         # check conditions
-        checks_passed, message = check_preconditions_for_db_creation(script_dir, database_name)
+        if update:
+            checks_passed, message = check_preconditions_for_db_update(script_dir, database_name, remove_unchosen)
+        else:
+            checks_passed, message = check_preconditions_for_db_creation(script_dir, database_name)
         
         # re-enable widgets if any condition fails
         if not checks_passed:
-            self.create_db_button.setDisabled(False)
-            self.choose_docs_button.setDisabled(False)
-            self.model_combobox.setDisabled(False)
-            self.database_name_input.setDisabled(False)
+            self.reenable_create_db_button()
             QMessageBox.warning(self, "Validation Failed", message)
             return
 
-        print(f"Database will be named: '{database_name}'")
+        if update:
+            print(f"Database '{database_name}' will be updated.")
+        else:
+            print(f"Database will be named: '{database_name}'")
         
         # start create database thread
-        self.create_database_thread = CreateDatabaseThread(database_name=database_name, parent=self)
+        self.create_database_thread = CreateDatabaseThread(database_name=database_name, update=update, remove_unchosen=remove_unchosen, parent=self)
         self.create_database_thread.creationComplete.connect(self.reenable_create_db_button)
         self.create_database_thread.start()
 
@@ -282,6 +292,8 @@ class DatabasesTab(QWidget):
         self.choose_docs_button.setDisabled(False)
         self.model_combobox.setDisabled(False)
         self.database_name_input.setDisabled(False)
+        self.update_db_checkbox.setDisabled(False)
+        self.remove_unchosen_checkbox.setEnabled(self.update_db_checkbox.isChecked())
 
     def toggle_group_box(self, group_box, checked):
         self.groups[group_box] = 1 if checked else 0
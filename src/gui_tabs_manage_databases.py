@@ -8,16 +8,26 @@ from PySide6.QtGui import QAction
 from PySide6.QtWidgets import (QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QTreeView, QFileSystemModel, QMenu,
                                QGroupBox, QLabel, QComboBox, QMessageBox)
 
+from chunk_store import ChunkStore
+from database_interactions import QueryVectorDB
 from utilities import open_file
 
 class CustomFileSystemModel(QFileSystemModel):
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.file_names = {}
+
+    def load_file_names(self, database_directory):
+        # names come from the chunk store's file index, so repaints don't have to parse each json file
+        self.file_names = ChunkStore(database_directory / "chunks").file_names()
 
     def data(self, index, role=Qt.ItemDataRole.DisplayRole):
         if role == Qt.ItemDataRole.DisplayRole and index.column() == 0:
             file_path = self.filePath(index)
             if file_path.endswith('.json'):
+                file_name = self.file_names.get(Path(file_path).stem)
+                if file_name:
+                    return file_name
                 try:
                     with open(file_path, 'r', encoding='utf-8') as file:
                         return json.load(file)['metadata'].get('file_name', 'Unknown')
@@ -98,6 +108,7 @@ class ManageDatabasesTab(QWidget):
             self.documents_group_box.show()
             new_path = Path(__file__).resolve().parent / "Vector_DB" / selected_database / "json"
             if new_path.exists():
+                self.model.load_file_names(new_path.parent)
                 self.model.setRootPath(str(new_path))
                 self.tree_view.setRootIndex(self.model.index(str(new_path)))
                 if self.config_path.exists():
@@ -108,7 +119,10 @@ class ManageDatabasesTab(QWidget):
                         model_name = model_path.split('/')[-1]
                         chunk_size = db_config.get('chunk_size', '')
                         chunk_overlap = db_config.get('chunk_overlap', '')
-                        info_text = f"{model_name}    |    Chunk Size:  {chunk_size}    |    Chunk Overlap:  {chunk_overlap}"
+                        index_type = db_config.get('index_type', 'FLAT')
+                        if 'partitions' in db_config:
+                            index_type = f"{index_type} ({db_config['partitions']} partitions)"
+                        info_text = f"{model_name}    |    Chunk Size:  {chunk_size}    |    Chunk Overlap:  {chunk_overlap}    |    Index:  {index_type}"
                         self.database_info_label.setText(info_text)
                 else:
                     self.database_info_label.setText("Configuration missing.")
@@ -159,6 +173,8 @@ class ManageDatabasesTab(QWidget):
 
         if reply == QMessageBox.Ok:
             self.model.setRootPath('')
+            QueryVectorDB.unload(selected_database, wait=True)
+            QueryVectorDB.invalidate_cache(selected_database)
 
             if self.config_path.exists():
                 with open(self.config_path, 'r', encoding='utf-8') as file:
@@ -3,6 +3,8 @@ from PySide6.QtCore import Qt
 from PySide6.QtGui import QIntValidator
 from PySide6.QtWidgets import QWidget, QLabel, QLineEdit, QGridLayout, QSizePolicy, QComboBox
 
+from constants import INDEX_TYPES, INDEX_TYPE_TOOLTIP, QUANTIZATION_TYPES, QUANTIZATION_TOOLTIP, VECTOR_STORES, VECTOR_STORE_TOOLTIP
+
 class ChunkSettingsTab(QWidget):
     def __init__(self):
         super(ChunkSettingsTab, self).__init__()
@@ -46,6 +48,45 @@ class ChunkSettingsTab(QWidget):
         current_overlap = self.database_config.get('chunk_overlap', '')
         self.current_overlap_label = QLabel(f"{current_overlap}")
         grid_layout.addWidget(self.current_overlap_label, 0, 7)
+
+        # Index type and current setting
+        self.index_type = self.database_config.get('index_type', 'FLAT')
+        self.index_type_label = QLabel("Index Type:")
+        grid_layout.addWidget(self.index_type_label, 1, 0)
+        self.current_index_type_label = QLabel(f"{self.index_type}")
+        grid_layout.addWidget(self.current_index_type_label, 1, 1)
+        self.index_type_combo = QComboBox()
+        self.index_type_combo.addItems(INDEX_TYPES)
+        if self.index_type in INDEX_TYPES:
+            self.index_type_combo.setCurrentIndex(INDEX_TYPES.index(self.index_type))
+        self.index_type_combo.setToolTip(INDEX_TYPE_TOOLTIP)
+        grid_layout.addWidget(self.index_type_combo, 1, 2)
+
+        # Quantization and current setting
+        self.quantization = self.database_config.get('quantization', 'none')
+        self.quantization_label = QLabel("Quantization:")
+        grid_layout.addWidget(self.quantization_label, 1, 3)
+        self.current_quantization_label = QLabel(f"{self.quantization}")
+        grid_layout.addWidget(self.current_quantization_label, 1, 4)
+        self.quantization_combo = QComboBox()
+        self.quantization_combo.addItems(QUANTIZATION_TYPES)
+        if self.quantization in QUANTIZATION_TYPES:
+            self.quantization_combo.setCurrentIndex(QUANTIZATION_TYPES.index(self.quantization))
+        self.quantization_combo.setToolTip(QUANTIZATION_TOOLTIP)
+        grid_layout.addWidget(self.quantization_combo, 1, 5)
+
+        # Vector store and current setting
+        self.vector_store = self.database_config.get('vector_store', 'tiledb')
+        self.vector_store_label = QLabel("Vector Store:")
+        grid_layout.addWidget(self.vector_store_label, 1, 6)
+        self.current_vector_store_label = QLabel(f"{self.vector_store}")
+        grid_layout.addWidget(self.current_vector_store_label, 1, 7)
+        self.vector_store_combo = QComboBox()
+        self.vector_store_combo.addItems(VECTOR_STORES)
+        if self.vector_store in VECTOR_STORES:
+            self.vector_store_combo.setCurrentIndex(VECTOR_STORES.index(self.vector_store))
+        self.vector_store_combo.setToolTip(VECTOR_STORE_TOOLTIP)
+        grid_layout.addWidget(self.vector_store_combo, 1, 8)
         
         self.setLayout(grid_layout)
 
@@ -62,6 +103,27 @@ class ChunkSettingsTab(QWidget):
             self.database_creation_device = new_device
             self.current_device_label.setText(f"{new_device}")
 
+        new_index_type = self.index_type_combo.currentText()
+        if new_index_type != self.index_type:
+            settings_changed = True
+            config_data['database']['index_type'] = new_index_type
+            self.index_type = new_index_type
+            self.current_index_type_label.setText(f"{new_index_type}")
+
+        new_quantization = self.quantization_combo.currentText()
+        if new_quantization != self.quantization:
+            settings_changed = True
+            config_data['database']['quantization'] = new_quantization
+            self.quantization = new_quantization
+            self.current_quantization_label.setText(f"{new_quantization}")
+
+        new_vector_store = self.vector_store_combo.currentText()
+        if new_vector_store != self.vector_store:
+            settings_changed = True
+            config_data['database']['vector_store'] = new_vector_store
+            self.vector_store = new_vector_store
+            self.current_vector_store_label.setText(f"{new_vector_store}")
+
         new_chunk_overlap = self.chunk_overlap_edit.text()
         if new_chunk_overlap and new_chunk_overlap != str(self.database_config.get('chunk_overlap', '')):
             settings_changed = True
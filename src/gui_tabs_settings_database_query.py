@@ -1,6 +1,8 @@
 import yaml
 from PySide6.QtGui import QIntValidator, QDoubleValidator
-from PySide6.QtWidgets import QWidget, QLabel, QLineEdit, QGridLayout, QSizePolicy, QComboBox, QPushButton
+from PySide6.QtWidgets import QWidget, QLabel, QLineEdit, QGridLayout, QSizePolicy, QComboBox, QPushButton, QCheckBox
+
+from constants import SEARCH_TYPES, SEARCH_TYPE_TOOLTIP, RERANK_TOOLTIP
 
 class DatabaseSettingsTab(QWidget):
     def __init__(self):
@@ -80,6 +82,33 @@ class DatabaseSettingsTab(QWidget):
         grid_layout.addWidget(QLabel("File Type:"), 1, 3)
         grid_layout.addWidget(self.file_type_combo, 1, 4)
 
+        # number of IVF_FLAT partitions searched per query; ignored by FLAT databases
+        nprobe_value = self.database_config.get('nprobe', '')
+        self.nprobe_edit = QLineEdit()
+        self.nprobe_edit.setPlaceholderText("Enter new nprobe...")
+        self.nprobe_edit.setValidator(QIntValidator(1, 100000))
+        self.nprobe_edit.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.nprobe_label = QLabel(f"Nprobe: {nprobe_value}")
+        self.nprobe_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        grid_layout.addWidget(self.nprobe_label, 2, 0)
+        grid_layout.addWidget(self.nprobe_edit, 2, 1)
+        self.field_data['nprobe'] = self.nprobe_edit
+        self.label_data['nprobe'] = self.nprobe_label
+
+        self.search_type = self.database_config.get('search_type', 'similarity')
+        self.search_type_combo = QComboBox()
+        self.search_type_combo.addItems(SEARCH_TYPES)
+        if self.search_type in SEARCH_TYPES:
+            self.search_type_combo.setCurrentIndex(SEARCH_TYPES.index(self.search_type))
+        self.search_type_combo.setToolTip(SEARCH_TYPE_TOOLTIP)
+        grid_layout.addWidget(QLabel("Search Type:"), 2, 2)
+        grid_layout.addWidget(self.search_type_combo, 2, 3)
+
+        self.rerank_checkbox = QCheckBox("Rerank")
+        self.rerank_checkbox.setChecked(bool(self.database_config.get('rerank', False)))
+        self.rerank_checkbox.setToolTip(RERANK_TOOLTIP)
+        grid_layout.addWidget(self.rerank_checkbox, 2, 4)
+
         self.setLayout(grid_layout)
 
     def update_config(self):
@@ -121,6 +150,16 @@ class DatabaseSettingsTab(QWidget):
             settings_changed = True
             config_data['database']['document_types'] = document_type_value
 
+        new_search_type = self.search_type_combo.currentText()
+        if new_search_type != config_data['database'].get('search_type', 'similarity'):
+            settings_changed = True
+            config_data['database']['search_type'] = new_search_type
+
+        new_rerank = self.rerank_checkbox.isChecked()
+        if new_rerank != bool(config_data['database'].get('rerank', False)):
+            settings_changed = True
+            config_data['database']['rerank'] = new_rerank
+
         if settings_changed:
             with open('config.yaml', 'w', encoding='utf-8') as f:
                 yaml.safe_dump(config_data, f)
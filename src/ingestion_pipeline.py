@@ -0,0 +1,157 @@
+import logging
+import queue
+import threading
+import time
+
+from document_processor import split_document
+
+_DONE = object()
+
+
+class IngestionPipeline:
+    '''
+    runs load -> split -> embed -> write as concurrent stages connected by bounded queues. a full queue blocks the
+    stage feeding it, so the pipeline itself holds at most a few documents and chunk batches regardless of corpus
+    size; anything write_batch keeps across batches is up to it.
+
+    documents: iterable of Documents (e.g. document_processor.iter_documents, which loads files in worker processes)
+    text_splitter: a langchain text splitter
+    embeddings: a langchain embeddings object
+    write_batch: callable(chunks, vectors) that inserts one embedded batch into the vector store
+    on_document: optional callable(document) run once a document has been split
+    '''
+    def __init__(self, documents, text_splitter, embeddings, write_batch, on_document=None, batch_size=1024, queue_size=4):
+        self.documents = documents
+        self.text_splitter = text_splitter
+        self.embeddings = embeddings
+        self.write_batch = write_batch
+        self.on_document = on_document
+        self.batch_size = max(1, int(batch_size))
+
+        self.document_queue = queue.Queue(maxsize=max(1, queue_size) * 4)
+        self.chunk_queue = queue.Queue(maxsize=max(1, queue_size))
+        self.write_queue = queue.Queue(maxsize=max(1, queue_size))
+
+        self.stop_event = threading.Event()
+        self.errors = []
+        self.stats = {
+            'documents': 0,
+            'chunks': 0,
+            'load_time': 0.0,
+            'split_time': 0.0,
+            'embed_time': 0.0,
+            'write_time': 0.0,
+            'total_time': 0.0,
+        }
+
+    def put(self, target_queue, item):
+        while not self.stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, source_queue):
+        while True:
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return _DONE
+
+    def run_stage(self, stage, output_queue):
+        try:
+            stage()
+        except Exception as e:
+            logging.error(f"Ingestion stage {stage.__name__} failed: {e}")
+            self.errors.append(e)
+            self.stop_event.set()
+        finally:
+            if output_queue is not None:
+                self.put(output_queue, _DONE)
+
+    def load_stage(self):
+        documents = iter(self.documents)
+        while not self.stop_event.is_set():
+            start_time = time.perf_counter()
+            document = next(documents, _DONE)
+            self.stats['load_time'] += time.perf_counter() - start_time
+            if document is _DONE:
+                break
+            self.stats['documents'] += 1
+            self.put(self.document_queue, document)
+
+    def split_stage(self):
+        batch = []
+        while True:
+            document = self.get(self.document_queue)
+            if document is _DONE:
+                break
+
+            start_time = time.perf_counter()
+            chunks = split_document(self.text_splitter, document)
+            self.stats['split_time'] += time.perf_counter() - start_time
+
+            if self.on_document is not None:
+                self.on_document(document)
+
+            batch.extend(chunks)
+            while len(batch) >= self.batch_size:
+                self.put(self.chunk_queue, batch[:self.batch_size])
+                batch = batch[self.batch_size:]
+
+        if batch and not self.stop_event.is_set():
+            self.put(self.chunk_queue, batch)
+
+    def embed_stage(self):
+        while True:
+            chunks = self.get(self.chunk_queue)
+            if chunks is _DONE:
+                break
+
+            start_time = time.perf_counter()
+            vectors = self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+            self.stats['embed_time'] += time.perf_counter() - start_time
+
+            self.put(self.write_queue, (chunks, vectors))
+
+    def run(self, progress_callback=None):
+        start_time = time.perf_counter()
+        threads = [
+            threading.Thread(target=self.run_stage, args=(self.load_stage, self.document_queue), daemon=True),
+            threading.Thread(target=self.run_stage, args=(self.split_stage, self.chunk_queue), daemon=True),
+            threading.Thread(target=self.run_stage, args=(self.embed_stage, self.write_queue), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        # the writer runs on the calling thread
+        try:
+            while True:
+                item = self.get(self.write_queue)
+                if item is _DONE:
+                    break
+                chunks, vectors = item
+
+                write_start = time.perf_counter()
+                self.write_batch(chunks, vectors)
+                self.stats['write_time'] += time.perf_counter() - write_start
+                self.stats['chunks'] += len(chunks)
+
+                if progress_callback is not None:
+                    progress_callback(len(chunks))
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+        finally:
+            if self.errors:
+                self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        self.stats['total_time'] = time.perf_counter() - start_time
+        if self.errors:
+            raise self.errors[0]
+        return self.stats
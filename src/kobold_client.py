@@ -0,0 +1,136 @@
+import json
+import logging
+import threading
+import time
+from http.client import RemoteDisconnected
+
+import requests
+import sseclient
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ProtocolError
+
+STREAM_PATH = "/api/extra/generate/stream"
+# koboldcpp answers 503 while it is busy with another generation
+RETRY_STATUS_CODES = {503}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_kobold_client(kobold_config):
+    # one pooled client per endpoint and settings, shared by every question asked; a read_timeout of 0 or null waits
+    # for the server indefinitely
+    read_timeout = kobold_config.get('read_timeout', 600)
+    settings = (
+        kobold_config.get('api_url', "http://localhost:5001"),
+        float(kobold_config.get('connect_timeout', 5)),
+        float(read_timeout) if read_timeout else None,
+        int(kobold_config.get('max_retries', 3)),
+        float(kobold_config.get('retry_backoff', 0.5)),
+    )
+    with _lock:
+        client = _clients.get(settings)
+        if client is None:
+            client = _clients[settings] = KoboldClient(*settings)
+        return client
+
+
+def parse_token(event_data):
+    # returns the token carried by an SSE message event, or None if there is none
+    try:
+        data = json.loads(event_data)
+    except json.JSONDecodeError:
+        logging.error(f"Failed to parse JSON: {event_data}")
+        return None
+    if 'token' not in data:
+        logging.warning(f"Unexpected data format: {data}")
+        return None
+    return data['token']
+
+
+class KoboldClient:
+    '''
+    streams generations from koboldcpp over one pooled keep-alive session. failures to connect and busy responses are
+    retried with exponential backoff; a request that may have reached the server is never sent again, so a prompt is
+    not processed twice and no token is repeated. the one exception is a pooled connection the server closed while it
+    sat idle: that fails before any response arrives and is retried once on a new connection. the read timeout applies to every wait for data, including the
+    prompt processing before the first token, so it has to allow for slow cpu-only prefills; None waits indefinitely.
+    '''
+    def __init__(self, api_url="http://localhost:5001", connect_timeout=5.0, read_timeout=600.0, max_retries=3,
+                 retry_backoff=0.5, pool_size=4):
+        self.api_url = api_url.rstrip('/')
+        self.stream_url = self.api_url + STREAM_PATH
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def retry_delay(self, attempt, reason):
+        delay = self.retry_backoff * 2 ** attempt
+        logging.warning(f"Request to {self.stream_url} failed ({reason}); retrying in {delay:.1f}s.")
+        return delay
+
+    @staticmethod
+    def failed_to_connect(error):
+        # true only if no connection was made, so the request cannot have reached the server
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    @staticmethod
+    def closed_before_response(error):
+        # true if the server closed the connection without sending a byte back, as it does with a stale keep-alive one
+        reason = error.args[0] if error.args else None
+        if not isinstance(reason, ProtocolError) or len(reason.args) < 2:
+            return False
+        return isinstance(reason.args[1], (RemoteDisconnected, ConnectionResetError))
+
+    def post_stream(self, payload):
+        attempt = 0
+        reconnected = False
+        while True:
+            try:
+                response = self.session.post(self.stream_url, json=payload, stream=True, timeout=self.timeout)
+            except requests.ConnectionError as e:
+                if not reconnected and self.closed_before_response(e):
+                    # the other idle connections in the pool are likely just as stale, so they are dropped too
+                    logging.info(f"Connection to {self.stream_url} was closed before a response arrived; reconnecting.")
+                    reconnected = True
+                    self.session.close()
+                    continue
+                # a dropped connection or a read timeout may come after the server has started on the prompt
+                if attempt == self.max_retries or not self.failed_to_connect(e):
+                    raise
+                time.sleep(self.retry_delay(attempt, e))
+                attempt += 1
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                response.close()
+                time.sleep(self.retry_delay(attempt, f"status {response.status_code}"))
+                attempt += 1
+                continue
+            response.raise_for_status()
+            return response
+
+    def stream_tokens(self, payload):
+        response = self.post_stream(payload)
+        with response:
+            for event in sseclient.SSEClient(response).events():
+                if event.event != "message":
+                    logging.info(f"Received non-message event: {event.event}")
+                    continue
+                token = parse_token(event.data)
+                if token is not None:
+                    yield token
+
+    def generate(self, payload):
+        return "".join(self.stream_tokens(payload))
+
+    def close(self):
+        self.session.close()
+
@@ -0,0 +1,159 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from kobold_client import STREAM_PATH
+
+MOCK_WORDS = (
+    "the context states that this document describes a process for handling requests and the results "
+    "depend on the configuration which is explained in more detail in the following section of the manual"
+).split()
+
+
+class MockKoboldHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/v1/model":
+            self.send_json(200, {'result': "mock/koboldcpp"})
+        else:
+            self.send_json(404, {'detail': "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {'detail': "invalid json"})
+            return
+        if self.path != STREAM_PATH:
+            self.send_json(404, {'detail': "not found"})
+            return
+
+        # like koboldcpp, one generation at a time; other requests are told the server is busy
+        if not self.server.generation_lock.acquire(blocking=False):
+            self.send_json(503, {'detail': "server busy"})
+            return
+        try:
+            self.stream(payload)
+        finally:
+            self.server.generation_lock.release()
+
+    def stream(self, payload):
+        server = self.server
+        server.requests += 1
+        server.last_payload = payload
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        prompt_words = len(str(payload.get('prompt', "")).split())
+        prompt_time = server.prompt_delay
+        if server.prompt_tokens_per_second > 0:
+            prompt_time += prompt_words / server.prompt_tokens_per_second
+        time.sleep(prompt_time)
+
+        rng = random.Random(server.seed + server.requests)
+        tokens = server.max_tokens if server.max_tokens is not None else int(payload.get('max_length', 100))
+        interval = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+        next_time = time.perf_counter()
+        for _ in range(tokens):
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            event = json.dumps({'token': " " + rng.choice(MOCK_WORDS)})
+            self.write_chunk(f"event: message\ndata: {event}\n\n".encode('utf-8'))
+        self.write_chunk(b"")
+
+
+class MockKoboldServer(ThreadingHTTPServer):
+    '''
+    stand-in for koboldcpp's streaming generate endpoint, so the chat can be run and timed without a model. each
+    request waits prompt_delay seconds, plus the prompt's words at prompt_tokens_per_second if set, to imitate prompt
+    processing, then streams max_length (or max_tokens) random words as sse message events at tokens_per_second.
+    '''
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=5001, tokens_per_second=30.0, prompt_delay=0.5,
+                 prompt_tokens_per_second=0.0, max_tokens=None, seed=0):
+        super().__init__((host, port), MockKoboldHandler)
+        self.tokens_per_second = tokens_per_second
+        self.prompt_delay = prompt_delay
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.max_tokens = max_tokens
+        self.seed = seed
+        self.generation_lock = threading.Lock()
+        self.requests = 0
+        self.last_payload = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        # serves from a background thread; port 0 picks a free port, see url
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Mock koboldcpp server that streams random tokens.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0, help="0 streams as fast as possible")
+    parser.add_argument("--prompt-delay", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=0.0,
+                        help="adds the prompt's words at this rate to the delay; 0 disables")
+    parser.add_argument("--max-tokens", type=int, default=None, help="tokens per response instead of the request's max_length")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    server = MockKoboldServer(arguments.host, arguments.port, arguments.tokens_per_second, arguments.prompt_delay,
+                              arguments.prompt_tokens_per_second, arguments.max_tokens, arguments.seed)
+    print(f"Mock koboldcpp listening on {server.url}{STREAM_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
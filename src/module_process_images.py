@@ -7,6 +7,7 @@ import platform
 import time
 import warnings
 from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import torch
@@ -59,16 +60,16 @@ def run_loader_in_process(loader_func):
         my_cprint(error_message, "red")
         return []
 
-def choose_image_loader():
+def choose_image_loader(file_names=None):
     with open('config.yaml', 'r') as file:
         config = yaml.safe_load(file)
     
     chosen_model = config["vision"]["chosen_model"]
 
     if chosen_model == 'Moondream2':
-        loader_func = loader_moondream(config).process_images
+        loader_func = partial(loader_moondream(config).process_images, file_names)
     elif chosen_model in ["Florence-2-large", "Florence-2-base"]:
-        loader_func = loader_florence2(config).process_images
+        loader_func = partial(loader_florence2(config).process_images, file_names)
     else:
         my_cprint("No valid image model specified in config.yaml", "red")
         return []
@@ -76,7 +77,7 @@ def choose_image_loader():
     script_dir = os.path.dirname(__file__)
     image_dir = os.path.join(script_dir, "Docs_for_DB")
 
-    if not check_for_images(image_dir):
+    if not check_for_images(image_dir) or (file_names is not None and not file_names):
         print("No images selected for processing...")
         return []
 
@@ -104,13 +105,15 @@ class BaseLoader:
     def initialize_model_and_tokenizer(self):
         raise NotImplementedError("Subclasses must implement initialize_model_and_tokenizer method")
 
-    def process_images(self):
+    def process_images(self, file_names=None):
         script_dir = os.path.dirname(__file__)
         image_dir = os.path.join(script_dir, "Docs_for_DB")
         documents = []
         allowed_extensions = ALLOWED_EXTENSIONS
 
         image_files = [file for file in os.listdir(image_dir) if os.path.splitext(file)[1].lower() in allowed_extensions]
+        if file_names is not None:
+            image_files = [file for file in image_files if file in file_names]
 
         self.model, self.tokenizer, self.processor = self.initialize_model_and_tokenizer()
 
@@ -0,0 +1,185 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from chunk_store import ChunkStore
+
+VECTOR_DTYPES = ["float32", "float16"]
+BLOCK_ROWS = 65536
+
+
+def write_npy(raw_path, npy_path, dtype, shape):
+    # turns a file of raw rows into the data section of a regular .npy file
+    with open(npy_path, 'wb') as npy_file, open(raw_path, 'rb') as raw_file:
+        np.lib.format.write_array_header_1_0(npy_file, {
+            'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            'fortran_order': False,
+            'shape': shape,
+        })
+        shutil.copyfileobj(raw_file, npy_file, 16 * 1024 * 1024)
+    raw_path.unlink()
+
+
+class NumpyVectorStoreWriter:
+    '''
+    builds a NumpyVectorStore in a temporary directory from batches of chunks and their vectors, and moves it into
+    place on close so a half-written store is never read. vectors, ids and norms are written as they arrive, so
+    nothing is kept in memory between batches.
+    '''
+    def __init__(self, directory, dtype="float32"):
+        self.directory = Path(directory)
+        self.dtype = np.dtype(dtype if dtype in VECTOR_DTYPES else "float32")
+        self.temp_directory = self.directory.with_name(self.directory.name + ".tmp")
+        shutil.rmtree(self.temp_directory, ignore_errors=True)
+        self.temp_directory.mkdir(parents=True)
+
+        self.vectors_file = open(self.temp_directory / "vectors.bin", 'wb')
+        self.ids_file = open(self.temp_directory / "ids.bin", 'wb')
+        self.norms_file = open(self.temp_directory / "norms.bin", 'wb')
+        self.dimensions = None
+        self.documents = ChunkStore(self.temp_directory / "documents")
+        self.documents.clear()
+        self.rows = 0
+
+    def __len__(self):
+        return self.rows
+
+    def add(self, chunk_ids, documents, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        stored = vectors.astype(self.dtype)
+        self.vectors_file.write(stored.tobytes())
+
+        # norms of the vectors as stored, so float16 distances are consistent with what is scanned
+        stored = stored.astype(np.float32)
+        self.norms_file.write(np.einsum('ij,ij->i', stored, stored).astype(np.float32).tobytes())
+        self.ids_file.write(np.array([int(chunk_id) for chunk_id in chunk_ids], dtype=np.uint64).tobytes())
+        self.documents.append(documents)
+        self.rows += len(vectors)
+
+    def close_files(self):
+        for file in (self.vectors_file, self.ids_file, self.norms_file):
+            file.close()
+
+    def abort(self):
+        self.close_files()
+        shutil.rmtree(self.temp_directory, ignore_errors=True)
+
+    def close(self):
+        self.close_files()
+        dimensions = self.dimensions or 0
+
+        write_npy(self.temp_directory / "vectors.bin", self.temp_directory / "vectors.npy", self.dtype, (self.rows, dimensions))
+        write_npy(self.temp_directory / "ids.bin", self.temp_directory / "ids.npy", np.uint64, (self.rows,))
+        write_npy(self.temp_directory / "norms.bin", self.temp_directory / "norms.npy", np.float32, (self.rows,))
+        self.documents.close()
+
+        with open(self.temp_directory / "store.json", 'w', encoding='utf-8') as file:
+            json.dump({'rows': self.rows, 'dimensions': dimensions, 'dtype': self.dtype.name}, file)
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.temp_directory.rename(self.directory)
+
+
+class NumpyVectorStore:
+    '''
+    vector store kept as plain files: vectors.npy holds every chunk's vector (float32 or float16) in one contiguous
+    array that is memory-mapped rather than read, ids.npy the chunk id of each row and norms.npy its squared norm,
+    and documents/ the chunk texts and metadata in a ChunkStore with the same row order.
+
+    opening only maps the files, and the operating system's page cache shares the vectors between processes.
+    '''
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / "store.json", 'r', encoding='utf-8') as file:
+            info = json.load(file)
+
+        self.rows = info['rows']
+        self.dimensions = info['dimensions']
+        self.dtype = info['dtype']
+        self.vectors = np.load(self.directory / "vectors.npy", mmap_mode='r')
+        self.ids = np.load(self.directory / "ids.npy")
+        self.norms = np.load(self.directory / "norms.npy")
+        self.documents = ChunkStore(self.directory / "documents")
+
+        # for mapping chunk ids back to rows
+        self.id_order = np.argsort(self.ids, kind='stable')
+        self.sorted_ids = self.ids[self.id_order]
+
+    @classmethod
+    def open(cls, directory):
+        if not (Path(directory) / "store.json").exists():
+            return None
+        return cls(directory)
+
+    def __len__(self):
+        return self.rows
+
+    def rows_for_ids(self, chunk_ids):
+        # sorted rows of the given chunk ids; ids not in the store are skipped
+        chunk_ids = np.asarray(chunk_ids, dtype=np.uint64)
+        if not len(chunk_ids) or not self.rows:
+            return np.zeros(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, chunk_ids), self.rows - 1)
+        found = self.sorted_ids[positions] == chunk_ids
+        return np.sort(self.id_order[positions[found]])
+
+    def vectors_for_ids(self, chunk_ids):
+        # float32 vectors of the given chunk ids in the same order; every id has to be in the store
+        chunk_ids = np.asarray(chunk_ids, dtype=np.uint64)
+        if not len(chunk_ids):
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, chunk_ids), self.rows - 1)
+        if not np.array_equal(self.sorted_ids[positions], chunk_ids):
+            raise KeyError("Chunk ids not in the vector store.")
+        rows = self.id_order[positions]
+        # the memory map is read in row order and the vectors put back in the order asked for
+        order = np.argsort(rows, kind='stable')
+        vectors = np.empty((len(rows), self.dimensions), dtype=np.float32)
+        vectors[order] = self.vectors[rows[order]]
+        return vectors
+
+    def get_documents(self, chunk_ids):
+        chunk_ids = np.asarray(chunk_ids, dtype=np.uint64)
+        rows = self.rows_for_ids(chunk_ids)
+        return {int(self.ids[row]): self.documents.get_document(int(row)) for row in rows}
+
+    def search(self, query_vectors, k, rows=None):
+        '''
+        exact squared euclidean search of the memory-mapped vectors, or only the given sorted rows, one block of rows
+        at a time; returns (chunk ids, distances) per query, nearest first, at most k each.
+        '''
+        k = max(1, int(k))
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        query_norms = np.einsum('ij,ij->i', query_vectors, query_vectors)
+        total = self.rows if rows is None else len(rows)
+        best_rows = [np.zeros(0, dtype=np.int64) for _ in range(len(query_vectors))]
+        best_distances = [np.zeros(0, dtype=np.float32) for _ in range(len(query_vectors))]
+
+        for start in range(0, total, BLOCK_ROWS):
+            if rows is None:
+                block_rows = np.arange(start, min(total, start + BLOCK_ROWS))
+                block = np.asarray(self.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            else:
+                block_rows = np.asarray(rows[start:start + BLOCK_ROWS], dtype=np.int64)
+                block = np.asarray(self.vectors[block_rows], dtype=np.float32)
+            distances = self.norms[block_rows] - 2.0 * (query_vectors @ block.T) + query_norms[:, None]
+
+            for i in range(len(query_vectors)):
+                candidate_rows = np.concatenate((best_rows[i], block_rows))
+                candidate_distances = np.concatenate((best_distances[i], distances[i]))
+                if len(candidate_distances) > k:
+                    keep = np.argpartition(candidate_distances, k - 1)[:k]
+                    candidate_rows, candidate_distances = candidate_rows[keep], candidate_distances[keep]
+                best_rows[i], best_distances[i] = candidate_rows, candidate_distances
+
+        ranked = []
+        for query_rows, query_distances in zip(best_rows, best_distances):
+            order = np.argsort(query_distances, kind='stable')
+            ranked.append((self.ids[query_rows[order]], query_distances[order].astype(np.float32)))
+        return ranked
@@ -0,0 +1,76 @@
+import logging
+import os
+import threading
+
+from context_packer import ContextPacker
+
+
+class PromptLayout:
+    '''
+    orders the contexts of consecutive prompts to the same server so the prompts share as long a prefix as possible,
+    which koboldcpp reuses instead of processing it again. contexts that were in the previous prompt keep their places
+    at the front, in the same order; new contexts follow sorted by database, file and text, so the same chunks always
+    give the same prompt. also measures how much of the previous prompt each new prompt starts with.
+    '''
+    _layouts = {}
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.previous_keys = []
+        self.previous_prompt = ""
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_layout(cls, api_url):
+        # one layout per server, since each server only remembers the last prompt it processed
+        with cls._lock:
+            layout = cls._layouts.get(api_url)
+            if layout is None:
+                layout = cls._layouts[api_url] = cls()
+            return layout
+
+    @staticmethod
+    def sort_key(metadata):
+        return (str(metadata.get('database', "")), str(metadata.get('file_path', metadata.get('file_name', ""))))
+
+    def arrange(self, contexts, metadata_list):
+        # returns the positions of the contexts in prompt order
+        keys = [ContextPacker.text_key(context) for context in contexts]
+        positions = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, i)
+
+        with self.lock:
+            reused = [positions[key] for key in dict.fromkeys(self.previous_keys) if key in positions]
+        reused_set = set(reused)
+        new = sorted((i for i in range(len(contexts)) if i not in reused_set),
+                     key=lambda i: (self.sort_key(metadata_list[i]), keys[i]))
+        return reused + new
+
+    def record(self, prompt, contexts):
+        '''
+        remembers the prompt about to be sent and returns how much of the previous one it starts with, in characters
+        and, when the tokenizer is available, in tokens.
+        '''
+        with self.lock:
+            previous_prompt = self.previous_prompt
+            self.previous_prompt = prompt
+            self.previous_keys = [ContextPacker.text_key(context) for context in contexts]
+
+        prefix = os.path.commonprefix([previous_prompt, prompt])
+        reuse = {
+            'prefix_chars': len(prefix),
+            'prompt_chars': len(prompt),
+            'prefix_tokens': None,
+            'prompt_tokens': None,
+            'prefix_reuse': len(prefix) / len(prompt) if prompt else 0.0,
+        }
+        try:
+            packer = ContextPacker()
+            # the last token of the prefix may be merged differently in the full prompt, so it is not counted
+            reuse['prefix_tokens'] = max(0, packer.count_prompt(prefix) - 1) if prefix else 0
+            reuse['prompt_tokens'] = packer.count_prompt(prompt)
+            reuse['prefix_reuse'] = reuse['prefix_tokens'] / reuse['prompt_tokens'] if reuse['prompt_tokens'] else 0.0
+        except Exception as e:
+            logging.debug(f"Could not count prefix tokens: {e}")
+        return reuse
@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''
+    thread-safe mapping that holds at most max_entries items and drops the least recently used one when full. a
+    max_entries of 0 disables the cache.
+    '''
+    def __init__(self, max_entries):
+        self.max_entries = max(0, int(max_entries))
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if self.max_entries <= 0:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, max_entries):
+        with self.lock:
+            self.max_entries = max(0, int(max_entries))
+            self.evict()
+
+    def remove_if(self, predicate):
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
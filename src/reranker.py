@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from huggingface_hub import snapshot_download
+
+MODELS_DIRECTORY = Path(__file__).resolve().parent / "Models" / "reranker"
+
+_rerankers = {}
+_lock = threading.Lock()
+
+
+def get_model_path(model_name):
+    # repository ids are downloaded once into Models/reranker, like the vector models; local paths are used as is
+    if Path(model_name).exists():
+        return str(model_name)
+    local_dir = MODELS_DIRECTORY / model_name.replace('/', '_')
+    if not (local_dir / "config.json").exists():
+        print(f"Downloading reranker model {model_name}...")
+        snapshot_download(model_name, local_dir=local_dir, local_dir_use_symlinks=False)
+    return str(local_dir)
+
+
+def get_reranker(model_name, device="cpu"):
+    # one loaded reranker per model and device, shared by every database
+    with _lock:
+        reranker = _rerankers.get((model_name, device))
+        if reranker is None:
+            reranker = _rerankers[(model_name, device)] = CrossEncoderReranker(model_name, device)
+        return reranker
+
+
+def release_rerankers():
+    with _lock:
+        _rerankers.clear()
+
+
+class CrossEncoderReranker:
+    '''
+    reorders retrieved chunks by scoring every (question, chunk) pair together with a cross-encoder, which is more
+    accurate than comparing separately computed vectors. pairs are scored in batches until the time budget is used up;
+    chunks left unscored keep their retrieval order behind the scored ones.
+    '''
+    def __init__(self, model_name, device="cpu"):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.device = device if device == "cpu" or torch.cuda.is_available() else "cpu"
+        self.model_path = get_model_path(model_name)
+        try:
+            self.model = CrossEncoder(self.model_path, max_length=512, device=self.device)
+        except Exception as e:
+            if self.device == "cpu":
+                raise
+            logging.warning(f"Could not load reranker on {self.device}, using the cpu instead: {e}")
+            self.device = "cpu"
+            self.model = CrossEncoder(self.model_path, max_length=512, device=self.device)
+        self.lock = threading.Lock()
+
+    def fall_back_to_cpu(self, error):
+        from sentence_transformers import CrossEncoder
+
+        logging.warning(f"Reranker failed on {self.device}, continuing on the cpu: {error}")
+        self.model = None
+        torch.cuda.empty_cache()
+        self.device = "cpu"
+        self.model = CrossEncoder(self.model_path, max_length=512, device=self.device)
+
+    @torch.inference_mode()
+    def score(self, query, texts, batch_size=32, time_budget=0.0):
+        '''
+        returns a score per text, nan for the texts not reached within time_budget seconds. the first batch is always
+        scored; a time_budget of 0 scores every text.
+        '''
+        start_time = time.perf_counter()
+        scores = np.full(len(texts), np.nan, dtype=np.float32)
+        with self.lock:
+            for start in range(0, len(texts), batch_size):
+                if start and time_budget > 0 and time.perf_counter() - start_time > time_budget:
+                    logging.info(f"Reranking stopped after {start} of {len(texts)} chunks to stay within {time_budget}s.")
+                    break
+                pairs = [[query, text] for text in texts[start:start + batch_size]]
+                try:
+                    batch_scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+                except RuntimeError as e:
+                    # includes running out of gpu memory
+                    if self.device == "cpu":
+                        raise
+                    self.fall_back_to_cpu(e)
+                    batch_scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+                scores[start:start + len(pairs)] = batch_scores
+        return scores
+
+    def rerank(self, query, texts, k, batch_size=32, time_budget=0.0):
+        '''
+        returns the positions of the best k texts, best first, and their scores. unscored texts follow the scored ones
+        in their original order and get the lowest score seen.
+        '''
+        scores = self.score(query, texts, batch_size, time_budget)
+        scored = np.flatnonzero(~np.isnan(scores))
+        unscored = np.flatnonzero(np.isnan(scores))
+        order = np.concatenate((scored[np.argsort(-scores[scored], kind='stable')], unscored))[:k]
+        if len(unscored) and len(scored):
+            scores[unscored] = scores[scored].min()
+        return order, scores[order]
@@ -0,0 +1,713 @@
+import json
+import math
+import os
+import re
+import shutil
+from array import array
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+QUANTIZATION_TYPES = ["none", "int8", "binary"]
+# number of set bits in every byte value, for hamming distances between packed binary codes
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+BLOCK_ROWS = 65536
+# postings buffered before a SegmentWriter spills them to a run, and read at a time when segments are merged
+SPILL_POSTINGS = 1 << 22
+MERGE_POSTINGS = 1 << 22
+# an index is compacted into one segment once this share of its rows is deleted or it has more segments than this
+COMPACT_DELETED_RATIO = 0.25
+MAX_SEGMENTS = 8
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    '''
+    merges several rankings of chunk ids; each id scores 1 / (rrf_k + rank) in every ranking it appears in. returns
+    the ids, best first, and their scores divided by the highest possible score so they fall between 0 and 1.
+    '''
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            chunk_id = int(chunk_id)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    ids = sorted(scores, key=scores.get, reverse=True)
+    best_score = max(1, len(rankings)) / (rrf_k + 1)
+    return np.array(ids, dtype=np.uint64), np.array([scores[chunk_id] / best_score for chunk_id in ids], dtype=np.float32)
+
+
+def as_array(values, dtype):
+    return np.frombuffer(values, dtype=dtype) if len(values) else np.zeros(0, dtype=dtype)
+
+
+def open_rows(path, dtype, rows, width=None):
+    # memory-maps the first rows of a raw row file; anything after them was left by an update that did not finish
+    shape = (rows,) if width is None else (rows, width)
+    if not rows or width == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+def prefix_range(sorted_terms, prefix, exact=False):
+    start = np.searchsorted(sorted_terms, prefix, side='left')
+    stop = np.searchsorted(sorted_terms, prefix if exact else prefix + chr(0x10FFFF), side='right')
+    return int(start), int(stop)
+
+
+def quantize_int8(vectors, minimum, scale):
+    # int8 codes on 256 levels per dimension, and the squared norms of the vectors the codes stand for
+    levels = np.clip(np.rint((vectors - minimum) / scale), 0, 255)
+    reconstructed = levels * scale + minimum
+    return (levels - 128).astype(np.int8), np.einsum('ij,ij->i', reconstructed, reconstructed).astype(np.float32)
+
+
+def load_info(directory):
+    with open(Path(directory) / "index.json", 'r', encoding='utf-8') as file:
+        info = json.load(file)
+    if 'segments' not in info:
+        raise ValueError("The search index was written by an older version and cannot be read.")
+    return info
+
+
+def save_info(directory, info):
+    # replaced in one step, so readers see either the old or the new row count, never a partial file
+    temp_path = Path(directory) / "index.json.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(info, file, ensure_ascii=False)
+    os.replace(temp_path, Path(directory) / "index.json")
+
+
+def code_width(quantization, dimensions):
+    return (dimensions + 7) // 8 if quantization == "binary" else dimensions
+
+
+class Segment:
+    '''
+    the postings of consecutive rows of a SearchIndex, starting at first_row. segment.json holds the terms, sorted,
+    and the document type names; postings.bin the rows (counted from the segment's first row) containing each term,
+    located through term_offsets.npy, with frequencies.bin the number of times the term occurs in each, and
+    document_types.npy a packed bitmap of the segment's rows per document type.
+    '''
+    def __init__(self, directory, first_row=0):
+        self.directory = Path(directory)
+        self.first_row = first_row
+        with open(self.directory / "segment.json", 'r', encoding='utf-8') as file:
+            info = json.load(file)
+
+        self.rows = info['rows']
+        self.terms = info['terms']
+        self.document_type_names = info['document_types']
+        self.document_type_rows = {value: i for i, value in enumerate(self.document_type_names)}
+        self.term_offsets = np.load(self.directory / "term_offsets.npy")
+        postings = int(self.term_offsets[-1])
+        self.postings = open_rows(self.directory / "postings.bin", np.uint32, postings)
+        self.frequencies = open_rows(self.directory / "frequencies.bin", np.uint32, postings)
+        self.document_types = np.load(self.directory / "document_types.npy")
+        self.sorted_terms = None
+
+    def get_sorted_terms(self):
+        # the terms, which are stored sorted, and every term reversed and sorted with the term ids in that order, for
+        # prefix and suffix lookups by binary search
+        if self.sorted_terms is None:
+            terms = np.array(self.terms, dtype=str)
+            reversed_terms = np.array([term[::-1] for term in self.terms], dtype=str)
+            reversed_order = np.argsort(reversed_terms, kind='stable')
+            self.sorted_terms = (terms, reversed_terms[reversed_order], reversed_order)
+        return self.sorted_terms
+
+    def term_id(self, term):
+        start, stop = prefix_range(self.get_sorted_terms()[0], term, exact=True)
+        return start if stop > start else None
+
+    def matching_terms(self, token, whole_start, whole_end):
+        '''
+        ids of the terms the token can be part of. a token with a word boundary on both sides in the search term is a
+        whole word, one bounded on the left only starts a word and one bounded on the right only ends one; those are
+        binary searches. only a token open on both sides has to be looked for inside every term.
+        '''
+        terms, reversed_terms, reversed_order = self.get_sorted_terms()
+        if whole_start:
+            start, stop = prefix_range(terms, token, exact=whole_end)
+            return np.arange(start, stop)
+        if whole_end:
+            start, stop = prefix_range(reversed_terms, token[::-1])
+            return reversed_order[start:stop]
+        return np.flatnonzero(np.char.find(terms, token) >= 0)
+
+    def term_rows(self, term_id):
+        # index rows containing the term, and how often it occurs in each
+        start, stop = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+        return np.asarray(self.postings[start:stop], dtype=np.int64) + self.first_row, self.frequencies[start:stop]
+
+    def type_mask(self, document_types):
+        # rows of the segment with one of the document types
+        type_rows = [self.document_type_rows[value] for value in document_types if value in self.document_type_rows]
+        if not type_rows:
+            return np.zeros(self.rows, dtype=bool)
+        return np.unpackbits(self.document_types[type_rows], axis=1, count=self.rows).any(axis=0)
+
+
+def write_segment_info(directory, rows, terms, term_counts, document_type_names, document_types):
+    np.save(directory / "term_offsets.npy", np.concatenate(([0], np.cumsum(term_counts))).astype(np.uint64))
+    np.save(directory / "document_types.npy", document_types)
+    with open(directory / "segment.json", 'w', encoding='utf-8') as file:
+        json.dump({'rows': rows, 'terms': terms, 'document_types': document_type_names}, file, ensure_ascii=False)
+
+
+class SegmentWriter:
+    '''
+    collects the postings and document types of consecutive rows and writes them as a Segment on close. once
+    SPILL_POSTINGS postings are buffered they are written out as a sorted run, and close merges the runs with
+    merge_segments, so a large build holds one run's postings and vocabulary rather than the whole corpus's.
+    '''
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True)
+        self.rows = 0
+        self.runs = []
+        self.start_run()
+
+    def start_run(self):
+        self.run_first_row = self.rows
+        self.vocabulary = {}
+        self.posting_terms = array('I')
+        self.posting_rows = array('I')
+        self.posting_frequencies = array('I')
+        self.document_types = {}
+
+    def add(self, documents):
+        # returns the number of words in each document
+        lengths = []
+        for doc in documents:
+            run_row = self.rows - self.run_first_row
+            term_counts = Counter(tokenize(doc.page_content))
+            for term, count in term_counts.items():
+                self.posting_terms.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                self.posting_rows.append(run_row)
+                self.posting_frequencies.append(count)
+            self.document_types.setdefault(str(doc.metadata.get('document_type', '')), array('I')).append(run_row)
+            lengths.append(sum(term_counts.values()))
+            self.rows += 1
+        if len(self.posting_terms) >= SPILL_POSTINGS:
+            self.spill()
+        return lengths
+
+    def spill(self):
+        run_directory = self.directory / f"run_{len(self.runs)}"
+        run_directory.mkdir()
+        self.write_run(run_directory)
+        self.runs.append(Segment(run_directory, self.run_first_row))
+        self.start_run()
+
+    def write_run(self, directory):
+        # term ids are renumbered in sorted order, so segments can be merged term by term
+        rows = self.rows - self.run_first_row
+        terms = sorted(self.vocabulary)
+        ranks = np.empty(len(terms), dtype=np.uint32)
+        ranks[[self.vocabulary[term] for term in terms]] = np.arange(len(terms), dtype=np.uint32)
+        posting_terms = ranks[as_array(self.posting_terms, np.uint32)]
+        # rows were added in order, so a stable sort keeps each term's rows ascending
+        order = np.argsort(posting_terms, kind='stable')
+        as_array(self.posting_rows, np.uint32)[order].tofile(directory / "postings.bin")
+        as_array(self.posting_frequencies, np.uint32)[order].tofile(directory / "frequencies.bin")
+
+        bitmaps = np.zeros((len(self.document_types), rows), dtype=bool)
+        for i, type_rows in enumerate(self.document_types.values()):
+            bitmaps[i, as_array(type_rows, np.uint32)] = True
+        write_segment_info(directory, rows, terms, np.bincount(posting_terms, minlength=len(terms)),
+                           list(self.document_types), np.packbits(bitmaps, axis=1))
+
+    def close(self):
+        if not self.runs:
+            self.write_run(self.directory)
+            return
+        if self.rows > self.run_first_row:
+            self.spill()
+        merge_segments(self.runs, self.directory)
+        # the runs' files are memory-mapped until their segments are released
+        run_directories = [run.directory for run in self.runs]
+        self.runs = []
+        for run_directory in run_directories:
+            shutil.rmtree(run_directory, ignore_errors=True)
+
+
+def merge_segments(segments, directory, live=None):
+    '''
+    writes segments covering consecutive rows from row 0 as one segment in directory, leaving out the rows where live
+    is False and numbering the rest from 0. the postings are read a block of terms at a time, so memory holds the
+    vocabulary, one block of postings and, when rows are left out, a few bytes per row rather than every posting.
+    '''
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rows = sum(segment.rows for segment in segments)
+    if live is not None:
+        live = np.asarray(live, dtype=bool)
+        new_rows = np.cumsum(live, dtype=np.int64) - 1
+        rows = int(live.sum())
+
+    terms = np.array(sorted(set().union(*(segment.terms for segment in segments))), dtype=str)
+    segment_term_ids = [np.searchsorted(terms, np.array(segment.terms, dtype=str)) for segment in segments]
+    posting_counts = np.zeros(len(terms), dtype=np.int64)
+    for segment, term_ids in zip(segments, segment_term_ids):
+        posting_counts[term_ids] += np.diff(segment.term_offsets).astype(np.int64)
+    cumulative_counts = np.cumsum(posting_counts)
+
+    kept_counts = np.zeros(len(terms), dtype=np.int64)
+    block_start = 0
+    with open(directory / "postings.bin", 'wb') as postings_file, open(directory / "frequencies.bin", 'wb') as frequencies_file:
+        while block_start < len(terms):
+            # whole terms, about MERGE_POSTINGS postings at a time
+            base = cumulative_counts[block_start - 1] if block_start else 0
+            block_stop = max(block_start + 1, int(np.searchsorted(cumulative_counts, base + MERGE_POSTINGS, side='right')))
+            block_terms, block_rows, block_frequencies = [], [], []
+            for segment, term_ids in zip(segments, segment_term_ids):
+                first, last = np.searchsorted(term_ids, [block_start, block_stop])
+                if first == last:
+                    continue
+                start, stop = int(segment.term_offsets[first]), int(segment.term_offsets[last])
+                block_terms.append(np.repeat(term_ids[first:last], np.diff(segment.term_offsets[first:last + 1]).astype(np.int64)))
+                block_rows.append(np.asarray(segment.postings[start:stop], dtype=np.int64) + segment.first_row)
+                block_frequencies.append(np.asarray(segment.frequencies[start:stop]))
+
+            if block_terms:
+                block_terms = np.concatenate(block_terms)
+                block_rows = np.concatenate(block_rows)
+                block_frequencies = np.concatenate(block_frequencies)
+                if live is not None:
+                    keep = live[block_rows]
+                    block_terms, block_rows, block_frequencies = block_terms[keep], new_rows[block_rows[keep]], block_frequencies[keep]
+                # the segments are in row order, so a stable sort by term keeps each term's rows ascending
+                order = np.argsort(block_terms, kind='stable')
+                block_rows[order].astype(np.uint32).tofile(postings_file)
+                block_frequencies[order].astype(np.uint32).tofile(frequencies_file)
+                kept_counts[block_start:block_stop] = np.bincount(block_terms - block_start, minlength=block_stop - block_start)
+            block_start = block_stop
+
+    # terms that only occurred in left out rows are dropped; their postings were empty
+    kept = kept_counts > 0
+    document_type_names, bitmaps = [], []
+    for value in dict.fromkeys(value for segment in segments for value in segment.document_type_names):
+        bits = np.concatenate([segment.type_mask([value]) for segment in segments])
+        if live is not None:
+            bits = bits[live]
+        if bits.any():
+            document_type_names.append(value)
+            bitmaps.append(np.packbits(bits))
+    document_types = np.stack(bitmaps) if bitmaps else np.zeros((0, (rows + 7) // 8), dtype=np.uint8)
+    write_segment_info(directory, rows, terms[kept].tolist(), kept_counts[kept], document_type_names, document_types)
+
+
+def compact_index(directory):
+    '''
+    rewrites an index without its deleted rows and with its segments merged into one, in a temporary directory that
+    then replaces it. the row files are copied a block at a time and the segments merged with merge_segments, so
+    nothing is tokenized again.
+    '''
+    directory = Path(directory)
+    info = load_info(directory)
+    rows = info['rows']
+    temp_directory = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(temp_directory, ignore_errors=True)
+    temp_directory.mkdir(parents=True)
+
+    live = np.ones(rows, dtype=bool)
+    if info['deleted']:
+        live = ~np.unpackbits(np.load(directory / "deleted.npy"), count=rows).astype(bool)
+    width = code_width(info['quantization'], info['dimensions'])
+    row_files = [("ids", np.uint64, None), ("lengths", np.uint32, None)]
+    if info['quantization'] != "none":
+        row_files.append(("codes", np.uint8 if info['quantization'] == "binary" else np.int8, width))
+    if info['quantization'] == "int8":
+        row_files.append(("code_norms", np.float32, None))
+        shutil.copy2(directory / "code_range.npy", temp_directory / "code_range.npy")
+    for name, dtype, row_width in row_files:
+        values = open_rows(directory / f"{name}.bin", dtype, rows, row_width)
+        with open(temp_directory / f"{name}.bin", 'wb') as file:
+            for start in range(0, rows, BLOCK_ROWS):
+                np.asarray(values[start:start + BLOCK_ROWS][live[start:start + BLOCK_ROWS]]).tofile(file)
+        del values
+
+    segments = [Segment(directory / segment['name'], segment['first_row']) for segment in info['segments']]
+    live_rows = int(live.sum())
+    info.update(rows=live_rows, deleted=0, segments=[], next_segment=1)
+    if live_rows:
+        merge_segments(segments, temp_directory / "segment_0", live)
+        info['segments'].append({'name': "segment_0", 'first_row': 0, 'rows': live_rows})
+    segments = None
+    save_info(temp_directory, info)
+
+    shutil.rmtree(directory)
+    temp_directory.rename(directory)
+
+
+class SearchIndexWriter:
+    '''
+    writes a SearchIndex from batches of chunks and their vectors. a new index is built in a temporary directory and
+    moved into place on close, so a half-written index is never read. with update=True an existing index is extended
+    in place instead: new chunks are appended as a new segment and removed ones marked deleted, so an update only
+    tokenizes what it adds. the index is compacted once deleted rows or segments pile up.
+
+    the float vectors are only needed for the quantized codes. binary codes, and the int8 codes of an update, which
+    keep the value ranges the index was created with, are written as the vectors arrive; a new int8 index keeps the
+    vectors in its temporary directory until the ranges are known.
+    '''
+    def __init__(self, directory, quantization="none", update=False):
+        self.directory = Path(directory)
+        self.update = update
+        if update:
+            self.target = self.directory
+            self.info = load_info(self.directory)
+        else:
+            self.target = self.directory.with_name(self.directory.name + ".tmp")
+            shutil.rmtree(self.target, ignore_errors=True)
+            self.target.mkdir(parents=True)
+            self.info = {
+                'rows': 0,
+                'deleted': 0,
+                'total_length': 0,
+                'quantization': quantization if quantization in QUANTIZATION_TYPES else "none",
+                'dimensions': 0,
+                'segments': [],
+                'next_segment': 0,
+            }
+
+        self.first_row = self.info['rows']
+        self.quantization = self.info['quantization']
+        self.dimensions = self.info['dimensions'] or None
+        self.deleted = None
+        if update and self.info['deleted']:
+            self.deleted = np.unpackbits(np.load(self.target / "deleted.npy"), count=self.first_row).astype(bool)
+        self.code_range = None
+        if update and self.quantization == "int8" and self.first_row:
+            self.code_range = np.load(self.target / "code_range.npy")
+        if update:
+            self.truncate_rows(self.first_row)
+
+        self.segment_name = f"segment_{self.info['next_segment']}"
+        self.segment_writer = SegmentWriter(self.target / (self.segment_name + ".tmp"))
+        self.files = {}
+
+    def __len__(self):
+        return self.segment_writer.rows
+
+    def row_size(self, name):
+        widths = {'ids': 8, 'lengths': 4, 'code_norms': 4}
+        if name == "codes":
+            return code_width(self.quantization, self.dimensions or 0)
+        return widths.get(name, 4 * (self.dimensions or 0))
+
+    def truncate_rows(self, rows):
+        # drops whatever an earlier update that did not finish appended after the given number of rows
+        for name in ("ids", "lengths", "codes", "code_norms"):
+            path = self.target / f"{name}.bin"
+            if path.exists() and path.stat().st_size > rows * self.row_size(name):
+                os.truncate(path, rows * self.row_size(name))
+
+    def write_rows(self, name, values):
+        file = self.files.get(name)
+        if file is None:
+            file = self.files[name] = open(self.target / f"{name}.bin", 'ab')
+        file.write(np.ascontiguousarray(values).tobytes())
+
+    def add(self, chunk_ids, documents, vectors=None):
+        # vectors may be left out of an unquantized index
+        if not len(documents):
+            return
+        lengths = self.segment_writer.add(documents)
+        self.write_rows("ids", np.array([int(chunk_id) for chunk_id in chunk_ids], dtype=np.uint64))
+        self.write_rows("lengths", np.array(lengths, dtype=np.uint32))
+        self.info['total_length'] += int(sum(lengths))
+        if self.quantization == "none":
+            return
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        if self.quantization == "binary":
+            self.write_rows("codes", np.packbits(vectors > 0, axis=1))
+        elif self.code_range is not None:
+            codes, code_norms = quantize_int8(vectors, *self.code_range)
+            self.write_rows("codes", codes)
+            self.write_rows("code_norms", code_norms)
+        else:
+            self.write_rows("vectors", vectors)
+
+    def delete(self, chunk_ids):
+        # marks the rows of the given chunks deleted; they stay in the files until the index is compacted
+        chunk_ids = np.array([int(chunk_id) for chunk_id in chunk_ids], dtype=np.uint64)
+        if not len(chunk_ids) or not self.first_row:
+            return
+        ids = open_rows(self.target / "ids.bin", np.uint64, self.first_row)
+        lengths = open_rows(self.target / "lengths.bin", np.uint32, self.first_row)
+        if self.deleted is None:
+            self.deleted = np.zeros(self.first_row, dtype=bool)
+        rows = np.flatnonzero(np.isin(ids, chunk_ids) & ~self.deleted)
+        self.deleted[rows] = True
+        self.info['deleted'] += len(rows)
+        self.info['total_length'] -= int(lengths[rows].sum())
+        del ids, lengths
+
+    def close_files(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+    def abort(self):
+        self.close_files()
+        if not self.update:
+            shutil.rmtree(self.target, ignore_errors=True)
+            return
+        shutil.rmtree(self.segment_writer.directory, ignore_errors=True)
+        self.truncate_rows(self.first_row)
+
+    def close(self):
+        self.close_files()
+        added_rows = len(self)
+        rows = self.first_row + added_rows
+        if (self.target / "vectors.bin").exists():
+            if added_rows:
+                self.write_codes(added_rows)
+            (self.target / "vectors.bin").unlink()
+
+        if added_rows:
+            self.segment_writer.close()
+            self.segment_writer.directory.rename(self.target / self.segment_name)
+            self.info['segments'].append({'name': self.segment_name, 'first_row': self.first_row, 'rows': added_rows})
+            self.info['next_segment'] += 1
+        else:
+            shutil.rmtree(self.segment_writer.directory, ignore_errors=True)
+
+        if self.deleted is not None:
+            deleted = np.concatenate((self.deleted, np.zeros(added_rows, dtype=bool)))
+            np.save(self.target / "deleted.npy", np.packbits(deleted))
+        self.info.update(rows=rows, dimensions=self.dimensions or 0)
+        save_info(self.target, self.info)
+
+        if not self.update:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.target.rename(self.directory)
+        elif self.info['deleted'] > COMPACT_DELETED_RATIO * rows or len(self.info['segments']) > MAX_SEGMENTS:
+            compact_index(self.directory)
+
+    def write_codes(self, rows):
+        '''
+        int8 maps each dimension's observed range onto 256 levels and stores the squared norm of every reconstructed
+        vector. the range is kept, and rows added by later updates are clipped to it.
+        '''
+        vectors = np.memmap(self.target / "vectors.bin", dtype=np.float32, mode='r', shape=(rows, self.dimensions))
+        minimum = np.full(self.dimensions, np.inf, dtype=np.float32)
+        maximum = np.full(self.dimensions, -np.inf, dtype=np.float32)
+        for start in range(0, rows, BLOCK_ROWS):
+            block = vectors[start:start + BLOCK_ROWS]
+            minimum = np.minimum(minimum, block.min(axis=0))
+            maximum = np.maximum(maximum, block.max(axis=0))
+        scale = np.maximum(maximum - minimum, 1e-12) / 255.0
+
+        with open(self.target / "codes.bin", 'wb') as codes_file, open(self.target / "code_norms.bin", 'wb') as norms_file:
+            for start in range(0, rows, BLOCK_ROWS):
+                codes, code_norms = quantize_int8(vectors[start:start + BLOCK_ROWS], minimum, scale)
+                codes.tofile(codes_file)
+                code_norms.tofile(norms_file)
+        np.save(self.target / "code_range.npy", np.stack([minimum, scale]))
+        del vectors
+
+
+class SearchIndex:
+    '''
+    per-database index used to restrict a search to the chunks that can match the search term and document type
+    filters before any distances are computed.
+
+    every row is one chunk. ids.bin holds the chunk id of each row and lengths.bin its number of words; the terms,
+    postings and document type bitmaps are in segments, each covering the rows one build or update added (see
+    Segment). rows of removed chunks are marked in deleted.npy until the index is compacted, and index.json holds the
+    row count and the segments. postings, frequencies and lengths are what BM25 needs.
+
+    the index holds no float vectors. ranking rows exactly takes a read_vectors function returning the vectors of
+    given chunk ids from the database's vector store. a quantized index also has codes.bin, an int8 or packed binary
+    code per row that is loaded into memory and scanned instead, so only the best candidates are read to rescore them.
+    '''
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        info = load_info(self.directory)
+
+        self.rows = info['rows']
+        self.deleted_rows = info['deleted']
+        self.dimensions = info['dimensions']
+        self.average_length = info['total_length'] / max(1, self.rows - self.deleted_rows)
+        self.ids = open_rows(self.directory / "ids.bin", np.uint64, self.rows)
+        self.lengths = open_rows(self.directory / "lengths.bin", np.uint32, self.rows)
+        self.deleted = None
+        if self.deleted_rows:
+            self.deleted = np.unpackbits(np.load(self.directory / "deleted.npy"), count=self.rows).astype(bool)
+        self.segments = [Segment(self.directory / segment['name'], segment['first_row']) for segment in info['segments']]
+        self.remaining_rows = None
+        self.token_masks = {}
+
+        # an empty index has no codes yet; it keeps its quantization for the rows an update adds
+        self.quantization = info['quantization'] if self.rows else "none"
+        self.codes = None
+        if self.quantization != "none":
+            width = code_width(self.quantization, self.dimensions)
+            dtype = np.uint8 if self.quantization == "binary" else np.int8
+            self.codes = np.fromfile(self.directory / "codes.bin", dtype=dtype, count=self.rows * width).reshape(self.rows, width)
+        if self.quantization == "int8":
+            self.code_norms = np.fromfile(self.directory / "code_norms.bin", dtype=np.float32, count=self.rows)
+            self.code_minimum, self.code_scale = np.load(self.directory / "code_range.npy")
+
+    @classmethod
+    def open(cls, directory):
+        if not (Path(directory) / "index.json").exists():
+            return None
+        return cls(directory)
+
+    def __len__(self):
+        # rows of chunks still in the database
+        return self.rows - self.deleted_rows
+
+    def live_rows(self):
+        # the rows not deleted, or None if there are none deleted
+        if self.deleted is None:
+            return None
+        if self.remaining_rows is None:
+            self.remaining_rows = np.flatnonzero(~self.deleted)
+        return self.remaining_rows
+
+    def rows_containing(self, token, whole_start=False, whole_end=False):
+        key = (token, whole_start, whole_end)
+        mask = self.token_masks.get(key)
+        if mask is None:
+            mask = np.zeros(self.rows, dtype=bool)
+            for segment in self.segments:
+                for term_id in segment.matching_terms(token, whole_start, whole_end):
+                    mask[segment.term_rows(term_id)[0]] = True
+            if len(self.token_masks) > 256:
+                self.token_masks.clear()
+            self.token_masks[key] = mask
+        return mask
+
+    def candidate_rows(self, search_term='', document_types=None):
+        '''
+        returns the sorted rows that can match, or None if neither filter narrows the search. rows are a superset of
+        the matches: a chunk containing every word of the search term still has to be checked for the exact phrase.
+        '''
+        mask = None
+
+        if document_types:
+            mask = np.zeros(self.rows, dtype=bool)
+            for segment in self.segments:
+                mask[segment.first_row:segment.first_row + segment.rows] = segment.type_mask(document_types)
+
+        # the search term is matched as a substring, so only the words inside it are known to be whole words
+        search_term = (search_term or '').lower()
+        tokens = {(match.group(), match.start() > 0, match.end() < len(search_term))
+                  for match in TOKEN_PATTERN.finditer(search_term)}
+        for token, whole_start, whole_end in tokens:
+            token_mask = self.rows_containing(token, whole_start, whole_end)
+            mask = token_mask.copy() if mask is None else mask & token_mask
+
+        if mask is None:
+            return None
+        if self.deleted is not None:
+            mask &= ~self.deleted
+        return np.flatnonzero(mask)
+
+    def rank_rows(self, query_vectors, rows, read_vectors):
+        '''
+        exact squared euclidean distances from every query to the given rows, whose vectors read_vectors returns for
+        their chunk ids; returns (chunk ids, distances) per query, nearest first.
+        '''
+        if not len(rows):
+            return [(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.float32)) for _ in range(len(query_vectors))]
+
+        ids = np.asarray(self.ids[rows])
+        vectors = np.asarray(read_vectors(ids), dtype=np.float32)
+        vector_norms = np.einsum('ij,ij->i', vectors, vectors)
+
+        ranked = []
+        for query_vector in np.asarray(query_vectors, dtype=np.float32):
+            distances = vector_norms - 2.0 * (vectors @ query_vector) + float(query_vector @ query_vector)
+            order = np.argsort(distances, kind='stable')
+            ranked.append((ids[order], distances[order]))
+        return ranked
+
+    def bm25(self, query, candidate_rows=None, limit=100, k1=1.2, b=0.75):
+        '''
+        ranks rows by Okapi BM25 over the words of the query, optionally only among candidate_rows; returns
+        (chunk ids, scores) of at most limit matching rows, best first.
+        '''
+        scores = np.zeros(self.rows, dtype=np.float32)
+        for token in set(tokenize(query)):
+            postings = [segment.term_rows(term_id) for segment in self.segments
+                        for term_id in [segment.term_id(token)] if term_id is not None]
+            if not postings:
+                continue
+            rows = np.concatenate([term_rows for term_rows, _ in postings])
+            frequencies = np.concatenate([term_frequencies for _, term_frequencies in postings]).astype(np.float32)
+            # deleted rows still count towards the document frequency until the index is compacted
+            document_frequency = len(rows)
+            idf = math.log(1.0 + (len(self) - document_frequency + 0.5) / (document_frequency + 0.5))
+            length_norm = k1 * (1.0 - b + b * self.lengths[rows] / max(self.average_length, 1e-6))
+            scores[rows] += idf * frequencies * (k1 + 1.0) / (frequencies + length_norm)
+
+        if self.deleted is not None:
+            scores[self.deleted] = 0.0
+        if candidate_rows is not None:
+            restricted = np.zeros_like(scores)
+            restricted[candidate_rows] = scores[candidate_rows]
+            scores = restricted
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return np.asarray(self.ids[matched]), scores[matched]
+
+    def approximate_distances(self, query_vector, rows=None):
+        '''
+        distances from the query to every row (or the given rows) computed from the codes: squared euclidean distance
+        to the reconstructed vector for int8, hamming distance between sign bits for binary.
+        '''
+        codes = self.codes if rows is None else self.codes[rows]
+        distances = np.empty(len(codes), dtype=np.float32)
+
+        if self.quantization == "binary":
+            query_bits = np.packbits(query_vector > 0)
+            for start in range(0, len(codes), BLOCK_ROWS):
+                distances[start:start + BLOCK_ROWS] = POPCOUNT[np.bitwise_xor(codes[start:start + BLOCK_ROWS], query_bits)].sum(axis=1)
+            return distances
+
+        # |q - v|^2 with v = (code + 128) * scale + minimum; |q|^2 is the same for every row and left out
+        scaled_query = query_vector * self.code_scale
+        offset = float(query_vector @ self.code_minimum)
+        code_norms = self.code_norms if rows is None else self.code_norms[rows]
+        for start in range(0, len(codes), BLOCK_ROWS):
+            dots = (codes[start:start + BLOCK_ROWS].astype(np.float32) + 128.0) @ scaled_query + offset
+            distances[start:start + BLOCK_ROWS] = code_norms[start:start + BLOCK_ROWS] - 2.0 * dots
+        return distances
+
+    def search(self, query_vectors, depth, read_vectors, rows=None, rescore=256):
+        '''
+        scans the codes for the max(depth, rescore) best candidates per query and reranks them with exact distances
+        from the float vectors read_vectors returns; returns (chunk ids, distances) per query, nearest first.
+        '''
+        if rows is None:
+            rows = self.live_rows()
+        row_numbers = np.arange(self.rows) if rows is None else np.asarray(rows)
+        candidates = max(int(depth), int(rescore))
+
+        ranked = []
+        for query_vector in np.asarray(query_vectors, dtype=np.float32):
+            distances = self.approximate_distances(query_vector, rows)
+            count = min(candidates, len(distances))
+            if count == 0:
+                ranked.append((np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.float32)))
+                continue
+            best = np.argpartition(distances, count - 1)[:count]
+            ranked.extend(self.rank_rows([query_vector], np.sort(row_numbers[best]), read_vectors))
+        return ranked
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import tiledb
+
+
+class TileDBVectorReader:
+    '''
+    reads the float vectors of given chunk ids straight from the arrays of a TileDB vector index, without loading the
+    index, so filtered and quantized searches can rank their candidates exactly without a second copy of the vectors.
+    only the chunk ids are held in memory; vectors are read as they are asked for.
+
+    both the FLAT and IVF_FLAT indexes keep every vector as one column of the shuffled vectors array, at the same
+    position as its chunk id in the shuffled ids array. the index has to be consolidated, which creating and updating
+    a database always do.
+    '''
+    def __init__(self, index_uri):
+        from tiledb.vector_search.storage_formats import storage_formats
+
+        group = tiledb.Group(str(index_uri), "r")
+        try:
+            array_names = storage_formats[group.meta.get("storage_version", "0.1")]
+            index_version = group.meta.get("index_version", "")
+            self.vectors_uri = group[array_names["PARTS_ARRAY_NAME"] + index_version].uri
+            ids_uri = group[array_names["IDS_ARRAY_NAME"] + index_version].uri
+            base_sizes = json.loads(group.meta.get("base_sizes", "[]"))
+        finally:
+            group.close()
+
+        with tiledb.open(ids_uri) as ids_array:
+            size = int(base_sizes[-1]) if base_sizes else int(ids_array.nonempty_domain()[0][1]) + 1
+            self.ids = np.asarray(ids_array[0:size]["values"], dtype=np.uint64) if size else np.zeros(0, dtype=np.uint64)
+        self.id_order = np.argsort(self.ids, kind='stable')
+        self.sorted_ids = self.ids[self.id_order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def read(self, chunk_ids):
+        # float32 vectors of the given chunk ids in the same order; every id has to be in the index
+        chunk_ids = np.asarray(chunk_ids, dtype=np.uint64)
+        if not len(chunk_ids):
+            return np.zeros((0, 0), dtype=np.float32)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, chunk_ids), max(len(self.ids) - 1, 0))
+        if not len(self.ids) or not np.array_equal(self.sorted_ids[positions], chunk_ids):
+            raise KeyError("Chunk ids not in the vector index.")
+
+        # the columns are read in order, neighbouring columns as one range
+        columns = self.id_order[positions]
+        order = np.argsort(columns, kind='stable')
+        sorted_columns = columns[order]
+        breaks = np.flatnonzero(np.diff(sorted_columns) != 1) + 1
+        starts = np.concatenate(([0], breaks))
+        stops = np.concatenate((breaks, [len(sorted_columns)])) - 1
+        ranges = [slice(int(sorted_columns[start]), int(sorted_columns[stop])) for start, stop in zip(starts, stops)]
+        with tiledb.open(self.vectors_uri) as vectors_array:
+            block = vectors_array.multi_index[:, ranges]["values"]
+
+        vectors = np.empty((len(columns), block.shape[0]), dtype=np.float32)
+        vectors[order] = block.T
+        return vectors
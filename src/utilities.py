@@ -130,6 +130,39 @@ def check_preconditions_for_db_creation(script_dir, database_name):
     return True, ""
 
 
+def check_preconditions_for_db_update(script_dir, database_name, remove_unchosen=False):
+    config_path = script_dir / 'config.yaml'
+    if not config_path.exists():
+        QMessageBox.warning(None, "Configuration Missing", "The configuration file (config.yaml) is missing.")
+        return False, "Configuration file missing."
+
+    with open(config_path, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file)
+
+    # does the database exist
+    if database_name not in (config.get('created_databases') or {}) or not (script_dir / "Vector_DB" / database_name).exists():
+        return False, f"No existing database named '{database_name}' was found."
+
+    # are documents selected
+    documents_dir = script_dir / "Docs_for_DB"
+    if not any(file.is_file() for file in documents_dir.iterdir()):
+        QMessageBox.warning(None, "No Documents", "No documents are yet added to be processed.")
+        return False, "No documents in Docs_for_DB."
+
+    if remove_unchosen:
+        confirmation_message = ("The chosen files will replace the contents of this database. New or changed files are added and "
+                                "EVERY FILE NOT CHOSEN IS DELETED from the database. Click OK to proceed.")
+    else:
+        confirmation_message = ("New or changed files among the chosen files are added to this database, replacing earlier versions of the "
+                                "same files. Files already in the database that are not chosen are kept. Click OK to proceed.")
+    confirmation_reply = QMessageBox.question(None, 'Confirmation', confirmation_message,
+                                             QMessageBox.Ok | QMessageBox.Cancel, QMessageBox.Cancel)
+    if confirmation_reply == QMessageBox.Cancel:
+        return False, "Database update cancelled by user."
+
+    return True, ""
+
+
 # gui.py
 def check_preconditions_for_submit_question(script_dir):
     config_path = script_dir / 'config.yaml'